@@ -0,0 +1,327 @@
+"""Admission control: bounded concurrency per route class and per-user rates.
+
+Every route belongs to a class (``read``, ``write``, ``node`` for routes that
+wait on the Ethereum node, or ``export`` for streamed downloads), and each class
+has its own bulkhead, held until the response is fully sent. A request
+waits for a slot in its class only while the queue is shorter than the class's
+queue size; beyond that, or after waiting ``ADMISSION_QUEUE_TIMEOUT``, it is
+shed with 503 and a ``Retry-After`` derived from the queue depth. A slow node
+therefore fills only the ``node`` bulkhead and leaves reads alone.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS, HTTP_503_SERVICE_UNAVAILABLE
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "5"))
+READ_CONCURRENCY = int(os.environ.get("READ_CONCURRENCY", "32"))
+READ_QUEUE_SIZE = int(os.environ.get("READ_QUEUE_SIZE", "128"))
+WRITE_CONCURRENCY = int(os.environ.get("WRITE_CONCURRENCY", "16"))
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "64"))
+NODE_CONCURRENCY = int(os.environ.get("NODE_CONCURRENCY", "4"))
+NODE_QUEUE_SIZE = int(os.environ.get("NODE_QUEUE_SIZE", "8"))
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", "2"))
+EXPORT_QUEUE_SIZE = int(os.environ.get("EXPORT_QUEUE_SIZE", "2"))
+# Per-user token bucket on single triggers: payments per second and burst.
+TRIGGER_RATE = float(os.environ.get("TRIGGER_RATE", "1"))
+TRIGGER_BURST = int(os.environ.get("TRIGGER_BURST", "20"))
+# Batch triggers have their own bucket, charged once per request whatever its size.
+BATCH_TRIGGER_RATE = float(os.environ.get("BATCH_TRIGGER_RATE", "0.1"))
+BATCH_TRIGGER_BURST = int(os.environ.get("BATCH_TRIGGER_BURST", "5"))
+
+# Routes that call the Ethereum node while holding a request slot.
+NODE_ROUTES = {
+    ("POST", "/payments/rules/trigger"),
+    ("POST", "/foundations"),
+}
+# Long-running streamed downloads, kept from occupying read slots.
+EXPORT_ROUTES = {
+    ("GET", "/payments/history/export"),
+    ("GET", "/admin/payments/history/export"),
+}
+# Served without admission control so they stay observable under overload.
+EXEMPT_ROUTES = {("GET", "/metrics/admission")}
+
+
+class Overloaded(Exception):
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(name)
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wake(self) -> None:
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self.future = self.loop.create_future()
+
+    def wake(self) -> None:
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Bulkhead:
+    """Admits ``limit`` concurrent holders and queues at most ``queue_size`` more.
+
+    Slots are handed to waiters in FIFO order, whether they wait on a thread or
+    on the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        queue_size: int,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_in_flight = 0
+        self._hold_time = 0.1
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(backlog * self._hold_time / max(self.limit, 1)))
+
+    def _try_enter(self, waiter) -> bool:
+        """Takes a free slot, or queues ``waiter``; raises when the queue is full."""
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self._admit()
+                return True
+            if len(self._waiters) >= self.queue_size:
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after())
+            self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter) -> bool:
+        """Drops a waiter that timed out; ``True`` if it got a slot meanwhile."""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                self.rejected += 1
+                return False
+            return True
+
+    def release(self, held_for: float) -> None:
+        with self._lock:
+            self._hold_time += (held_for - self._hold_time) * 0.1
+            if self._waiters:
+                # Hand the slot straight to the next waiter.
+                self.admitted += 1
+                self._waiters.popleft().wake()
+            else:
+                self.in_flight -= 1
+
+    def acquire(self) -> None:
+        waiter = _ThreadWaiter()
+        if self._try_enter(waiter):
+            return
+        if not waiter.event.wait(self.timeout) and not self._abandon(waiter):
+            raise Overloaded(self.name, self.retry_after())
+
+    async def acquire_async(self) -> None:
+        waiter = _AsyncWaiter()
+        if self._try_enter(waiter):
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise Overloaded(self.name, self.retry_after())
+        except asyncio.CancelledError:
+            # The client went away; give back a slot handed over meanwhile.
+            if self._abandon(waiter):
+                self.release(self._hold_time)
+            raise
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "queue_size": self.queue_size,
+                "saturation": round(self.in_flight / max(self.limit, 1), 3),
+                "peak_in_flight": self.peak_in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "hold_time_ms": round(self._hold_time * 1000, 1),
+            }
+
+
+class RateLimiter:
+    """Token bucket per key, keeping at most ``maxsize`` keys."""
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 10000, timer=None):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.timer = timer or time.monotonic
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost: int = 1) -> None:
+        """Spends ``cost`` tokens of ``key``'s bucket or raises ``RateLimited``.
+
+        A cost above the burst could never be paid, so callers must reject such
+        calls up front; ``ValueError`` is raised otherwise.
+        """
+        if cost > self.burst:
+            raise ValueError(f"Cost {cost} exceeds the burst of {self.burst}")
+        now = self.timer()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                self.limited += 1
+                wait = (cost - tokens) / self.rate if self.rate > 0 else 3600
+                raise RateLimited(max(1, math.ceil(wait)))
+            self._buckets[key] = (tokens - cost, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+    def snapshot(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tracked_keys": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+bulkheads: Dict[str, Bulkhead] = {
+    "read": Bulkhead("read", READ_CONCURRENCY, READ_QUEUE_SIZE),
+    "write": Bulkhead("write", WRITE_CONCURRENCY, WRITE_QUEUE_SIZE),
+    "node": Bulkhead("node", NODE_CONCURRENCY, NODE_QUEUE_SIZE),
+    "export": Bulkhead("export", EXPORT_CONCURRENCY, EXPORT_QUEUE_SIZE),
+}
+
+trigger_limiter = RateLimiter(TRIGGER_RATE, TRIGGER_BURST)
+batch_trigger_limiter = RateLimiter(BATCH_TRIGGER_RATE, BATCH_TRIGGER_BURST)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if (method, path) in EXEMPT_ROUTES:
+        return None
+    if (method, path) in NODE_ROUTES:
+        return "node"
+    if (method, path) in EXPORT_ROUTES:
+        return "export"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+def _route_path(scope: Scope) -> str:
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return scope["path"]
+
+
+def overloaded_response(exc: Overloaded) -> Response:
+    return JSONResponse(
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"Too many concurrent {exc.name} requests, try again later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def rate_limited_response(exc: RateLimited) -> Response:
+    return JSONResponse(
+        status_code=HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many payments triggered, try again later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+class AdmissionMiddleware:
+    """Holds a slot of the request's route class until its response is sent."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], _route_path(scope))
+        if not ADMISSION_ENABLED or name is None:
+            await self.app(scope, receive, send)
+            return
+        bulkhead = bulkheads[name]
+        try:
+            await bulkhead.acquire_async()
+        except Overloaded as exc:
+            await overloaded_response(exc)(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release(time.monotonic() - started)
+
+
+def metrics() -> dict:
+    return {
+        "bulkheads": {
+            name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()
+        },
+        "trigger_rate_limit": trigger_limiter.snapshot(),
+        "batch_trigger_rate_limit": batch_trigger_limiter.snapshot(),
+    }
@@ -0,0 +1,376 @@
+"""Native asyncio counterpart of ``api.crud`` on a ``databases.Database``.
+
+Functions keep the names and signatures of their ``api.crud`` twins and
+return unattached model instances, so endpoints can await either layer.
+"""
+import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, select
+from sqlalchemy.orm.session import make_transient_to_detached
+from starlette.concurrency import run_in_threadpool
+from starlette.status import HTTP_404_NOT_FOUND
+
+from api import crud, model, schema, signing
+from api.cache import (
+    FOUNDATIONS_CHANNEL,
+    SIGNER_CHANNEL,
+    TOKEN_CHANNEL,
+    foundations_cache,
+    invalidation_listener,
+    publish_invalidation_async,
+    token_cache,
+)
+from api.security import (
+    MAX_ACTIVE_TOKENS,
+    create_access_token,
+    hash_password,
+    token_expired,
+    token_issued_after,
+    verify_and_update_password,
+)
+
+users = model.User.__table__
+user_tokens = model.UserToken.__table__
+payment_methods = model.PaymentMethod.__table__
+foundations = model.Foundation.__table__
+payment_rules = model.PaymentRule.__table__
+payment_history = model.Payment.__table__
+
+
+class Threaded:
+    """Exposes the blocking functions of ``module`` as coroutines that run on
+    the threadpool, so the sync layer can stand in for this one."""
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name: str):
+        function = getattr(self._module, name)
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(function, *args, **kwargs)
+
+        return call
+
+
+def _entity(model_class, row):
+    return model_class(**dict(row))
+
+
+def _tuples(rows) -> list:
+    return [tuple(row.values()) for row in rows]
+
+
+async def _insert(database, model_class, **values):
+    values["id"] = await database.execute(
+        model_class.__table__.insert().values(**values)
+    )
+    return model_class(**values)
+
+
+async def poll_invalidations(database) -> None:
+    await invalidation_listener.poll_async(database)
+
+
+async def get_user_by_name(database, name: str) -> Optional[model.User]:
+    row = await database.fetch_one(select([users]).where(users.c.name == name))
+    return _entity(model.User, row) if row else None
+
+
+async def create_user(database, user: schema.RequestUser) -> Optional[model.User]:
+    if await get_user_by_name(database, user.name):
+        return None
+    hashed_password = await run_in_threadpool(hash_password, user.password)
+    return await _insert(
+        database, model.User, name=user.name, hashed_password=hashed_password
+    )
+
+
+async def create_user_token(database, user_id: int) -> model.UserToken:
+    async with database.transaction():
+        user_token = await _insert(
+            database,
+            model.UserToken,
+            user_id=user_id,
+            token=create_access_token(),
+            created_at=datetime.datetime.utcnow(),
+            is_active=True,
+        )
+        surplus = _tuples(
+            await database.fetch_all(
+                select([user_tokens.c.id, user_tokens.c.token])
+                .where(user_tokens.c.user_id == user_id)
+                .where(user_tokens.c.is_active.is_(True))
+                .order_by(user_tokens.c.id.desc())
+                .offset(MAX_ACTIVE_TOKENS)
+            )
+        )
+        if surplus:
+            await database.execute(
+                user_tokens.update()
+                .where(user_tokens.c.id.in_([token_id for token_id, _ in surplus]))
+                .values(is_active=False)
+            )
+            for _, token in surplus:
+                await publish_invalidation_async(database, TOKEN_CHANNEL, token)
+    for _, token in surplus:
+        token_cache.invalidate(token)
+    return user_token
+
+
+async def deactivate_user_token(database, token: str) -> bool:
+    async with database.transaction():
+        token_id = await database.fetch_val(
+            select([user_tokens.c.id]).where(user_tokens.c.token == token)
+        )
+        if token_id is not None:
+            await database.execute(
+                user_tokens.update()
+                .where(user_tokens.c.id == token_id)
+                .values(is_active=False)
+            )
+            await publish_invalidation_async(database, TOKEN_CHANNEL, token)
+    token_cache.invalidate(token)
+    return True
+
+
+async def get_user_by_token(database, token: str) -> Optional[model.User]:
+    await invalidation_listener.poll_async(database)
+    cached = token_cache.get(token)
+    if cached is not None:
+        cached_user, created_at = cached
+        if token_expired(created_at):
+            token_cache.invalidate(token)
+            return None
+        return cached_user
+    query = (
+        select([users, user_tokens.c.created_at.label("token_created_at")])
+        .select_from(user_tokens.join(users))
+        .where(user_tokens.c.token == token)
+        .where(user_tokens.c.is_active.is_(True))
+    )
+    issued_after = token_issued_after()
+    if issued_after is not None:
+        query = query.where(user_tokens.c.created_at >= issued_after)
+    row = await database.fetch_one(query)
+    if row is None:
+        return None
+    values = dict(row)
+    created_at = values.pop("token_created_at")
+    user = model.User(**values)
+    make_transient_to_detached(user)
+    token_cache.set(token, (user, created_at))
+    return user
+
+
+async def authenticate_user(database, name: str, password: str) -> Optional[model.User]:
+    user = await get_user_by_name(database, name)
+    if not user:
+        return None
+    verified, new_hash = await run_in_threadpool(
+        verify_and_update_password, password, user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hash:
+        await database.execute(
+            users.update().where(users.c.id == user.id).values(hashed_password=new_hash)
+        )
+        user.hashed_password = new_hash
+    return user
+
+
+async def get_payment_methods(database, user_id: int) -> List[model.PaymentMethod]:
+    rows = await database.fetch_all(
+        select([payment_methods]).where(payment_methods.c.user_id == user_id)
+    )
+    return [_entity(model.PaymentMethod, row) for row in rows]
+
+
+async def create_payment_method(
+    database,
+    user_id: int,
+    payment_method: schema.RequestPaymentMethod,
+    address: str,
+) -> model.PaymentMethod:
+    return await _insert(
+        database,
+        model.PaymentMethod,
+        user_id=user_id,
+        private_key=payment_method.private_key,
+        type=payment_method.type,
+        address=address,
+    )
+
+
+async def get_payment_method(
+    database, payment_method_id: int, user_id: int
+) -> Optional[model.PaymentMethod]:
+    row = await database.fetch_one(
+        select([payment_methods])
+        .where(payment_methods.c.id == payment_method_id)
+        .where(payment_methods.c.user_id == user_id)
+    )
+    return _entity(model.PaymentMethod, row) if row else None
+
+
+async def delete_payment_method(database, payment_method_id: int, user_id: int) -> bool:
+    if not await get_payment_method(database, payment_method_id, user_id):
+        return False
+    async with database.transaction():
+        await database.execute(
+            payment_methods.delete().where(payment_methods.c.id == payment_method_id)
+        )
+        await publish_invalidation_async(
+            database, SIGNER_CHANNEL, str(payment_method_id)
+        )
+    signing.signing_pool.evict(payment_method_id)
+    return True
+
+
+def _user_payment_rules(user_id: int):
+    return (
+        select([payment_rules])
+        .select_from(payment_rules.join(payment_methods))
+        .where(payment_methods.c.user_id == user_id)
+    )
+
+
+async def get_payment_rules(
+    database, user_id: int, columns: Optional[list] = None
+) -> List[model.PaymentRule]:
+    query = _user_payment_rules(user_id)
+    if columns is not None:
+        query = query.with_only_columns(columns)
+    rows = await database.fetch_all(query)
+    if columns is not None:
+        return _tuples(rows)
+    return [_entity(model.PaymentRule, row) for row in rows]
+
+
+async def create_payment_rule(
+    database, payment_rule: schema.RequestPaymentRule, user_id: int
+) -> model.PaymentRule:
+    foundation_id = await database.fetch_val(
+        select([foundations.c.id]).where(foundations.c.id == payment_rule.foundation_id)
+    )
+    if foundation_id is None:
+        raise HTTPException(
+            status_code=HTTP_404_NOT_FOUND, detail="Foundation not found"
+        )
+    if not await get_payment_method(database, payment_rule.payment_method_id, user_id):
+        raise HTTPException(
+            status_code=HTTP_404_NOT_FOUND, detail="Payment method not found"
+        )
+    values = payment_rule.dict()
+    values["next_run_at"] = None
+    if payment_rule.interval_seconds:
+        values["next_run_at"] = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=payment_rule.interval_seconds
+        )
+    return await _insert(database, model.PaymentRule, **values)
+
+
+async def get_payment_rule(
+    database, payment_rule_id: int, user_id: int
+) -> Optional[model.PaymentRule]:
+    row = await database.fetch_one(
+        _user_payment_rules(user_id).where(payment_rules.c.id == payment_rule_id)
+    )
+    return _entity(model.PaymentRule, row) if row else None
+
+
+async def delete_payment_rule(database, payment_rule_id: int, user_id: int) -> bool:
+    if not await get_payment_rule(database, payment_rule_id, user_id):
+        return False
+    await database.execute(
+        payment_rules.delete().where(payment_rules.c.id == payment_rule_id)
+    )
+    return True
+
+
+async def enqueue_payment(database, payment_rule_id: int) -> model.Payment:
+    now = datetime.datetime.utcnow()
+    return await _insert(
+        database,
+        model.Payment,
+        payment_rule_id=payment_rule_id,
+        status=schema.PaymentStatus.PENDING.value,
+        attempts=0,
+        created_at=now,
+        next_attempt_at=now,
+    )
+
+
+async def get_payments(
+    database,
+    user_id: int,
+    limit: Optional[int] = None,
+    columns: Optional[list] = None,
+    **filters,
+) -> List[model.Payment]:
+    query = (
+        select(columns or [payment_history])
+        .select_from(payment_history.join(payment_rules).join(payment_methods))
+        .where(and_(*crud.payment_filters(user_id, **filters)))
+        .order_by(payment_history.c.created_at.desc(), payment_history.c.id.desc())
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    rows = await database.fetch_all(query)
+    if columns is not None:
+        return _tuples(rows)
+    return [_entity(model.Payment, row) for row in rows]
+
+
+async def get_user_stats(database, user_id: int) -> Optional[model.UserDonationStats]:
+    table = model.UserDonationStats.__table__
+    row = await database.fetch_one(select([table]).where(table.c.user_id == user_id))
+    return _entity(model.UserDonationStats, row) if row else None
+
+
+async def get_foundation_stats(
+    database, foundation_id: int
+) -> Optional[model.FoundationDonationStats]:
+    table = model.FoundationDonationStats.__table__
+    row = await database.fetch_one(
+        select([table]).where(table.c.foundation_id == foundation_id)
+    )
+    return _entity(model.FoundationDonationStats, row) if row else None
+
+
+async def get_foundation(database, foundation_id: int) -> Optional[model.Foundation]:
+    row = await database.fetch_one(
+        select([foundations]).where(foundations.c.id == foundation_id)
+    )
+    return _entity(model.Foundation, row) if row else None
+
+
+async def get_foundations(
+    database,
+    limit: Optional[int] = None,
+    after_id: Optional[int] = None,
+    columns: Optional[list] = None,
+) -> List[model.Foundation]:
+    query = select(columns or [foundations])
+    if after_id is not None:
+        query = query.where(foundations.c.id > after_id)
+    query = query.order_by(foundations.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    rows = await database.fetch_all(query)
+    if columns is not None:
+        return _tuples(rows)
+    return [_entity(model.Foundation, row) for row in rows]
+
+
+async def create_foundation(
+    database, foundation: schema.RequestFoundation
+) -> model.Foundation:
+    async with database.transaction():
+        foundation_rcd = await _insert(database, model.Foundation, **foundation.dict())
+        await publish_invalidation_async(database, FOUNDATIONS_CHANNEL, "")
+    foundations_cache.bump()
+    return foundation_rcd
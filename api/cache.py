@@ -0,0 +1,236 @@
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from api import model
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "60"))
+CACHE_INVALIDATION_POLL_INTERVAL = float(
+    os.environ.get("CACHE_INVALIDATION_POLL_INTERVAL", "1")
+)
+FOUNDATIONS_CACHE_TTL = float(os.environ.get("FOUNDATIONS_CACHE_TTL", "300"))
+# How long an id skipped by the poll may still show up from a slow transaction.
+CACHE_INVALIDATION_GAP_TIMEOUT = float(
+    os.environ.get("CACHE_INVALIDATION_GAP_TIMEOUT", "300")
+)
+
+TOKEN_CHANNEL = "user_tokens"
+FOUNDATIONS_CHANNEL = "foundations"
+SIGNER_CHANNEL = "signers"
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after insertion."""
+
+    def __init__(
+        self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] <= self.timer():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._store(key, value)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (value, self.timer() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class VersionedCache(TTLCache):
+    """``TTLCache`` whose whole content belongs to one ``version``.
+
+    ``bump`` moves to a new version and drops every entry. Readers note the
+    version before computing a value and store it with ``set_if_version``, so
+    a value computed from data that changed meanwhile is never cached.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def bump(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def set_if_version(self, key: Hashable, value: Any, version: int) -> bool:
+        with self._lock:
+            if version != self.version:
+                return False
+            self._store(key, value)
+            return True
+
+
+class InvalidationListener:
+    """Replays rows from ``cache_invalidations`` so every worker drops stale entries.
+
+    Each process polls the table at most once per ``interval`` seconds and
+    hands new keys to the handler subscribed to their channel.
+
+    Ids are allocated when a row is inserted but become visible when its
+    transaction commits, so a lower id can appear after a higher one was read.
+    Ids skipped on the way up are therefore polled again for ``gap_timeout``
+    seconds, keeping at most ``max_gaps`` of them.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        timer: Callable[[], float] = time.monotonic,
+        gap_timeout: float = CACHE_INVALIDATION_GAP_TIMEOUT,
+        max_gaps: int = 1000,
+    ):
+        self.interval = interval
+        self.timer = timer
+        self.gap_timeout = gap_timeout
+        self.max_gaps = max_gaps
+        self._handlers = {}
+        self._last_id = None
+        # Skipped id -> when to stop waiting for it, oldest first.
+        self._gaps = OrderedDict()
+        self._next_poll_at = 0.0
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        self._handlers[channel] = handler
+
+    def poll(self, db: Session) -> None:
+        if not self._begin_poll():
+            return
+        try:
+            if self._last_id is None:
+                # Nothing is cached before the first poll, so skip the backlog.
+                self._last_id = db.execute(self._latest_query()).scalar() or 0
+                return
+            self._replay(db.execute(self._events_query()))
+        finally:
+            self._lock.release()
+
+    async def poll_async(self, database) -> None:
+        """``poll`` for a ``databases.Database``."""
+        if not self._begin_poll():
+            return
+        try:
+            if self._last_id is None:
+                self._last_id = await database.fetch_val(self._latest_query()) or 0
+                return
+            self._replay(await database.fetch_all(self._events_query()))
+        finally:
+            self._lock.release()
+
+    def due(self) -> bool:
+        """Whether ``poll`` would query the table now."""
+        return self.timer() >= self._next_poll_at
+
+    def _begin_poll(self) -> bool:
+        if not self.due():
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._next_poll_at = self.timer() + self.interval
+        return True
+
+    def _latest_query(self):
+        return select([func.max(model.CacheInvalidation.id)])
+
+    def _events_query(self):
+        columns = [
+            model.CacheInvalidation.id,
+            model.CacheInvalidation.channel,
+            model.CacheInvalidation.key,
+        ]
+        query = select(columns).where(model.CacheInvalidation.id > self._last_id)
+        if not self._gaps:
+            return query.order_by(model.CacheInvalidation.id)
+        # A UNION rather than OR keeps both halves on the primary key.
+        gaps = select(columns).where(model.CacheInvalidation.id.in_(list(self._gaps)))
+        return union_all(query, gaps).order_by("id")
+
+    def _replay(self, events) -> None:
+        now = self.timer()
+        for event in events:
+            if self._gaps.pop(event["id"], None) is None:
+                if event["id"] <= self._last_id:
+                    continue
+                deadline = now + self.gap_timeout
+                for skipped in range(
+                    max(self._last_id + 1, event["id"] - self.max_gaps), event["id"]
+                ):
+                    self._gaps[skipped] = deadline
+                self._last_id = event["id"]
+            handler = self._handlers.get(event["channel"])
+            if handler is not None:
+                handler(event["key"])
+        while self._gaps and (
+            len(self._gaps) > self.max_gaps or next(iter(self._gaps.values())) <= now
+        ):
+            self._gaps.popitem(last=False)
+
+
+def publish_invalidation(db: Session, channel: str, key: str) -> None:
+    """Queue an invalidation; it reaches other workers once ``db`` commits."""
+    db.add(model.CacheInvalidation(channel=channel, key=key))
+
+
+async def publish_invalidation_async(database, channel: str, key: str) -> None:
+    """``publish_invalidation`` for a ``databases.Database`` transaction."""
+    await database.execute(
+        model.CacheInvalidation.__table__.insert().values(
+            channel=channel, key=key, created_at=datetime.datetime.utcnow()
+        )
+    )
+
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+# Pre-serialized ``GET /foundations`` pages keyed by ``(limit, cursor)``.
+foundations_cache = VersionedCache(maxsize=256, ttl=FOUNDATIONS_CACHE_TTL)
+
+invalidation_listener = InvalidationListener(interval=CACHE_INVALIDATION_POLL_INTERVAL)
+invalidation_listener.subscribe(TOKEN_CHANNEL, token_cache.invalidate)
+invalidation_listener.subscribe(FOUNDATIONS_CHANNEL, foundations_cache.bump)
@@ -0,0 +1,54 @@
+import datetime
+import logging
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+from api import crud
+from api.security import token_issued_after
+from api.worker import PollingPool
+
+logger = logging.getLogger(__name__)
+
+COMPACTOR_ENABLED = os.environ.get("COMPACTOR_ENABLED", "1") == "1"
+COMPACTOR_POLL_INTERVAL = float(os.environ.get("COMPACTOR_POLL_INTERVAL", "300"))
+COMPACTOR_BATCH = int(os.environ.get("COMPACTOR_BATCH", "500"))
+# Must exceed the token and foundations cache TTLs, or a worker that was idle
+# longer could miss invalidations for entries it still holds.
+CACHE_INVALIDATION_RETENTION = float(
+    os.environ.get("CACHE_INVALIDATION_RETENTION", "3600")
+)
+
+
+def run_once(db: Session, limit: int = COMPACTOR_BATCH) -> int:
+    """Deletes one batch of expired or logged-out tokens and one batch of old
+    cache invalidations, returning how many rows went.
+
+    Each batch commits on its own so no lock is held for long; the pool calls
+    again straight away while there is more to delete.
+    """
+    deleted = crud.delete_stale_tokens(db, token_issued_after(), limit)
+    created_before = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=CACHE_INVALIDATION_RETENTION
+    )
+    deleted += crud.delete_old_invalidations(db, created_before, limit)
+    return deleted
+
+
+compactor = PollingPool(
+    "token-compactor",
+    run_once,
+    size=1 if COMPACTOR_ENABLED else 0,
+    poll_interval=COMPACTOR_POLL_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    compactor.size = 1
+    compactor.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        compactor.stop()
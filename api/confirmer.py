@@ -0,0 +1,88 @@
+import datetime
+import logging
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+from api import crud, payment
+from api.worker import PollingPool
+
+logger = logging.getLogger(__name__)
+
+CONFIRMER_ENABLED = os.environ.get("CONFIRMER_ENABLED", "1") == "1"
+CONFIRMER_POLL_INTERVAL = float(os.environ.get("CONFIRMER_POLL_INTERVAL", "5"))
+CONFIRMER_BATCH = int(os.environ.get("CONFIRMER_BATCH", "500"))
+# Receipt checks back off to BACKOFF x the transaction's age, within these bounds.
+CONFIRMER_MIN_INTERVAL = float(os.environ.get("CONFIRMER_MIN_INTERVAL", "5"))
+CONFIRMER_MAX_INTERVAL = float(os.environ.get("CONFIRMER_MAX_INTERVAL", "600"))
+CONFIRMER_BACKOFF = float(os.environ.get("CONFIRMER_BACKOFF", "0.25"))
+
+
+def next_check_delay(age_seconds: float) -> float:
+    """Seconds to wait before asking again for a receipt that is still missing."""
+    return min(
+        CONFIRMER_MAX_INTERVAL,
+        max(CONFIRMER_MIN_INTERVAL, age_seconds * CONFIRMER_BACKOFF),
+    )
+
+
+def run_once(db: Session, client, limit: int = CONFIRMER_BATCH) -> int:
+    """Looks up receipts for one batch of due payments with a single
+    ``eth_getTransactionReceipt`` batch, returning how many were checked."""
+    pending = crud.get_unconfirmed_payments(db, limit)
+    if not pending:
+        return 0
+    responses = payment.batch_request(
+        client,
+        "eth_getTransactionReceipt",
+        [[transaction_hash] for _, transaction_hash, _ in pending],
+    )
+    now = datetime.datetime.utcnow()
+    updates = []
+    for (payment_id, transaction_hash, created_at), response in zip(pending, responses):
+        receipt = response.get("result")
+        if receipt:
+            block_number, gas_used, status = payment.parse_receipt(receipt)
+            updates.append(
+                {
+                    "id": payment_id,
+                    "block_number": block_number,
+                    "gas_used": gas_used,
+                    "receipt_status": status,
+                    "confirmed_at": now,
+                    "next_receipt_check_at": None,
+                }
+            )
+            continue
+        if "error" in response:
+            logger.warning(
+                "Receipt lookup for %s failed: %s", transaction_hash, response["error"]
+            )
+        delay = next_check_delay((now - created_at).total_seconds())
+        updates.append(
+            {
+                "id": payment_id,
+                "next_receipt_check_at": now + datetime.timedelta(seconds=delay),
+            }
+        )
+    crud.record_receipts(db, updates)
+    return len(pending)
+
+
+confirmer = PollingPool(
+    "receipt-confirmer",
+    lambda db: run_once(db, payment.eth_client),
+    size=1 if CONFIRMER_ENABLED else 0,
+    poll_interval=CONFIRMER_POLL_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    confirmer.size = 1
+    confirmer.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        confirmer.stop()
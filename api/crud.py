@@ -1,11 +1,35 @@
-from typing import List, Optional
+import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, bindparam, case, func, or_, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, contains_eager, joinedload
+from sqlalchemy.orm.session import make_transient_to_detached
 from starlette.status import HTTP_404_NOT_FOUND
 
-from api import model, schema
-from api.security import create_access_token, hash_password, verify_password
+from api import model, schema, signing
+from api.cache import (
+    FOUNDATIONS_CHANNEL,
+    SIGNER_CHANNEL,
+    TOKEN_CHANNEL,
+    foundations_cache,
+    invalidation_listener,
+    publish_invalidation,
+    token_cache,
+)
+from api.security import (
+    MAX_ACTIVE_TOKENS,
+    create_access_token,
+    hash_password,
+    token_expired,
+    verify_and_update_password,
+)
+
+
+def poll_invalidations(db: Session) -> None:
+    invalidation_listener.poll(db)
 
 
 def get_user_by_name(db: Session, name: str) -> model.User:
@@ -27,25 +51,136 @@ def create_user_token(db: Session, user_id: int) -> model.UserToken:
     token = create_access_token()
     user_token_rcd = model.UserToken(user_id=user_id, token=token)
     db.add(user_token_rcd)
+    db.flush()
+    retired = _retire_surplus_tokens(db, user_id)
     db.commit()
+    for retired_token in retired:
+        token_cache.invalidate(retired_token)
     db.refresh(user_token_rcd)
     return user_token_rcd
 
 
+def _retire_surplus_tokens(db: Session, user_id: int) -> List[str]:
+    """Deactivates all but the newest ``MAX_ACTIVE_TOKENS`` active tokens."""
+    surplus = (
+        db.query(model.UserToken.id, model.UserToken.token)
+        .filter(model.UserToken.user_id == user_id, model.UserToken.is_active.is_(True))
+        .order_by(model.UserToken.id.desc())
+        .offset(MAX_ACTIVE_TOKENS)
+        .all()
+    )
+    if not surplus:
+        return []
+    db.query(model.UserToken).filter(
+        model.UserToken.id.in_([token_id for token_id, _ in surplus])
+    ).update({"is_active": False}, synchronize_session=False)
+    for _, token in surplus:
+        publish_invalidation(db, TOKEN_CHANNEL, token)
+    return [token for _, token in surplus]
+
+
 def deactivate_user_token(db: Session, token: str) -> bool:
-    token = db.query(model.UserToken).filter(model.UserToken.token == token).first()
-    if token:
-        token.is_active = False
+    token_rcd = (
+        db.query(model.UserToken).filter(model.UserToken.token == token).first()
+    )
+    if token_rcd:
+        token_rcd.is_active = False
+        publish_invalidation(db, TOKEN_CHANNEL, token)
         db.commit()
+    token_cache.invalidate(token)
     return True
 
 
+def delete_stale_tokens(
+    db: Session, issued_before: Optional[datetime.datetime], limit: int
+) -> int:
+    """Deletes up to ``limit`` tokens that were logged out or issued before
+    ``issued_before``, oldest first, returning how many were deleted.
+
+    Logged-out and expired active tokens are looked up separately so both
+    queries stay on ``ix_user_tokens_is_active_created_at``.
+    """
+    oldest_first = (model.UserToken.created_at, model.UserToken.id)
+    token_ids = [
+        token_id
+        for token_id, in db.query(model.UserToken.id)
+        .filter(model.UserToken.is_active.is_(False))
+        .order_by(*oldest_first)
+        .limit(limit)
+    ]
+    if issued_before is not None and len(token_ids) < limit:
+        token_ids += [
+            token_id
+            for token_id, in db.query(model.UserToken.id)
+            .filter(
+                model.UserToken.is_active.is_(True),
+                model.UserToken.created_at < issued_before,
+            )
+            .order_by(*oldest_first)
+            .limit(limit - len(token_ids))
+        ]
+    if token_ids:
+        db.query(model.UserToken).filter(model.UserToken.id.in_(token_ids)).delete(
+            synchronize_session=False
+        )
+    db.commit()
+    return len(token_ids)
+
+
+def delete_old_invalidations(
+    db: Session, created_before: datetime.datetime, limit: int
+) -> int:
+    """Deletes up to ``limit`` of the oldest invalidations created before
+    ``created_before``, returning how many were deleted."""
+    invalidation_ids = [
+        invalidation_id
+        for invalidation_id, in db.query(model.CacheInvalidation.id)
+        .filter(model.CacheInvalidation.created_at < created_before)
+        .order_by(model.CacheInvalidation.id)
+        .limit(limit)
+    ]
+    if invalidation_ids:
+        db.query(model.CacheInvalidation).filter(
+            model.CacheInvalidation.id.in_(invalidation_ids)
+        ).delete(synchronize_session=False)
+    db.commit()
+    return len(invalidation_ids)
+
+
+def _detached_user(user: model.User) -> model.User:
+    # A session-independent copy that any request can merge without a SELECT.
+    user_copy = model.User(
+        id=user.id,
+        name=user.name,
+        hashed_password=user.hashed_password,
+        is_admin=user.is_admin,
+    )
+    make_transient_to_detached(user_copy)
+    return user_copy
+
+
 def get_user_by_token(db: Session, token: str) -> Optional[model.User]:
+    invalidation_listener.poll(db)
+    cached = token_cache.get(token)
+    if cached is not None:
+        cached_user, created_at = cached
+        if token_expired(created_at):
+            token_cache.invalidate(token)
+            return None
+        return db.merge(cached_user, load=False)
     user_token_rcd = (
-        db.query(model.UserToken).filter(model.UserToken.token == token).first()
+        db.query(model.UserToken)
+        .options(joinedload(model.UserToken.user))
+        .filter(model.UserToken.token == token)
+        .first()
     )
     if user_token_rcd is None or not user_token_rcd.is_active:
         return None
+    if token_expired(user_token_rcd.created_at):
+        return None
+    token_cache.set(
+        token, (_detached_user(user_token_rcd.user), user_token_rcd.created_at)
+    )
     return user_token_rcd.user
 
 
@@ -53,8 +188,14 @@ def authenticate_user(db, name: str, password: str) -> Optional[model.User]:
     user_rcd = get_user_by_name(db, name)
     if not user_rcd:
         return None
-    if not verify_password(password, user_rcd.hashed_password):
+    verified, new_hash = verify_and_update_password(
+        password, user_rcd.hashed_password
+    )
+    if not verified:
         return None
+    if new_hash:
+        user_rcd.hashed_password = new_hash
+        db.commit()
     return user_rcd
 
 
@@ -67,12 +208,16 @@ def get_payment_methods(db: Session, user_id: int) -> List[model.PaymentMethod]:
 
 
 def create_payment_method(
-    db: Session, user_id: int, payment_method: schema.RequestPaymentMethod
+    db: Session,
+    user_id: int,
+    payment_method: schema.RequestPaymentMethod,
+    address: str,
 ) -> model.PaymentMethod:
     payment_method_rcd = model.PaymentMethod(
         user_id=user_id,
         private_key=payment_method.private_key,
         type=payment_method.type,
+        address=address,
     )
     db.add(payment_method_rcd)
     db.commit()
@@ -94,17 +239,24 @@ def delete_payment_method(db: Session, payment_method_id: int, user_id: int) ->
     if not payment_method:
         return False
     db.delete(payment_method)
+    publish_invalidation(db, SIGNER_CHANNEL, str(payment_method_id))
     db.commit()
+    signing.signing_pool.evict(payment_method_id)
     return True
 
 
-def get_payment_rules(db: Session, user_id: int) -> List[model.PaymentRule]:
-    return (
+def get_payment_rules(
+    db: Session, user_id: int, columns: Optional[list] = None
+) -> List[model.PaymentRule]:
+    """Rules of ``user_id``; tuples of ``columns`` instead of entities if given."""
+    query = (
         db.query(model.PaymentRule)
-        .join(model.PaymentRule.payment_method, model.PaymentMethod.user)
-        .filter(model.User.id == user_id)
-        .all()
+        .join(model.PaymentRule.payment_method)
+        .filter(model.PaymentMethod.user_id == user_id)
     )
+    if columns is not None:
+        query = query.with_entities(*columns)
+    return query.all()
 
 
 def create_payment_rule(
@@ -127,20 +279,40 @@ def create_payment_rule(
             detail='Payment method not found'
         )
     payment_rule_rcd = model.PaymentRule(**payment_rule.dict())
+    if payment_rule.interval_seconds:
+        payment_rule_rcd.next_run_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=payment_rule.interval_seconds
+        )
     db.add(payment_rule_rcd)
     db.commit()
     db.refresh(payment_rule_rcd)
     return payment_rule_rcd
 
 
+def get_payment_rules_by_ids(
+    db: Session, payment_rule_ids: List[int], user_id: int
+) -> List[model.PaymentRule]:
+    return (
+        db.query(model.PaymentRule)
+        .join(model.PaymentRule.payment_method)
+        .options(
+            contains_eager(model.PaymentRule.payment_method),
+            joinedload(model.PaymentRule.foundation),
+        )
+        .filter(model.PaymentRule.id.in_(payment_rule_ids))
+        .filter(model.PaymentMethod.user_id == user_id)
+        .all()
+    )
+
+
 def get_payment_rule(
     db: Session, payment_rule_id: int, user_id: int
 ) -> model.PaymentRule:
     return (
         db.query(model.PaymentRule)
-        .join(model.PaymentRule.payment_method, model.PaymentMethod.user,)
+        .join(model.PaymentRule.payment_method)
         .filter(model.PaymentRule.id == payment_rule_id)
-        .filter(model.User.id == user_id)
+        .filter(model.PaymentMethod.user_id == user_id)
         .first()
     )
 
@@ -154,11 +326,334 @@ def delete_payment_rule(db: Session, payment_rule_id: int, user_id: int) -> bool
     return True
 
 
+def _insert_ignore(db: Session, table):
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return table.insert().prefix_with("OR IGNORE")
+
+
+def _increment_stats(db: Session, stats_model, increments: List[dict]) -> None:
+    table = stats_model.__table__
+    (key,) = table.primary_key.columns
+    db.execute(
+        _insert_ignore(db, table),
+        [{key.name: increment["key_id"]} for increment in increments],
+    )
+    last_payment_at = table.c.last_payment_at
+    db.execute(
+        table.update()
+        .where(key == bindparam("key_id"))
+        .values(
+            total_amount=table.c.total_amount
+            + bindparam("amount", type_=table.c.total_amount.type),
+            payment_count=table.c.payment_count + bindparam("count"),
+            last_payment_at=case(
+                [
+                    (
+                        or_(
+                            last_payment_at.is_(None),
+                            last_payment_at < bindparam("at"),
+                        ),
+                        bindparam("at"),
+                    )
+                ],
+                else_=last_payment_at,
+            ),
+        ),
+        increments,
+    )
+
+
+def add_donations(db: Session, payments: List[Tuple[int, datetime.datetime]]) -> None:
+    """Adds sent payments, given as ``(payment_rule_id, created_at)``, to the
+    donation totals of their users and foundations.
+
+    Runs in the caller's transaction. Rows are created with an insert that
+    ignores conflicts and then bumped with relative UPDATEs, so concurrent
+    writers never lose an increment.
+    """
+    rules = {
+        payment_rule_id: (amount, foundation_id, user_id)
+        for payment_rule_id, amount, foundation_id, user_id in db.query(
+            model.PaymentRule.id,
+            model.PaymentRule.amount,
+            model.PaymentRule.foundation_id,
+            model.PaymentMethod.user_id,
+        )
+        .join(model.PaymentRule.payment_method)
+        .filter(model.PaymentRule.id.in_({rule_id for rule_id, _ in payments}))
+    }
+    totals = {model.UserDonationStats: {}, model.FoundationDonationStats: {}}
+    for payment_rule_id, created_at in payments:
+        if payment_rule_id not in rules:
+            continue
+        amount, foundation_id, user_id = rules[payment_rule_id]
+        for stats_model, key_id in (
+            (model.UserDonationStats, user_id),
+            (model.FoundationDonationStats, foundation_id),
+        ):
+            total = totals[stats_model].setdefault(
+                key_id, {"key_id": key_id, "amount": 0, "count": 0, "at": created_at}
+            )
+            total["amount"] += amount
+            total["count"] += 1
+            total["at"] = max(total["at"], created_at)
+    for stats_model, increments in totals.items():
+        if increments:
+            _increment_stats(db, stats_model, list(increments.values()))
+
+
+def rebuild_donation_stats(db: Session) -> None:
+    """Recomputes every donation total from ``payment_history``.
+
+    Payments sent while this runs may be counted twice or not at all, so stop
+    the workers first.
+    """
+    sent = model.Payment.status == schema.PaymentStatus.SENT.value
+    joined = model.Payment.__table__.join(model.PaymentRule.__table__).join(
+        model.PaymentMethod.__table__
+    )
+    for stats_model, key in (
+        (model.UserDonationStats, model.PaymentMethod.user_id),
+        (model.FoundationDonationStats, model.PaymentRule.foundation_id),
+    ):
+        table = stats_model.__table__
+        (key_column,) = table.primary_key.columns
+        db.execute(table.delete())
+        db.execute(
+            table.insert().from_select(
+                [
+                    key_column,
+                    table.c.total_amount,
+                    table.c.payment_count,
+                    table.c.last_payment_at,
+                ],
+                select(
+                    [
+                        key,
+                        func.sum(model.PaymentRule.amount),
+                        func.count(model.Payment.id),
+                        func.max(model.Payment.created_at),
+                    ]
+                )
+                .select_from(joined)
+                .where(sent)
+                .group_by(key),
+            )
+        )
+    db.commit()
+
+
+def get_user_stats(db: Session, user_id: int) -> Optional[model.UserDonationStats]:
+    return db.query(model.UserDonationStats).get(user_id)
+
+
+def get_foundation_stats(
+    db: Session, foundation_id: int
+) -> Optional[model.FoundationDonationStats]:
+    return db.query(model.FoundationDonationStats).get(foundation_id)
+
+
 def create_payment(
     db: Session, payment_rule_id: int, transaction_hash: str
 ) -> model.Payment:
     payment_rcd = model.Payment(
-        payment_rule_id=payment_rule_id, transaction_hash=transaction_hash
+        payment_rule_id=payment_rule_id,
+        transaction_hash=transaction_hash,
+        status=schema.PaymentStatus.SENT.value,
+        next_receipt_check_at=datetime.datetime.utcnow(),
+    )
+    db.add(payment_rcd)
+    db.flush()
+    add_donations(db, [(payment_rule_id, payment_rcd.created_at)])
+    db.commit()
+    db.refresh(payment_rcd)
+    return payment_rcd
+
+
+def allocate_nonce(
+    db: Session, address: str, node_nonce: Callable[[], int], count: int = 1
+) -> int:
+    """Reserves ``count`` consecutive nonces of ``address`` and returns the first.
+
+    The increment is a single UPDATE, so the row lock serializes concurrent
+    callers across threads and processes. ``node_nonce`` is only consulted
+    the first time a sender is seen.
+    """
+    while True:
+        updated = (
+            db.query(model.SenderNonce)
+            .filter(model.SenderNonce.address == address)
+            .update(
+                {model.SenderNonce.next_nonce: model.SenderNonce.next_nonce + count},
+                synchronize_session=False,
+            )
+        )
+        if updated:
+            next_nonce = (
+                db.query(model.SenderNonce.next_nonce)
+                .filter(model.SenderNonce.address == address)
+                .scalar()
+            )
+            db.commit()
+            return next_nonce - count
+        db.rollback()
+        nonce = node_nonce()
+        db.add(model.SenderNonce(address=address, next_nonce=nonce + count))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker registered the sender first; take a nonce from it.
+            db.rollback()
+            continue
+        return nonce
+
+
+def release_nonce(
+    db: Session,
+    address: str,
+    nonce: int,
+    node_nonce: Callable[[], int],
+    count: int = 1,
+) -> None:
+    """Returns ``count`` nonces from ``nonce`` on whose transactions were never
+    broadcast or were rejected by the node.
+
+    They are reused only if they were the last ones handed out and the node
+    confirms they are still unused. Otherwise, e.g. after "nonce too low"
+    because the wallet also sent from elsewhere, the counter moves up to the
+    node's pending nonce so the next allocation does not hit the same rejection.
+    """
+    pending = node_nonce()
+    rolled_back = 0
+    if pending <= nonce:
+        rolled_back = (
+            db.query(model.SenderNonce)
+            .filter(model.SenderNonce.address == address)
+            .filter(model.SenderNonce.next_nonce == nonce + count)
+            .update({model.SenderNonce.next_nonce: nonce}, synchronize_session=False)
+        )
+    if rolled_back:
+        db.commit()
+    else:
+        advance_nonce(db, address, pending)
+
+
+def advance_nonce(db: Session, address: str, next_nonce: int) -> None:
+    """Raises the counter of ``address`` to ``next_nonce``, never lowering it,
+    so nonces already handed out are not issued twice."""
+    db.query(model.SenderNonce).filter(model.SenderNonce.address == address).filter(
+        model.SenderNonce.next_nonce < next_nonce
+    ).update({model.SenderNonce.next_nonce: next_nonce}, synchronize_session=False)
+    db.commit()
+
+
+def create_payments(
+    db: Session, transactions: List[Tuple[int, str]]
+) -> List[model.Payment]:
+    """Records ``(payment_rule_id, transaction_hash)`` pairs in one transaction."""
+    now = datetime.datetime.utcnow()
+    payment_rcds = [
+        model.Payment(
+            payment_rule_id=payment_rule_id,
+            transaction_hash=tx_hash,
+            status=schema.PaymentStatus.SENT.value,
+            next_receipt_check_at=now,
+        )
+        for payment_rule_id, tx_hash in transactions
+    ]
+    if not payment_rcds:
+        return []
+    db.add_all(payment_rcds)
+    db.flush()
+    payment_ids = [payment_rcd.id for payment_rcd in payment_rcds]
+    add_donations(
+        db,
+        [
+            (payment_rcd.payment_rule_id, payment_rcd.created_at)
+            for payment_rcd in payment_rcds
+        ],
+    )
+    db.commit()
+    # Reload the expired rows with one SELECT instead of one per row.
+    db.query(model.Payment).filter(model.Payment.id.in_(payment_ids)).all()
+    return payment_rcds
+
+
+def create_signed_payments(
+    db: Session, transactions: List[Tuple[int, str, int]]
+) -> List[model.Payment]:
+    """Records ``(payment_rule_id, transaction_hash, nonce)`` triples that are
+    signed but not yet broadcast, claimed by the caller.
+
+    If the caller dies before settling them, the claim expires and a worker
+    sends or confirms each one by its hash like any interrupted payment.
+    """
+    now = datetime.datetime.utcnow()
+    payment_rcds = [
+        model.Payment(
+            payment_rule_id=payment_rule_id,
+            transaction_hash=tx_hash,
+            nonce=nonce,
+            status=schema.PaymentStatus.PENDING.value,
+            next_attempt_at=now,
+            claimed_at=now,
+        )
+        for payment_rule_id, tx_hash, nonce in transactions
+    ]
+    if not payment_rcds:
+        return []
+    db.add_all(payment_rcds)
+    db.flush()
+    payment_ids = [payment_rcd.id for payment_rcd in payment_rcds]
+    db.commit()
+    db.query(model.Payment).filter(model.Payment.id.in_(payment_ids)).all()
+    return payment_rcds
+
+
+def settle_signed_payments(
+    db: Session,
+    sent: List[model.Payment],
+    failed: List[Tuple[model.Payment, str]],
+    unsettled: List[Tuple[model.Payment, str]],
+) -> None:
+    """Settles payments from ``create_signed_payments`` in one transaction.
+
+    ``sent`` were accepted by the node and ``failed`` rejected by it.
+    ``unsettled`` may or may not have reached the node, so their claim is
+    released for a worker to find out.
+    """
+    now = datetime.datetime.utcnow()
+    payment_ids = [payment_rcd.id for payment_rcd in sent]
+    payment_ids += [payment_rcd.id for payment_rcd, _ in failed + unsettled]
+    for payment_rcd in sent:
+        payment_rcd.status = schema.PaymentStatus.SENT.value
+        payment_rcd.next_receipt_check_at = now
+        payment_rcd.claimed_at = None
+    for payment_rcd, error in failed:
+        payment_rcd.status = schema.PaymentStatus.FAILED.value
+        payment_rcd.transaction_hash = None
+        payment_rcd.claimed_at = None
+        payment_rcd.error = error
+    for payment_rcd, error in unsettled:
+        payment_rcd.claimed_at = None
+        payment_rcd.error = error
+    if sent:
+        add_donations(
+            db,
+            [(payment_rcd.payment_rule_id, payment_rcd.created_at) for payment_rcd in sent],
+        )
+    db.commit()
+    if payment_ids:
+        # Reload the expired rows with one SELECT instead of one per row.
+        db.query(model.Payment).filter(model.Payment.id.in_(payment_ids)).all()
+
+
+def enqueue_payment(db: Session, payment_rule_id: int) -> model.Payment:
+    payment_rcd = model.Payment(
+        payment_rule_id=payment_rule_id,
+        status=schema.PaymentStatus.PENDING.value,
+        next_attempt_at=datetime.datetime.utcnow(),
     )
     db.add(payment_rcd)
     db.commit()
@@ -166,21 +661,306 @@ def create_payment(
     return payment_rcd
 
 
-def get_payments(db: Session, user_id: int) -> List[model.Payment]:
+def claim_payments(
+    db: Session, limit: int, claim_timeout: float
+) -> List[model.Payment]:
+    """Claims up to ``limit`` due pending payments for the calling worker.
+
+    Each claim is a conditional UPDATE, so two workers never get the same
+    row. Claims older than ``claim_timeout`` seconds belong to a worker that
+    died and may be taken over.
+    """
+    now = datetime.datetime.utcnow()
+    claimable = and_(
+        model.Payment.status == schema.PaymentStatus.PENDING.value,
+        model.Payment.next_attempt_at <= now,
+        or_(
+            model.Payment.claimed_at.is_(None),
+            model.Payment.claimed_at < now - datetime.timedelta(seconds=claim_timeout),
+        ),
+    )
+    candidate_ids = [
+        payment_id
+        for payment_id, in db.query(model.Payment.id)
+        .filter(claimable)
+        .order_by(model.Payment.next_attempt_at)
+        .limit(limit)
+    ]
+    claimed_ids = [
+        payment_id
+        for payment_id in candidate_ids
+        if db.query(model.Payment)
+        .filter(model.Payment.id == payment_id)
+        .filter(claimable)
+        .update({model.Payment.claimed_at: now}, synchronize_session=False)
+    ]
+    db.commit()
+    if not claimed_ids:
+        return []
     return (
         db.query(model.Payment)
-        .join(
-            model.Payment.payment_rule,
-            model.PaymentRule.payment_method,
-            model.PaymentMethod.user,
+        .options(
+            joinedload(model.Payment.payment_rule).joinedload(
+                model.PaymentRule.payment_method
+            ),
+            joinedload(model.Payment.payment_rule).joinedload(
+                model.PaymentRule.foundation
+            ),
         )
-        .filter(model.User.id == user_id)
+        .filter(model.Payment.id.in_(claimed_ids))
         .all()
     )
 
 
-def get_foundations(db: Session) -> List[model.Foundation]:
-    return db.query(model.Foundation).all()
+def _following_run_at(
+    next_run_at: datetime.datetime, interval_seconds: int, now: datetime.datetime
+) -> datetime.datetime:
+    # Runs missed while no scheduler was up are skipped, not replayed.
+    missed = int((now - next_run_at).total_seconds() // interval_seconds) + 1
+    return next_run_at + datetime.timedelta(seconds=missed * interval_seconds)
+
+
+def enqueue_due_payment_rules(db: Session, limit: int) -> List[model.Payment]:
+    """Queues one pending payment for each of up to ``limit`` due rules and
+    advances their ``next_run_at`` in the same transaction.
+
+    On PostgreSQL due rows are claimed with ``FOR UPDATE SKIP LOCKED`` so
+    concurrent schedulers split the work. Other databases claim each row by
+    compare-and-swap on ``next_run_at``; a rule another scheduler advanced
+    first is skipped.
+    """
+    now = datetime.datetime.utcnow()
+    query = (
+        db.query(model.PaymentRule)
+        .filter(model.PaymentRule.next_run_at <= now)
+        .order_by(model.PaymentRule.next_run_at)
+        .limit(limit)
+    )
+    claimed_ids = []
+    if db.bind.dialect.name == "postgresql":
+        for payment_rule_rcd in query.with_for_update(skip_locked=True):
+            payment_rule_rcd.next_run_at = _following_run_at(
+                payment_rule_rcd.next_run_at, payment_rule_rcd.interval_seconds, now
+            )
+            claimed_ids.append(payment_rule_rcd.id)
+    else:
+        due = query.with_entities(
+            model.PaymentRule.id,
+            model.PaymentRule.next_run_at,
+            model.PaymentRule.interval_seconds,
+        ).all()
+        for payment_rule_id, next_run_at, interval_seconds in due:
+            claimed = (
+                db.query(model.PaymentRule)
+                .filter(model.PaymentRule.id == payment_rule_id)
+                .filter(model.PaymentRule.next_run_at == next_run_at)
+                .update(
+                    {
+                        model.PaymentRule.next_run_at: _following_run_at(
+                            next_run_at, interval_seconds, now
+                        )
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if claimed:
+                claimed_ids.append(payment_rule_id)
+    payment_rcds = [
+        model.Payment(
+            payment_rule_id=payment_rule_id,
+            status=schema.PaymentStatus.PENDING.value,
+            next_attempt_at=now,
+        )
+        for payment_rule_id in claimed_ids
+    ]
+    db.add_all(payment_rcds)
+    db.commit()
+    return payment_rcds
+
+
+def record_payment_transaction(
+    db: Session,
+    payment_rcd: model.Payment,
+    transaction_hash: str,
+    nonce: Optional[int] = None,
+) -> None:
+    payment_rcd.transaction_hash = transaction_hash
+    payment_rcd.nonce = nonce
+    db.commit()
+
+
+def mark_payment_sent(
+    db: Session, payment_rcd: model.Payment, transaction_hash: str
+) -> None:
+    if payment_rcd.status != schema.PaymentStatus.SENT.value:
+        add_donations(db, [(payment_rcd.payment_rule_id, payment_rcd.created_at)])
+    payment_rcd.transaction_hash = transaction_hash
+    payment_rcd.status = schema.PaymentStatus.SENT.value
+    payment_rcd.next_receipt_check_at = datetime.datetime.utcnow()
+    payment_rcd.claimed_at = None
+    payment_rcd.error = None
+    db.commit()
+
+
+def retry_payment(
+    db: Session,
+    payment_rcd: model.Payment,
+    error: str,
+    max_attempts: int,
+    backoff: float,
+    clear_transaction: bool,
+) -> None:
+    """Schedules another attempt with exponential backoff, or gives up after
+    ``max_attempts``."""
+    payment_rcd.attempts += 1
+    payment_rcd.error = error
+    payment_rcd.claimed_at = None
+    if clear_transaction:
+        payment_rcd.transaction_hash = None
+        payment_rcd.nonce = None
+    if payment_rcd.attempts >= max_attempts:
+        payment_rcd.status = schema.PaymentStatus.FAILED.value
+    else:
+        payment_rcd.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=backoff * 2 ** (payment_rcd.attempts - 1)
+        )
+    db.commit()
+
+
+def payment_filters(
+    user_id: Optional[int],
+    before: Optional[Tuple[datetime.datetime, int]] = None,
+    foundation_id: Optional[int] = None,
+    payment_rule_id: Optional[int] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+) -> list:
+    """Criteria for ``get_payments`` over payments joined to their rule and method.
+
+    ``before`` is the ``(created_at, id)`` of the last row of the previous
+    page; rows are compared on that pair so pages stay stable while new
+    payments arrive. A ``user_id`` of ``None`` matches every user.
+    """
+    criteria = []
+    if user_id is not None:
+        criteria.append(model.PaymentMethod.user_id == user_id)
+    if before is not None:
+        created_at, payment_id = before
+        criteria.append(
+            or_(
+                model.Payment.created_at < created_at,
+                and_(
+                    model.Payment.created_at == created_at,
+                    model.Payment.id < payment_id,
+                ),
+            )
+        )
+    if foundation_id is not None:
+        criteria.append(model.PaymentRule.foundation_id == foundation_id)
+    if payment_rule_id is not None:
+        criteria.append(model.Payment.payment_rule_id == payment_rule_id)
+    if created_from is not None:
+        criteria.append(model.Payment.created_at >= created_from)
+    if created_to is not None:
+        criteria.append(model.Payment.created_at < created_to)
+    return criteria
+
+
+def get_unconfirmed_payments(
+    db: Session, limit: int
+) -> List[Tuple[int, str, datetime.datetime]]:
+    """``(id, transaction_hash, created_at)`` of sent payments whose receipt is
+    due to be checked, longest waiting first."""
+    return (
+        db.query(
+            model.Payment.id, model.Payment.transaction_hash, model.Payment.created_at
+        )
+        .filter(model.Payment.next_receipt_check_at <= datetime.datetime.utcnow())
+        .order_by(model.Payment.next_receipt_check_at)
+        .limit(limit)
+        .all()
+    )
+
+
+def record_receipts(db: Session, updates: List[dict]) -> None:
+    """Applies confirmer results given as ``Payment`` column values keyed by ``id``."""
+    db.bulk_update_mappings(model.Payment, updates)
+    db.commit()
+
+
+def get_payments(
+    db: Session,
+    user_id: int,
+    limit: Optional[int] = None,
+    columns: Optional[list] = None,
+    **filters,
+) -> List[model.Payment]:
+    """Payments of ``user_id``, newest first; see ``payment_filters``.
+
+    With ``columns`` rows are tuples of those columns instead of entities.
+    """
+    query = (
+        db.query(model.Payment)
+        .join(model.Payment.payment_rule, model.PaymentRule.payment_method)
+        .filter(*payment_filters(user_id, **filters))
+        .order_by(model.Payment.created_at.desc(), model.Payment.id.desc())
+    )
+    if columns is not None:
+        query = query.with_entities(*columns)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def iter_payment_batches(
+    db: Session,
+    user_id: Optional[int],
+    columns: list,
+    batch_size: int,
+    **filters,
+) -> Iterator[list]:
+    """``columns`` of the payments matching ``payment_filters``, oldest first,
+    in lists of up to ``batch_size`` rows.
+
+    Rows come from a server-side cursor where the driver supports one, so
+    memory does not grow with the number of matching payments.
+    """
+    query = (
+        db.query(model.Payment)
+        .join(model.Payment.payment_rule, model.PaymentRule.payment_method)
+        .filter(*payment_filters(user_id, **filters))
+        .order_by(model.Payment.created_at, model.Payment.id)
+        .with_entities(*columns)
+        .execution_options(stream_results=True)
+        .yield_per(batch_size)
+    )
+    batch = []
+    for row in query:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_foundation(db: Session, foundation_id: int) -> Optional[model.Foundation]:
+    return db.query(model.Foundation).get(foundation_id)
+
+
+def get_foundations(
+    db: Session,
+    limit: Optional[int] = None,
+    after_id: Optional[int] = None,
+    columns: Optional[list] = None,
+) -> List[model.Foundation]:
+    query = db.query(*columns) if columns is not None else db.query(model.Foundation)
+    if after_id is not None:
+        query = query.filter(model.Foundation.id > after_id)
+    query = query.order_by(model.Foundation.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 def create_foundation(
@@ -188,6 +968,8 @@ def create_foundation(
 ) -> model.Foundation:
     foundation_rcd = model.Foundation(**foundation.dict())
     db.add(foundation_rcd)
+    publish_invalidation(db, FOUNDATIONS_CHANNEL, "")
     db.commit()
+    foundations_cache.bump()
     db.refresh(foundation_rcd)
     return foundation_rcd
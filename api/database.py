@@ -1,18 +1,108 @@
 import os
+import threading
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./test.db")
+# Read-only replica for the listing endpoints; defaults to the primary.
+READ_DATABASE_URL = os.environ.get("READ_DATABASE_URL")
 
-if DATABASE_URL.startswith("sqlite"):
-    connect_args = {"check_same_thread": False}
-else:
-    connect_args = {}
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Serve requests from the asyncio data path (``api.async_crud``) instead of
+# running the sync crud layer on the threadpool.
+ASYNC_DB = os.environ.get("ASYNC_DB", "0") == "1"
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", DATABASE_URL)
+ASYNC_READ_DATABASE_URL = os.environ.get("ASYNC_READ_DATABASE_URL", READ_DATABASE_URL)
+
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def create_db_engine(url: str) -> Engine:
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+# Engines are created on first use (``init_engines``, attribute access or opening
+# a session) rather than at import time.
+_ENGINE_ATTRIBUTES = ("engine", "read_engine", "async_database", "async_read_database")
+_engines_lock = threading.Lock()
+
+
+def init_engines() -> None:
+    with _engines_lock:
+        if "engine" in globals():
+            return
+        engine = create_db_engine(DATABASE_URL)
+        read_engine = (
+            create_db_engine(READ_DATABASE_URL) if READ_DATABASE_URL else engine
+        )
+        async_database = async_read_database = None
+        if ASYNC_DB:
+            import databases
+
+            async_database = databases.Database(ASYNC_DATABASE_URL)
+            async_read_database = (
+                databases.Database(ASYNC_READ_DATABASE_URL)
+                if ASYNC_READ_DATABASE_URL
+                else async_database
+            )
+        globals().update(
+            engine=engine,
+            read_engine=read_engine,
+            async_database=async_database,
+            async_read_database=async_read_database,
+        )
+
+
+def __getattr__(name):
+    if name in _ENGINE_ATTRIBUTES:
+        init_engines()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _LazySession(Session):
+    engine_attribute = "engine"
+
+    def __init__(self, bind=None, **kwargs):
+        if bind is None:
+            init_engines()
+            bind = globals()[self.engine_attribute]
+        super().__init__(bind=bind, **kwargs)
+
+
+class _ReadSession(_LazySession):
+    engine_attribute = "read_engine"
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=_LazySession)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=_ReadSession)
 
 Base = declarative_base()
 
@@ -25,3 +115,23 @@ def get_db():
     finally:
         if db is not None:
             db.close()
+
+
+def get_read_db():
+    db = None
+    try:
+        db = ReadSessionLocal()
+        yield db
+    finally:
+        if db is not None:
+            db.close()
+
+
+async def get_async_db():
+    init_engines()
+    return globals()["async_database"]
+
+
+async def get_async_read_db():
+    init_engines()
+    return globals()["async_read_database"]
@@ -1,27 +1,123 @@
-from typing import List
+import datetime
+import hashlib
+import json
+from typing import List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query
 from fastapi.security import APIKeyHeader
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.status import (
+    HTTP_202_ACCEPTED,
+    HTTP_304_NOT_MODIFIED,
     HTTP_401_UNAUTHORIZED,
     HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
-from api import crud, model, schema, payment
-from api.database import get_db, engine
-
-model.Base.metadata.create_all(bind=engine)
+from api import (
+    admission,
+    async_crud,
+    cache,
+    compactor,
+    confirmer,
+    crud,
+    instrumentation,
+    migrations,
+    model,
+    pagination,
+    payment,
+    scheduler,
+    schema,
+    security,
+    serialization,
+    signing,
+    worker,
+)
+from api import database
+from api.database import get_db, get_read_db
 
-app = FastAPI()
+router = APIRouter()
 security_scheme = APIKeyHeader(name="Authorization")
 
+if database.ASYNC_DB:
+    store = async_crud
+    get_store = database.get_async_db
+    get_read_store = database.get_async_read_db
+else:
+    store = async_crud.Threaded(crud)
+    get_store = get_db
+    get_read_store = get_read_db
+
+
+def initialize():
+    """Connects to the database and the Ethereum node, refusing to start on a
+    database that is behind the latest migration."""
+    database.init_engines()
+    if migrations.SCHEMA_CHECK:
+        migrations.check_schema(database.engine)
+    payment.init_clients()
+
+
+def start_payment_workers():
+    worker.worker_pool.start()
+    scheduler.scheduler.start()
+    confirmer.confirmer.start()
+    compactor.compactor.start()
+
+
+def stop_payment_workers():
+    compactor.compactor.stop()
+    confirmer.confirmer.stop()
+    scheduler.scheduler.stop()
+    worker.worker_pool.stop()
+    signing.signing_pool.shutdown()
+
+
+async def connect_async_database():
+    if database.ASYNC_DB:
+        await database.async_database.connect()
+        if database.async_read_database is not database.async_database:
+            await database.async_read_database.connect()
+
+
+async def disconnect_async_database():
+    if database.ASYNC_DB:
+        if database.async_read_database is not database.async_database:
+            await database.async_read_database.disconnect()
+        await database.async_database.disconnect()
+
+
+async def close_async_rpc_sessions():
+    if payment.async_eth_client is not None:
+        await payment.async_eth_client.provider.close()
+
+
+async def hashing_overloaded_handler(
+    request: Request, exc: security.HashingOverloaded
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many authentication requests, try again later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+async def rate_limited_handler(
+    request: Request, exc: admission.RateLimited
+) -> JSONResponse:
+    return admission.rate_limited_response(exc)
+
 
 async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(security_scheme)
+    db=Depends(get_store), token: str = Depends(security_scheme)
 ) -> model.User:
-    user = crud.get_user_by_token(db, token)
+    user = await store.get_user_by_token(db, token)
     if user is None:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
@@ -31,105 +127,105 @@ async def get_current_user(
     return user
 
 
-@app.post("/user/create", response_model=schema.ResponseUserCreate)
-def create_user(user: schema.RequestUser, db: Session = Depends(get_db)):
-    db_user = crud.create_user(db, user)
+async def get_current_admin(
+    user: model.User = Depends(get_current_user),
+) -> model.User:
+    if not user.is_admin:
+        raise HTTPException(
+            status_code=HTTP_403_FORBIDDEN, detail="Admin privileges required"
+        )
+    return user
+
+
+@router.post("/user/create", response_model=schema.ResponseUserCreate)
+async def create_user(user: schema.RequestUser, db=Depends(get_store)):
+    db_user = await store.create_user(db, user)
     if not db_user:
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST,
             detail="User with a given username already exists",
         )
-    user_token = crud.create_user_token(db, db_user.id)
+    user_token = await store.create_user_token(db, db_user.id)
     return {"id": db_user.id, "name": db_user.name, "token": user_token.token}
 
 
-@app.post("/user/token", response_model=schema.UserToken)
-def create_user_token(
-    user: schema.RequestUser, db: Session = Depends(get_db)
+@router.post("/user/token", response_model=schema.UserToken)
+async def create_user_token(
+    user: schema.RequestUser, db=Depends(get_store)
 ) -> model.UserToken:
-    user_rcd = crud.authenticate_user(db, user.name, user.password)
+    user_rcd = await store.authenticate_user(db, user.name, user.password)
     if user_rcd is None:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return crud.create_user_token(db, user_rcd.id)
+    return await store.create_user_token(db, user_rcd.id)
 
 
-@app.post("/user/logout", response_model=schema.ResponseSuccess)
-def logout_user(db: Session = Depends(get_db), token: str = Depends(security_scheme)):
-    return {"success": crud.deactivate_user_token(db, token)}
+@router.post("/user/logout", response_model=schema.ResponseSuccess)
+async def logout_user(db=Depends(get_store), token: str = Depends(security_scheme)):
+    return {"success": await store.deactivate_user_token(db, token)}
 
 
-@app.get("/payments/methods", response_model=List[schema.ResponsePaymentMethod])
-def get_payment_methods(
-    db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
-) -> List[dict]:
-    return [
-        {
-            "id": payment_method.id,
-            "type": payment_method.type,
-            "address": payment.account_from_private_key(
-                payment.eth_client, payment_method.private_key
-            ).address,
-        }
-        for payment_method in crud.get_payment_methods(db, user.id)
-    ]
-
-
-@app.post("/payments/methods", response_model=schema.ResponsePaymentMethod)
-def create_payment_method(
+@router.get("/user/stats", response_model=schema.ResponseDonationStats)
+async def get_user_stats(
+    db=Depends(get_read_store), user: model.User = Depends(get_current_user)
+):
+    return await store.get_user_stats(db, user.id) or {}
+
+
+@router.get("/payments/methods", response_model=List[schema.ResponsePaymentMethod])
+async def get_payment_methods(
+    db=Depends(get_read_store), user: model.User = Depends(get_current_user)
+) -> List[model.PaymentMethod]:
+    return await store.get_payment_methods(db, user.id)
+
+
+@router.post("/payments/methods", response_model=schema.ResponsePaymentMethod)
+async def create_payment_method(
     payment_method: schema.RequestPaymentMethod,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
-) -> dict:
-    if not payment.validate_private_key(payment.eth_client, payment_method.private_key):
+) -> model.PaymentMethod:
+    account = payment.validate_private_key(
+        payment.eth_client, payment_method.private_key
+    )
+    if not account:
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST,
             detail=f"Invalid private key for type: {payment_method.type}",
         )
-    db_payment_method = crud.create_payment_method(db, user.id, payment_method)
-    return {
-        "id": db_payment_method.id,
-        "type": db_payment_method.type,
-        "address": payment.account_from_private_key(
-            payment.eth_client, db_payment_method.private_key
-        ).address,
-    }
+    return await store.create_payment_method(
+        db, user.id, payment_method, account.address
+    )
 
 
-@app.get(
+@router.get(
     "/payments/methods/{payment_method_id}", response_model=schema.ResponsePaymentMethod
 )
-def get_payment_method(
+async def get_payment_method(
     payment_method_id: int,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
-) -> dict:
-    db_payment_method = crud.get_payment_method(db, payment_method_id, user.id)
+) -> model.PaymentMethod:
+    db_payment_method = await store.get_payment_method(db, payment_method_id, user.id)
     if not db_payment_method:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND, detail="Payment method not found"
         )
-    return {
-        "id": db_payment_method.id,
-        "type": db_payment_method.type,
-        "address": payment.account_from_private_key(
-            payment.eth_client, db_payment_method.private_key
-        ).address,
-    }
+    return db_payment_method
 
 
-@app.delete(
+@router.delete(
     "/payments/methods/{payment_method_id}", response_model=schema.ResponseSuccess
 )
-def delete_payment_method(
+async def delete_payment_method(
     payment_method_id: int,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
 ):
-    success = crud.delete_payment_method(db, payment_method_id, user.id)
+    success = await store.delete_payment_method(db, payment_method_id, user.id)
     if not success:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND, detail="Payment method not found"
@@ -137,29 +233,35 @@ def delete_payment_method(
     return {"success": success}
 
 
-@app.get("/payments/rules", response_model=List[schema.ResponsePaymentRule])
-def get_payment_rules(
-    db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
+@router.get("/payments/rules", response_model=List[schema.ResponsePaymentRule])
+async def get_payment_rules(
+    db=Depends(get_read_store), user: model.User = Depends(get_current_user)
 ) -> List[model.PaymentRule]:
-    return crud.get_payment_rules(db, user.id)
+    if serialization.FAST_SERIALIZATION:
+        columns = serialization.PAYMENT_RULE_COLUMNS
+        rows = await store.get_payment_rules(db, user.id, columns=columns)
+        return serialization.ORJSONResponse(serialization.rows_to_dicts(columns, rows))
+    return await store.get_payment_rules(db, user.id)
 
 
-@app.post("/payments/rules", response_model=schema.ResponsePaymentRule)
-def create_payment_rule(
+@router.post("/payments/rules", response_model=schema.ResponsePaymentRule)
+async def create_payment_rule(
     payment_rule: schema.RequestPaymentRule,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
 ) -> model.PaymentRule:
-    return crud.create_payment_rule(db, payment_rule, user.id)
+    return await store.create_payment_rule(db, payment_rule, user.id)
 
 
-@app.get("/payments/rules/{payment_rule_id}", response_model=schema.ResponsePaymentRule)
-def get_payment_rule(
+@router.get(
+    "/payments/rules/{payment_rule_id}", response_model=schema.ResponsePaymentRule
+)
+async def get_payment_rule(
     payment_rule_id: int,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
 ) -> model.PaymentRule:
-    payment_rule = crud.get_payment_rule(db, payment_rule_id, user.id)
+    payment_rule = await store.get_payment_rule(db, payment_rule_id, user.id)
     if not payment_rule:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND, detail="Payment rule not found"
@@ -167,13 +269,15 @@ def get_payment_rule(
     return payment_rule
 
 
-@app.delete("/payments/rules/{payment_rule_id}", response_model=schema.ResponseSuccess)
-def delete_payment_rule(
+@router.delete(
+    "/payments/rules/{payment_rule_id}", response_model=schema.ResponseSuccess
+)
+async def delete_payment_rule(
     payment_rule_id: int,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
 ):
-    success = crud.delete_payment_rule(db, payment_rule_id, user.id)
+    success = await store.delete_payment_rule(db, payment_rule_id, user.id)
     if not success:
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND, detail="Payment method not found"
@@ -181,42 +285,295 @@ def delete_payment_rule(
     return {"success": success}
 
 
-@app.post(
-    "/payments/rules/{payment_rule_id}/trigger", response_model=schema.ResponsePayment
+@router.post(
+    "/payments/rules/{payment_rule_id}/trigger",
+    response_model=schema.ResponsePayment,
+    status_code=HTTP_202_ACCEPTED,
 )
-def trigger_payment_rule(
+async def trigger_payment_rule(
     payment_rule_id: int,
-    db: Session = Depends(get_db),
+    db=Depends(get_store),
     user: model.User = Depends(get_current_user),
 ):
-    payment_rule_rcd = crud.get_payment_rule(db, payment_rule_id, user.id)
-    transaction_hash = payment.send_eth_from_to_amount(
-        client=payment.eth_client,
-        from_private_key=payment_rule_rcd.payment_method.private_key,
-        to_pubkey=payment_rule_rcd.foundation.payment_address,
-        amount=payment_rule_rcd.amount,
-    )
-    return crud.create_payment(db, payment_rule_id, transaction_hash)
+    admission.trigger_limiter.take(user.id)
+    payment_rule_rcd = await store.get_payment_rule(db, payment_rule_id, user.id)
+    if not payment_rule_rcd:
+        raise HTTPException(
+            status_code=HTTP_404_NOT_FOUND, detail="Payment rule not found"
+        )
+    return await store.enqueue_payment(db, payment_rule_id)
 
 
-@app.get("/payments/history", response_model=List[schema.ResponsePayment])
-def get_payment_history(
-    db: Session = Depends(get_db), user: model.User = Depends(get_current_user)
+# Nonce allocation and signing block, so batch triggers stay on the sync path.
+@router.post(
+    "/payments/rules/trigger", response_model=List[schema.ResponseTriggerResult]
+)
+def trigger_payment_rules(
+    request: schema.RequestTriggerBatch,
+    db: Session = Depends(get_db),
+    user: model.User = Depends(get_current_user),
+) -> List[dict]:
+    admission.batch_trigger_limiter.take(user.id)
+    payment_rule_ids = list(dict.fromkeys(request.payment_rule_ids))
+    payment_rules = crud.get_payment_rules_by_ids(db, payment_rule_ids, user.id)
+    sent = payment.send_payment_rules_batch(
+        db,
+        payment.eth_client,
+        payment_rules,
+        gas_price=payment.gas_price_oracle.price(),
+    )
+    results = []
+    for payment_rule_id in payment_rule_ids:
+        payment_rcd, error = sent.get(payment_rule_id, (None, "Payment rule not found"))
+        results.append(
+            {
+                "payment_rule_id": payment_rule_id,
+                "success": error is None,
+                "payment": payment_rcd,
+                "error": error,
+            }
+        )
+    return results
+
+
+@router.get("/payments/history", response_model=List[schema.ResponsePayment])
+async def get_payment_history(
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    foundation_id: Optional[int] = None,
+    payment_rule_id: Optional[int] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    db=Depends(get_read_store),
+    user: model.User = Depends(get_current_user),
 ) -> List[model.Payment]:
-    return crud.get_payments(db, user.id)
+    before = None
+    if cursor is not None:
+        before = tuple(
+            pagination.decode_cursor(cursor, datetime.datetime.fromisoformat, int)
+        )
+    columns = None
+    if serialization.FAST_SERIALIZATION:
+        columns = serialization.PAYMENT_COLUMNS
+    payments = await store.get_payments(
+        db,
+        user.id,
+        limit=limit + 1,
+        columns=columns,
+        before=before,
+        foundation_id=foundation_id,
+        payment_rule_id=payment_rule_id,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    if columns is None:
+        return pagination.paginate(
+            response,
+            payments,
+            limit,
+            lambda payment_rcd: (payment_rcd.created_at.isoformat(), payment_rcd.id),
+        )
+    payments, next_cursor = pagination.split_page(
+        serialization.rows_to_dicts(columns, payments),
+        limit,
+        lambda payment_row: (payment_row["created_at"].isoformat(), payment_row["id"]),
+    )
+    headers = {}
+    if next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return serialization.ORJSONResponse(payments, headers=headers)
+
+
+EXPORT_FORMATS = {
+    "ndjson": (serialization.ndjson_chunks, "application/x-ndjson"),
+    "csv": (serialization.csv_chunks, "text/csv"),
+}
+
+
+def _export_payments(
+    user_id: Optional[int], export_format: str, **filters
+) -> StreamingResponse:
+    encode, media_type = EXPORT_FORMATS[export_format]
+    columns = serialization.EXPORT_COLUMNS
+
+    # Owns its session: the body is still streaming after the endpoint returns.
+    def chunks():
+        db = database.ReadSessionLocal()
+        try:
+            yield from encode(
+                columns,
+                crud.iter_payment_batches(
+                    db, user_id, columns, serialization.EXPORT_BATCH_SIZE, **filters
+                ),
+            )
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": 'attachment; filename="payments.%s"' % export_format
+        },
+    )
+
+
+@router.get("/payments/history/export")
+async def export_payment_history(
+    export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+    foundation_id: Optional[int] = None,
+    payment_rule_id: Optional[int] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    user: model.User = Depends(get_current_user),
+) -> StreamingResponse:
+    return _export_payments(
+        user.id,
+        export_format,
+        foundation_id=foundation_id,
+        payment_rule_id=payment_rule_id,
+        created_from=created_from,
+        created_to=created_to,
+    )
 
 
-@app.get("/foundations", response_model=List[schema.ResponseFoundation])
-def get_foundations(db: Session = Depends(get_db)) -> List[model.Foundation]:
-    return crud.get_foundations(db)
+@router.get("/admin/payments/history/export")
+async def export_all_payment_history(
+    export_format: str = Query("ndjson", alias="format", regex="^(ndjson|csv)$"),
+    user_id: Optional[int] = None,
+    foundation_id: Optional[int] = None,
+    payment_rule_id: Optional[int] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    admin: model.User = Depends(get_current_admin),
+) -> StreamingResponse:
+    return _export_payments(
+        user_id,
+        export_format,
+        foundation_id=foundation_id,
+        payment_rule_id=payment_rule_id,
+        created_from=created_from,
+        created_to=created_to,
+    )
 
 
-@app.post("/foundations", response_model=schema.ResponseFoundation)
-def create_foundation(
-    foundation: schema.RequestFoundation, db: Session = Depends(get_db)
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or "W/" + etag in candidates
+
+
+@router.get("/foundations", response_model=List[schema.ResponseFoundation])
+async def get_foundations(
+    request: Request,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db=Depends(get_read_store),
+) -> Response:
+    if cache.invalidation_listener.due():
+        await store.poll_invalidations(db)
+    key = (limit, cursor)
+    page = cache.foundations_cache.get(key)
+    if page is None:
+        version = cache.foundations_cache.version
+        after_id = None
+        if cursor is not None:
+            (after_id,) = pagination.decode_cursor(cursor, int)
+        columns = None
+        if serialization.FAST_SERIALIZATION:
+            columns = serialization.FOUNDATION_COLUMNS
+        foundations = await store.get_foundations(
+            db, limit=limit + 1, after_id=after_id, columns=columns
+        )
+        if columns is None:
+            foundations = [
+                schema.ResponseFoundation.from_orm(foundation).dict()
+                for foundation in foundations
+            ]
+        else:
+            foundations = serialization.rows_to_dicts(columns, foundations)
+        foundations, next_cursor = pagination.split_page(
+            foundations, limit, lambda foundation: (foundation["id"],)
+        )
+        if columns is None:
+            body = json.dumps(
+                foundations, ensure_ascii=False, separators=(",", ":")
+            ).encode()
+        else:
+            body = serialization.dumps(foundations)
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()
+        page = (body, etag, next_cursor)
+        cache.foundations_cache.set_if_version(key, page, version)
+
+    body, etag, next_cursor = page
+    headers = {"ETag": etag}
+    if next_cursor is not None:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/foundations/{foundation_id}/stats", response_model=schema.ResponseDonationStats
+)
+async def get_foundation_stats(foundation_id: int, db=Depends(get_read_store)):
+    stats = await store.get_foundation_stats(db, foundation_id)
+    if stats is None:
+        if not await store.get_foundation(db, foundation_id):
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND, detail="Foundation not found"
+            )
+        return {}
+    return stats
+
+
+@router.post("/foundations", response_model=schema.ResponseFoundation)
+async def create_foundation(
+    foundation: schema.RequestFoundation, db=Depends(get_store)
 ) -> model.Foundation:
     if not payment.validate_address(foundation.payment_address):
         raise HTTPException(
             status_code=HTTP_400_BAD_REQUEST, detail="Invalid payment address"
         )
-    return crud.create_foundation(db, foundation)
+    # Record whether the address holds code so triggers can skip estimateGas.
+    if payment.async_eth_client is not None:
+        await payment.is_contract_address_async(
+            payment.async_eth_client, foundation.payment_address
+        )
+    else:
+        await run_in_threadpool(
+            payment.is_contract_address, payment.eth_client, foundation.payment_address
+        )
+    return await store.create_foundation(db, foundation)
+
+
+@router.get("/metrics/admission")
+async def get_admission_metrics(
+    admin: model.User = Depends(get_current_admin),
+) -> dict:
+    return admission.metrics()
+
+
+def create_app() -> FastAPI:
+    """Builds the API without touching the database or the Ethereum node; both
+    are set up by the startup hooks."""
+    app = FastAPI()
+    instrumentation.instrument(Engine)
+    app.add_middleware(instrumentation.QueryStatsMiddleware)
+    app.add_middleware(admission.AdmissionMiddleware)
+    app.add_exception_handler(security.HashingOverloaded, hashing_overloaded_handler)
+    app.add_exception_handler(admission.RateLimited, rate_limited_handler)
+    app.include_router(router)
+    app.add_event_handler("startup", initialize)
+    app.add_event_handler("startup", start_payment_workers)
+    app.add_event_handler("startup", connect_async_database)
+    app.add_event_handler("shutdown", stop_payment_workers)
+    app.add_event_handler("shutdown", disconnect_async_database)
+    app.add_event_handler("shutdown", close_async_rpc_sessions)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,41 @@
+import os
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+
+# Refuse to start against a database that is not at the latest migration.
+SCHEMA_CHECK = os.environ.get("SCHEMA_CHECK", "1") == "1"
+
+ALEMBIC_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic"
+)
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def head_revision() -> str:
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIRECTORY)
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+def current_revision(engine: Engine) -> Optional[str]:
+    from alembic.runtime.migration import MigrationContext
+
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def check_schema(engine: Engine) -> None:
+    head = head_revision()
+    current = current_revision(engine)
+    if current != head:
+        raise SchemaOutOfDate(
+            f"Database is at revision {current}, expected {head}; "
+            "run `alembic upgrade head`"
+        )
@@ -1,6 +1,16 @@
 import datetime
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, Numeric, String, Text, Boolean
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import expression
 
@@ -13,6 +23,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    is_admin = Column(Boolean, server_default=expression.false(), default=False)
 
     payment_methods = relationship("PaymentMethod", back_populates="user")
     tokens = relationship("UserToken", back_populates="user")
@@ -28,6 +39,12 @@ class UserToken(Base):
 
     user = relationship("User", back_populates="tokens")
 
+    __table_args__ = (
+        Index("ix_user_tokens_user_id_is_active", user_id, is_active),
+        # Lets the compactor find logged-out and expired tokens without a scan.
+        Index("ix_user_tokens_is_active_created_at", is_active, created_at),
+    )
+
 
 class PaymentMethod(Base):
     __tablename__ = "payment_methods"
@@ -35,7 +52,8 @@ class PaymentMethod(Base):
     id = Column(Integer, primary_key=True, index=True)
     type = Column(String)
     private_key = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    address = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
 
     user = relationship("User", back_populates="payment_methods")
     payment_rules = relationship("PaymentRule", back_populates="payment_method")
@@ -56,9 +74,11 @@ class PaymentRule(Base):
     __tablename__ = "payment_rules"
 
     id = Column(Integer, primary_key=True, index=True)
-    payment_method_id = Column(Integer, ForeignKey("payment_methods.id"))
-    foundation_id = Column(Integer, ForeignKey("foundations.id"))
+    payment_method_id = Column(Integer, ForeignKey("payment_methods.id"), index=True)
+    foundation_id = Column(Integer, ForeignKey("foundations.id"), index=True)
     amount = Column(Numeric(precision=18))
+    interval_seconds = Column(Integer)
+    next_run_at = Column(DateTime, index=True)
 
     payment_method = relationship("PaymentMethod", back_populates="payment_rules")
     foundation = relationship("Foundation", back_populates="payment_rules")
@@ -71,6 +91,66 @@ class Payment(Base):
     id = Column(Integer, primary_key=True, index=True)
     payment_rule_id = Column(Integer, ForeignKey("payment_rules.id"))
     transaction_hash = Column(String)
+    # Nonce the transaction was signed with, so a lost one is re-signed in place.
+    nonce = Column(Integer)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    status = Column(String, nullable=False, server_default="sent", default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0", default=0)
+    next_attempt_at = Column(DateTime)
+    claimed_at = Column(DateTime)
+    error = Column(String)
+    block_number = Column(Integer)
+    gas_used = Column(Integer)
+    receipt_status = Column(Integer)
+    confirmed_at = Column(DateTime)
+    # When the confirmer should next ask for a receipt; NULL once confirmed.
+    next_receipt_check_at = Column(DateTime, index=True)
 
     payment_rule = relationship("PaymentRule", back_populates="payment_history")
+
+    __table_args__ = (
+        Index("ix_payment_history_status_next_attempt_at", status, next_attempt_at),
+        Index(
+            "ix_payment_history_payment_rule_id_created_at",
+            payment_rule_id,
+            created_at,
+        ),
+    )
+
+
+class UserDonationStats(Base):
+    __tablename__ = "user_donation_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_amount = Column(
+        Numeric(precision=36, scale=18), nullable=False, server_default="0", default=0
+    )
+    payment_count = Column(Integer, nullable=False, server_default="0", default=0)
+    last_payment_at = Column(DateTime)
+
+
+class FoundationDonationStats(Base):
+    __tablename__ = "foundation_donation_stats"
+
+    foundation_id = Column(Integer, ForeignKey("foundations.id"), primary_key=True)
+    total_amount = Column(
+        Numeric(precision=36, scale=18), nullable=False, server_default="0", default=0
+    )
+    payment_count = Column(Integer, nullable=False, server_default="0", default=0)
+    last_payment_at = Column(DateTime)
+
+
+class SenderNonce(Base):
+    __tablename__ = "sender_nonces"
+
+    address = Column(String, primary_key=True)
+    next_nonce = Column(Integer, nullable=False)
+
+
+class CacheInvalidation(Base):
+    __tablename__ = "cache_invalidations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String)
+    key = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
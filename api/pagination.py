@@ -0,0 +1,56 @@
+import base64
+import binascii
+import json
+import os
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+from fastapi import HTTPException
+from starlette.responses import Response
+from starlette.status import HTTP_400_BAD_REQUEST
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+T = TypeVar("T")
+
+
+def encode_cursor(values: Sequence) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor: str, *converters: Callable) -> list:
+    """Reverses ``encode_cursor``, passing each value through its converter.
+
+    Anything that doesn't decode to one valid value per converter is
+    rejected with a 400.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(converters):
+            raise ValueError(cursor)
+        return [convert(value) for convert, value in zip(converters, values)]
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def split_page(
+    rows: List[T], limit: int, cursor_of: Callable[[T], Sequence]
+) -> Tuple[List[T], Optional[str]]:
+    """Trims ``rows`` (fetched with ``limit + 1``) to one page and returns it
+    with the cursor of the following page, ``None`` on the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(cursor_of(rows[-1]))
+
+
+def paginate(
+    response: Response, rows: List[T], limit: int, cursor_of: Callable[[T], Sequence]
+) -> List[T]:
+    """``split_page`` advertising the next cursor in the ``X-Next-Cursor`` header."""
+    rows, next_cursor = split_page(rows, limit, cursor_of)
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
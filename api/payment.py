@@ -1,15 +1,34 @@
+import logging
 import os
+import threading
+import time
 
+from collections import OrderedDict
 from decimal import Decimal
-from typing import Union
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
-from web3 import Web3
+from sqlalchemy.orm import Session
 
-provider_url = os.environ.get("INFURA_URL")
+from api import crud, model, signing
+from api.cache import TTLCache
 
-provider = Web3.HTTPProvider(provider_url)
+GAS_PRICE_STRATEGY = os.environ.get("GAS_PRICE_STRATEGY", "node")
+GAS_PRICE_REFRESH_INTERVAL = float(os.environ.get("GAS_PRICE_REFRESH_INTERVAL", "15"))
+GAS_PRICE_PERCENTILE = float(os.environ.get("GAS_PRICE_PERCENTILE", "60"))
+GAS_PRICE_BLOCKS = int(os.environ.get("GAS_PRICE_BLOCKS", "20"))
+GAS_PRICE_FIXED_WEI = int(os.environ.get("GAS_PRICE_FIXED_WEI", "0"))
+GAS_PRICE_CAP_WEI = int(os.environ.get("GAS_PRICE_CAP_WEI", "0"))
+ASYNC_RPC = os.environ.get("ASYNC_RPC", "0") == "1"
+CONTRACT_CODE_CACHE_TTL = float(os.environ.get("CONTRACT_CODE_CACHE_TTL", "86400"))
+GAS_ESTIMATE_CACHE_TTL = float(os.environ.get("GAS_ESTIMATE_CACHE_TTL", "3600"))
 
-eth_client = Web3(provider)
+# Plain ETH transfers to externally owned accounts always cost exactly this.
+TRANSFER_GAS = 21000
+
+logger = logging.getLogger(__name__)
+
+contract_code_cache = TTLCache(maxsize=10000, ttl=CONTRACT_CODE_CACHE_TTL)
+gas_estimate_cache = TTLCache(maxsize=10000, ttl=GAS_ESTIMATE_CACHE_TTL)
 
 
 def account_from_private_key(client, private_key):
@@ -24,22 +43,474 @@ def validate_private_key(client, private_key):
     return account
 
 
-def send_eth_from_to_amount(
-    client, from_private_key: str, to_pubkey: str, amount: Union[Decimal, float, str, int]
-) -> str:
-    sender_account = account_from_private_key(client, from_private_key)
+def get_pending_nonce(client, address: str) -> int:
+    return client.eth.getTransactionCount(address, "pending")
+
+
+def is_transaction_known(client, transaction_hash: str) -> bool:
+    from web3.exceptions import TransactionNotFound
+
+    try:
+        client.eth.getTransaction(transaction_hash)
+    except TransactionNotFound:
+        return False
+    return True
+
+
+def is_contract_address(client, address: str) -> bool:
+    is_contract = contract_code_cache.get(address)
+    if is_contract is None:
+        is_contract = len(client.eth.getCode(address)) > 0
+        contract_code_cache.set(address, is_contract)
+    return is_contract
+
+
+async def is_contract_address_async(client, address: str) -> bool:
+    is_contract = contract_code_cache.get(address)
+    if is_contract is None:
+        is_contract = len(await client.eth.get_code(address)) > 0
+        contract_code_cache.set(address, is_contract)
+    return is_contract
+
+
+def estimate_gas(client, params: dict) -> int:
+    """Gas limit for ``params``, only asking the node when paying a contract.
+
+    Contract estimates are memoized per recipient and power-of-two bucket of
+    the transferred value.
+    """
+    if not is_contract_address(client, params["to"]):
+        return TRANSFER_GAS
+    key = (params["to"], params["value"].bit_length())
+    gas = gas_estimate_cache.get(key)
+    if gas is None:
+        gas = client.eth.estimateGas(params)
+        gas_estimate_cache.set(key, gas)
+    return gas
+
+
+def transfer_params(
+    client,
+    from_address: str,
+    to_pubkey: str,
+    amount: Union[Decimal, float, str, int],
+    gas_price: int,
+) -> dict:
+    from web3 import Web3
+
     params = {
         "to": to_pubkey,
-        "from": sender_account.address,
-        "nonce": client.eth.getTransactionCount(sender_account.address),
+        "from": from_address,
         "value": Web3.toWei(amount, "ether"),
-        "gasPrice": client.eth.gasPrice,
+        "gasPrice": gas_price,
     }
-    params["gas"] = client.eth.estimateGas(params)
-    signed_tx = sender_account.signTransaction(params)
+    params["gas"] = estimate_gas(client, params)
+    return params
+
+
+def send_eth_from_to_amount(
+    client,
+    from_private_key: str,
+    to_pubkey: str,
+    amount: Union[Decimal, float, str, int],
+    nonce: Optional[int] = None,
+    gas_price: Optional[int] = None,
+    on_signed: Optional[Callable[[str], None]] = None,
+    payment_method_id: Optional[int] = None,
+) -> str:
+    """Signs and broadcasts a transfer; pass ``payment_method_id`` to reuse the
+    account derived for that payment method."""
+    sender_address = signing.signer_registry.account(
+        payment_method_id, from_private_key
+    ).address
+    if nonce is None:
+        nonce = client.eth.getTransactionCount(sender_address)
+    if gas_price is None:
+        gas_price = client.eth.gasPrice
+    params = transfer_params(client, sender_address, to_pubkey, amount, gas_price)
+    params["nonce"] = nonce
+    signed_tx = signing.signing_pool.sign(payment_method_id, from_private_key, params)
+    if on_signed is not None:
+        on_signed(signed_tx.hash.hex())
     tx_hash = client.eth.sendRawTransaction(signed_tx["rawTransaction"])
     return tx_hash.hex()
 
 
+def batch_request(client, method: str, params_list: List[list]) -> List[dict]:
+    """Sends one JSON-RPC call per entry of ``params_list`` and returns the
+    responses in the same order.
+
+    HTTP providers get a single batched POST; other providers (e.g. the
+    in-process tester) fall back to one call per entry.
+    """
+    from web3 import HTTPProvider
+
+    from api import rpc
+
+    if not params_list:
+        return []
+    provider = client.provider
+    if isinstance(provider, rpc.MultiEndpointProvider):
+        return provider.make_batch_request(method, params_list)
+    if not isinstance(provider, HTTPProvider):
+        responses = []
+        for params in params_list:
+            try:
+                responses.append(provider.make_request(method, params))
+            except Exception as exc:
+                responses.append({"error": {"message": str(exc)}})
+        return responses
+    return rpc.post_batch(provider, method, params_list)
+
+
+def _quantity(value) -> int:
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def parse_receipt(receipt: dict) -> Tuple[int, int, int]:
+    """``(block_number, gas_used, status)`` of a raw receipt.
+
+    Receipts off the wire are camelCase with hex quantities; the in-process
+    tester provider returns snake_case keys with ints.
+    """
+    return tuple(
+        _quantity(receipt[camel] if camel in receipt else receipt[snake])
+        for camel, snake in (
+            ("blockNumber", "block_number"),
+            ("gasUsed", "gas_used"),
+            ("status", "status"),
+        )
+    )
+
+
+def _release_nonces(db: Session, client, released) -> None:
+    """Gives back ``(address, first_nonce, count)`` ranges that no node holds.
+
+    A range is only rewound while it is still the tail of the sender's
+    counter; nonces other sends took since are never handed out twice.
+    """
+    for address, first_nonce, count in released:
+        try:
+            crud.release_nonce(
+                db,
+                address,
+                first_nonce,
+                lambda: get_pending_nonce(client, address),
+                count=count,
+            )
+        except Exception:
+            # The nonces stay reserved, which leaves a gap but never a clash.
+            db.rollback()
+            logger.exception("Could not release the nonces of %s", address)
+
+
+def send_payment_rules_batch(
+    db: Session, client, payment_rules: List[model.PaymentRule], gas_price: int
+) -> Dict[int, Tuple[Optional[model.Payment], Optional[str]]]:
+    """Signs one transfer per rule and broadcasts all of them in a single
+    ``eth_sendRawTransaction`` batch.
+
+    Payments are recorded with their signed hashes before the broadcast, so
+    nothing is sent without a history row. Returns ``(payment, error)`` per
+    payment rule id; the payment is still pending when the broadcast failed
+    and a worker will settle it.
+    """
+    # Nonce allocation commits and expires the ORM objects, so copy out what
+    # is needed up front instead of reloading every rule afterwards.
+    by_sender = OrderedDict()
+    for payment_rule in payment_rules:
+        by_sender.setdefault(payment_rule.payment_method.address, []).append(
+            (
+                payment_rule.id,
+                payment_rule.payment_method.id,
+                payment_rule.payment_method.private_key,
+                payment_rule.foundation.payment_address,
+                payment_rule.amount,
+            )
+        )
+
+    results = OrderedDict()
+    unsigned = []
+    allocated = []
+    try:
+        for address, transfers in by_sender.items():
+            prepared = []
+            for payment_rule_id, method_id, private_key, to_pubkey, amount in transfers:
+                try:
+                    params = transfer_params(
+                        client, address, to_pubkey, amount, gas_price
+                    )
+                except ValueError as exc:
+                    results[payment_rule_id] = (None, str(exc))
+                    continue
+                prepared.append((payment_rule_id, method_id, private_key, params))
+            if not prepared:
+                continue
+            first_nonce = crud.allocate_nonce(
+                db,
+                address,
+                lambda: get_pending_nonce(client, address),
+                count=len(prepared),
+            )
+            allocated.append((address, first_nonce, len(prepared)))
+            for offset, (payment_rule_id, method_id, private_key, params) in enumerate(
+                prepared
+            ):
+                params["nonce"] = first_nonce + offset
+                unsigned.append(
+                    (payment_rule_id, address, (method_id, private_key, params))
+                )
+
+        # Every sender's transactions are signed together, spread over the pool.
+        signed = signing.signing_pool.sign_many([job for _, _, job in unsigned])
+        payment_rcds = crud.create_signed_payments(
+            db,
+            [
+                (payment_rule_id, signed_tx.hash.hex(), job[2]["nonce"])
+                for (payment_rule_id, _, job), signed_tx in zip(unsigned, signed)
+            ],
+        )
+    except Exception:
+        # Nothing was broadcast, so the allocated nonces are free again.
+        db.rollback()
+        _release_nonces(db, client, allocated)
+        raise
+
+    try:
+        responses = batch_request(
+            client,
+            "eth_sendRawTransaction",
+            [[signed_tx.rawTransaction.hex()] for signed_tx in signed],
+        )
+    except Exception as exc:
+        logger.warning("Batch broadcast failed: %s", exc)
+        # Some transactions may have reached the node, so their nonces stay
+        # taken; workers send or confirm each payment by its hash.
+        crud.settle_signed_payments(
+            db, [], [], [(payment_rcd, str(exc)) for payment_rcd in payment_rcds]
+        )
+        for (payment_rule_id, _, _), payment_rcd in zip(unsigned, payment_rcds):
+            results[payment_rule_id] = (payment_rcd, str(exc))
+        return results
+
+    sent, failed = [], []
+    # Per sender, the rejected nonces after its last accepted one.
+    rejected_tails = OrderedDict()
+    for (payment_rule_id, address, job), payment_rcd, response in zip(
+        unsigned, payment_rcds, responses
+    ):
+        error = response.get("error")
+        if error:
+            message = error.get("message", str(error))
+            failed.append((payment_rcd, message))
+            results[payment_rule_id] = (None, message)
+            rejected_tails.setdefault(address, []).append(job[2]["nonce"])
+        else:
+            sent.append(payment_rcd)
+            results[payment_rule_id] = (payment_rcd, None)
+            rejected_tails.pop(address, None)
+    crud.settle_signed_payments(db, sent, failed, [])
+    _release_nonces(
+        db,
+        client,
+        [
+            (address, nonces[0], len(nonces))
+            for address, nonces in rejected_tails.items()
+        ],
+    )
+    return results
+
+
+def send_eth_with_managed_nonce(
+    db: Session,
+    client,
+    from_private_key: str,
+    from_address: str,
+    to_pubkey: str,
+    amount: Union[Decimal, float, str, int],
+    gas_price: Optional[int] = None,
+    on_signed: Optional[Callable[[str, int], None]] = None,
+    payment_method_id: Optional[int] = None,
+    nonce: Optional[int] = None,
+) -> str:
+    """Like ``send_eth_from_to_amount`` but takes the nonce from ``sender_nonces``
+    instead of asking the node, so concurrent sends from one sender don't collide.
+
+    Pass ``nonce`` to re-sign a transaction that already holds one;
+    ``on_signed`` gets the hash and the nonce used.
+    """
+
+    def node_nonce():
+        return get_pending_nonce(client, from_address)
+
+    if nonce is None:
+        nonce = crud.allocate_nonce(db, from_address, node_nonce)
+    signed_with_nonce = None
+    if on_signed is not None:
+
+        def signed_with_nonce(tx_hash):
+            on_signed(tx_hash, nonce)
+
+    try:
+        return send_eth_from_to_amount(
+            client,
+            from_private_key,
+            to_pubkey,
+            amount,
+            nonce=nonce,
+            gas_price=gas_price,
+            on_signed=signed_with_nonce,
+            payment_method_id=payment_method_id,
+        )
+    except ValueError:
+        # The node rejected the transaction, so the nonce was never used.
+        crud.release_nonce(db, from_address, nonce, node_nonce)
+        raise
+
+
+def node_gas_price(client) -> int:
+    return client.eth.gasPrice
+
+
+def percentile_gas_price(client, blocks: int, percentile: float) -> int:
+    """The given percentile of gas prices paid in the last ``blocks`` blocks."""
+    latest = client.eth.blockNumber
+    prices = []
+    for number in range(max(latest - blocks + 1, 0), latest + 1):
+        block = client.eth.getBlock(number, full_transactions=True)
+        prices.extend(tx["gasPrice"] for tx in block["transactions"])
+    if not prices:
+        return node_gas_price(client)
+    prices.sort()
+    index = min(len(prices) - 1, int(percentile / 100 * len(prices)))
+    return prices[index]
+
+
+class GasPriceOracle:
+    """Serves a cached gas price that a background thread refreshes every
+    ``interval`` seconds, so sends never wait on the node for a quote."""
+
+    def __init__(
+        self,
+        strategy: Callable[[], int],
+        interval: float,
+        cap: Optional[int] = None,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.strategy = strategy
+        self.interval = interval
+        self.cap = cap
+        self.timer = timer
+        self._price = None
+        self._updated_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self) -> int:
+        price = self.strategy()
+        if self.cap:
+            price = min(price, self.cap)
+        with self._lock:
+            self._price = price
+            self._updated_at = self.timer()
+        return price
+
+    def price(self) -> int:
+        self.start()
+        with self._lock:
+            price = self._price
+        if price is None:
+            price = self.refresh()
+        return price
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current quote was fetched, ``None`` before the first one."""
+        with self._lock:
+            if self._updated_at is None:
+                return None
+            return self.timer() - self._updated_at
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name="gas-price-oracle", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Gas price refresh failed, keeping previous quote")
+
+
+def gas_price_strategy(client, name: str) -> Callable[[], int]:
+    if name == "node":
+        return lambda: node_gas_price(client)
+    if name == "percentile":
+        return lambda: percentile_gas_price(
+            client, GAS_PRICE_BLOCKS, GAS_PRICE_PERCENTILE
+        )
+    if name == "fixed":
+        return lambda: GAS_PRICE_FIXED_WEI
+    raise ValueError(f"Unknown gas price strategy: {name}")
+
+
+# Node clients are built on first use (``init_clients`` or attribute access),
+# keeping web3 out of the import path of the API.
+_CLIENT_ATTRIBUTES = ("provider", "eth_client", "async_eth_client", "gas_price_oracle")
+_clients_lock = threading.Lock()
+
+
+def init_clients(client=None) -> None:
+    """Builds the node clients once; ``client`` replaces the configured nodes,
+    e.g. with an in-process tester."""
+    with _clients_lock:
+        if "eth_client" in globals():
+            return
+        from web3 import Web3
+
+        from api import rpc
+
+        async_eth_client = None
+        if client is None:
+            endpoints = rpc.make_endpoints(rpc.RPC_URLS)
+            client = Web3(rpc.MultiEndpointProvider(endpoints))
+            if ASYNC_RPC:
+                # Shares connection pools and latency stats with ``eth_client``.
+                async_eth_client = rpc.async_client(endpoints)
+        globals().update(
+            provider=client.provider,
+            eth_client=client,
+            async_eth_client=async_eth_client,
+            gas_price_oracle=GasPriceOracle(
+                gas_price_strategy(client, GAS_PRICE_STRATEGY),
+                interval=GAS_PRICE_REFRESH_INTERVAL,
+                cap=GAS_PRICE_CAP_WEI or None,
+            ),
+        )
+
+
+def __getattr__(name):
+    if name in _CLIENT_ATTRIBUTES:
+        init_clients()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def validate_address(address):
+    from web3 import Web3
+
     return Web3.isAddress(address)
\ No newline at end of file
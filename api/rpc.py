@@ -0,0 +1,372 @@
+"""Ethereum JSON-RPC transport over one or more nodes.
+
+Every node keeps its own pool of persistent connections with explicit
+timeouts. Calls go to the node with the lowest recent median latency and fail
+over to the next one on transport errors; writes only when the first node was
+never reached, since one that timed out may have accepted the transaction.
+Reads can also be hedged: when the first node has not answered within its own
+p95, the same read is sent to the runner-up and whichever answers first wins.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures import as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider, Web3
+from web3._utils.request import make_post_request
+from web3.eth import AsyncEth
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+
+RPC_URLS = [
+    url.strip()
+    for url in (
+        os.environ.get("RPC_URLS")
+        or os.environ.get("INFURA_URL")
+        or "http://localhost:8545"
+    ).split(",")
+    if url.strip()
+]
+RPC_TIMEOUT = float(os.environ.get("RPC_TIMEOUT", "10"))
+RPC_POOL_SIZE = int(os.environ.get("RPC_POOL_SIZE", "20"))
+RPC_HEDGE_READS = os.environ.get("RPC_HEDGE_READS", "0") == "1"
+# Hedge delay used until a node has enough samples for a meaningful p95.
+RPC_HEDGE_MIN_DELAY = float(os.environ.get("RPC_HEDGE_MIN_DELAY", "0.05"))
+RPC_LATENCY_WINDOW = int(os.environ.get("RPC_LATENCY_WINDOW", "200"))
+RPC_ERROR_COOLDOWN = float(os.environ.get("RPC_ERROR_COOLDOWN", "30"))
+
+# Calls with side effects; everything else may be sent to two nodes at once.
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+# Percentiles need this many samples before they replace RPC_HEDGE_MIN_DELAY.
+MIN_SAMPLES = 20
+
+TRANSPORT_ERRORS = (
+    requests.RequestException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def never_reached_node(exc: Exception) -> bool:
+    """Whether ``exc`` shows the request was never delivered, so a write may
+    safely be sent to another node."""
+    if isinstance(exc, (requests.ConnectTimeout, aiohttp.ClientConnectorError)):
+        return True
+    if isinstance(exc, requests.ConnectionError) and exc.args:
+        reason = getattr(exc.args[0], "reason", None)
+        return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+    return False
+
+
+def may_fail_over(method: str, exc: Exception) -> bool:
+    # A write that timed out may still have been accepted; sending it to
+    # another node would only get "already known" back.
+    return method not in WRITE_METHODS or never_reached_node(exc)
+
+
+class LatencyStats:
+    """Rolling latencies and error counts of one node."""
+
+    def __init__(self, window: int = RPC_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.failed_until = 0.0
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.requests += 1
+            if ok:
+                self._samples.append(seconds)
+            else:
+                self.errors += 1
+                self.failed_until = time.monotonic() + RPC_ERROR_COOLDOWN
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def hedge_delay(self) -> float:
+        if len(self._samples) < MIN_SAMPLES:
+            return RPC_HEDGE_MIN_DELAY
+        return max(RPC_HEDGE_MIN_DELAY, self.percentile(95))
+
+    def score(self):
+        """Sort key: nodes that failed recently go last, then by median latency."""
+        return (time.monotonic() < self.failed_until, self.percentile(50) or 0.0)
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 3),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 3),
+        }
+
+
+class Endpoint:
+    """One node with a pooled HTTP session for sync and async callers."""
+
+    def __init__(self, url: str, timeout: float, pool_size: int):
+        self.url = url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.stats = LatencyStats()
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.session = session
+        self.provider = HTTPProvider(
+            url, request_kwargs={"timeout": timeout}, session=session
+        )
+        self._async_session = None
+        self._async_loop = None
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_event_loop()
+        if self._async_session is None or self._async_loop is not loop:
+            self._async_loop = loop
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.provider.get_request_headers(),
+            )
+        return self._async_session
+
+    async def post_async(self, data: bytes) -> bytes:
+        async with self._get_async_session().post(self.url, data=data) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def close_async(self) -> None:
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+
+def post_batch(
+    provider: HTTPProvider,
+    method: str,
+    params_list: List[list],
+    session: Optional[requests.Session] = None,
+) -> List[dict]:
+    """Sends ``params_list`` to ``provider`` as a single JSON-RPC batch, over
+    ``session`` when given.
+
+    A node that refuses the whole batch answers with a single error object,
+    which is then reported for every call.
+    """
+    payload = [
+        {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        for request_id, params in enumerate(params_list)
+    ]
+    data = json.dumps(payload).encode()
+    if session is None:
+        raw_response = make_post_request(
+            provider.endpoint_uri, data, **provider.get_request_kwargs()
+        )
+    else:
+        response = session.post(
+            provider.endpoint_uri, data=data, **provider.get_request_kwargs()
+        )
+        response.raise_for_status()
+        raw_response = response.content
+    decoded = json.loads(raw_response)
+    if not isinstance(decoded, list):
+        error = decoded.get("error") if isinstance(decoded, dict) else None
+        error = error or {"message": "Malformed batch response: %r" % (decoded,)}
+        return [{"error": error} for _ in params_list]
+    responses = {
+        response["id"]: response for response in decoded if isinstance(response, dict)
+    }
+    return [
+        responses.get(request_id, {"error": {"message": "Missing batch response"}})
+        for request_id in range(len(params_list))
+    ]
+
+
+def make_endpoints(
+    urls: List[str], timeout: float = RPC_TIMEOUT, pool_size: int = RPC_POOL_SIZE
+) -> List[Endpoint]:
+    return [Endpoint(url, timeout, pool_size) for url in urls]
+
+
+class MultiEndpointProvider(JSONBaseProvider):
+    def __init__(self, endpoints: List[Endpoint], hedge_reads: bool = RPC_HEDGE_READS):
+        super().__init__()
+        self.endpoints = endpoints
+        self.hedge_reads = hedge_reads and len(endpoints) > 1
+        self._hedge_pool = None
+        if self.hedge_reads:
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=endpoints[0].pool_size, thread_name_prefix="rpc-hedge"
+            )
+
+    def ranked(self) -> List[Endpoint]:
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.stats.score())
+
+    def latency_stats(self) -> Dict[str, dict]:
+        return {endpoint.url: endpoint.stats.snapshot() for endpoint in self.endpoints}
+
+    def make_request(self, method, params):
+        return self._dispatch(
+            method, lambda endpoint: endpoint.provider.make_request(method, params)
+        )
+
+    def make_batch_request(self, method: str, params_list: List[list]) -> List[dict]:
+        return self._dispatch(
+            method,
+            lambda endpoint: post_batch(
+                endpoint.provider, method, params_list, endpoint.session
+            ),
+        )
+
+    def _call(self, endpoint: Endpoint, send: Callable[[Endpoint], Any]):
+        started = time.perf_counter()
+        try:
+            result = send(endpoint)
+        except Exception:
+            endpoint.stats.record(time.perf_counter() - started, ok=False)
+            raise
+        endpoint.stats.record(time.perf_counter() - started)
+        return result
+
+    def _dispatch(self, method: str, send: Callable[[Endpoint], Any]):
+        ranked = self.ranked()
+        if self.hedge_reads and method not in WRITE_METHODS:
+            return self._hedged(method, ranked, send)
+        return self._failover(method, ranked, send)
+
+    def _failover(
+        self, method: str, ranked: List[Endpoint], send: Callable[[Endpoint], Any]
+    ):
+        for endpoint in ranked[:-1]:
+            try:
+                return self._call(endpoint, send)
+            except TRANSPORT_ERRORS as exc:
+                if not may_fail_over(method, exc):
+                    raise
+                logger.warning("RPC node %s failed: %s", endpoint.url, exc)
+        return self._call(ranked[-1], send)
+
+    def _hedged(
+        self, method: str, ranked: List[Endpoint], send: Callable[[Endpoint], Any]
+    ):
+        primary, backup = ranked[0], ranked[1]
+        first = self._hedge_pool.submit(self._call, primary, send)
+        try:
+            return first.result(timeout=primary.stats.hedge_delay())
+        except FutureTimeout:
+            pass
+        except TRANSPORT_ERRORS as exc:
+            logger.warning("RPC node %s failed: %s", primary.url, exc)
+            return self._failover(method, ranked[1:], send)
+        second = self._hedge_pool.submit(self._call, backup, send)
+        error = None
+        for future in as_completed([first, second]):
+            try:
+                return future.result()
+            except TRANSPORT_ERRORS as exc:
+                error = exc
+        raise error
+
+
+class AsyncMultiEndpointProvider(AsyncJSONBaseProvider):
+    """Async counterpart of ``MultiEndpointProvider`` sharing its nodes' stats."""
+
+    def __init__(self, endpoints: List[Endpoint], hedge_reads: bool = RPC_HEDGE_READS):
+        super().__init__()
+        self.endpoints = endpoints
+        self.hedge_reads = hedge_reads and len(endpoints) > 1
+
+    def ranked(self) -> List[Endpoint]:
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.stats.score())
+
+    async def make_request(self, method, params):
+        data = self.encode_rpc_request(method, params)
+        ranked = self.ranked()
+        if self.hedge_reads and method not in WRITE_METHODS:
+            raw_response = await self._hedged(method, ranked, data)
+        else:
+            raw_response = await self._failover(method, ranked, data)
+        return self.decode_rpc_response(raw_response)
+
+    async def close(self) -> None:
+        for endpoint in self.endpoints:
+            await endpoint.close_async()
+
+    async def _call(self, endpoint: Endpoint, data: bytes) -> bytes:
+        started = time.perf_counter()
+        try:
+            result = await endpoint.post_async(data)
+        except Exception:
+            endpoint.stats.record(time.perf_counter() - started, ok=False)
+            raise
+        endpoint.stats.record(time.perf_counter() - started)
+        return result
+
+    async def _failover(
+        self, method: str, ranked: List[Endpoint], data: bytes
+    ) -> bytes:
+        for endpoint in ranked[:-1]:
+            try:
+                return await self._call(endpoint, data)
+            except TRANSPORT_ERRORS as exc:
+                if not may_fail_over(method, exc):
+                    raise
+                logger.warning("RPC node %s failed: %s", endpoint.url, exc)
+        return await self._call(ranked[-1], data)
+
+    async def _hedged(self, method: str, ranked: List[Endpoint], data: bytes) -> bytes:
+        primary, backup = ranked[0], ranked[1]
+        first = asyncio.ensure_future(self._call(primary, data))
+        done, _ = await asyncio.wait({first}, timeout=primary.stats.hedge_delay())
+        if done:
+            if first.exception() is None:
+                return first.result()
+            logger.warning("RPC node %s failed: %s", primary.url, first.exception())
+            return await self._failover(method, ranked[1:], data)
+        second = asyncio.ensure_future(self._call(backup, data))
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+
+def async_client(
+    endpoints: List[Endpoint], hedge_reads: bool = RPC_HEDGE_READS
+) -> Web3:
+    """``Web3`` with only the async ``eth`` module, for use from async endpoints."""
+    return Web3(
+        AsyncMultiEndpointProvider(endpoints, hedge_reads),
+        modules={"eth": (AsyncEth,)},
+        middlewares=[],
+    )
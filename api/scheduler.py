@@ -0,0 +1,35 @@
+import logging
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+from api import crud
+from api.worker import PollingPool
+
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+SCHEDULER_POLL_INTERVAL = float(os.environ.get("SCHEDULER_POLL_INTERVAL", "5"))
+SCHEDULER_BATCH = int(os.environ.get("SCHEDULER_BATCH", "500"))
+
+
+def run_once(db: Session, limit: int = SCHEDULER_BATCH) -> int:
+    """Queues payments for one batch of due rules, returning how many fired."""
+    return len(crud.enqueue_due_payment_rules(db, limit))
+
+
+scheduler = PollingPool(
+    "payment-scheduler",
+    run_once,
+    size=1 if SCHEDULER_ENABLED else 0,
+    poll_interval=SCHEDULER_POLL_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    scheduler.size = 1
+    scheduler.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -1,7 +1,7 @@
 import datetime as dt
 from decimal import Decimal
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
 import pydantic
 
@@ -71,24 +71,59 @@ class RequestPaymentRule(pydantic.BaseModel):
     payment_method_id: int
     foundation_id: int
     amount: Decimal
+    interval_seconds: Optional[pydantic.conint(ge=60)] = None
 
 
 class ResponsePaymentRule(RequestPaymentRule):
     id: int
+    next_run_at: Optional[dt.datetime]
 
     class Config:
         orm_mode = True
 
 
+class PaymentStatus(str, Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
 class ResponsePayment(pydantic.BaseModel):
     id: int
     payment_rule_id: int
     transaction_hash: Optional[str]
     created_at: dt.datetime
+    status: PaymentStatus
+    attempts: int
+    error: Optional[str]
+    block_number: Optional[int]
+    gas_used: Optional[int]
+    receipt_status: Optional[int]
+    confirmed_at: Optional[dt.datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class ResponseDonationStats(pydantic.BaseModel):
+    total_amount: Decimal = Decimal(0)
+    payment_count: int = 0
+    last_payment_at: Optional[dt.datetime] = None
 
     class Config:
         orm_mode = True
 
 
+class RequestTriggerBatch(pydantic.BaseModel):
+    payment_rule_ids: pydantic.conlist(int, min_items=1, max_items=1000)
+
+
+class ResponseTriggerResult(pydantic.BaseModel):
+    payment_rule_id: int
+    success: bool
+    payment: Optional[ResponsePayment]
+    error: Optional[str]
+
+
 class ResponseSuccess(pydantic.BaseModel):
     success: bool
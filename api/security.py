@@ -1,17 +1,112 @@
+import datetime
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from secrets import token_hex
+from typing import Optional, Tuple
 
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+HASH_POOL_SIZE = int(os.environ.get("HASH_POOL_SIZE", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.environ.get("HASH_QUEUE_SIZE", str(HASH_POOL_SIZE * 4)))
+# Seconds a token stays valid after it is issued; 0 keeps it until logout.
+TOKEN_TTL = float(os.environ.get("TOKEN_TTL", str(30 * 24 * 3600)))
+# Issuing a token beyond this many active ones deactivates the oldest.
+MAX_ACTIVE_TOKENS = int(os.environ.get("MAX_ACTIVE_TOKENS", "10"))
 
+# min_rounds makes verify_and_update rehash passwords stored with fewer rounds.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
 
-def hash_password(password: str) -> str:
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class HashPool:
+    """Runs bcrypt in worker processes, admitting at most ``queue_size`` jobs.
+
+    Jobs beyond the limit fail fast with ``HashingOverloaded`` instead of
+    parking more request threads behind the pool.
+    """
+
+    def __init__(self, max_workers: int, queue_size: int):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.max_workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingOverloaded()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hash_pool = HashPool(max_workers=HASH_POOL_SIZE, queue_size=HASH_QUEUE_SIZE)
+
+
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+def _verify_and_update(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def hash_password(password: str) -> str:
+    return hash_pool.run(_hash, password)
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Returns whether the password matches and, if so, a replacement hash
+    when the stored one uses outdated settings."""
+    return hash_pool.run(_verify_and_update, plain_password, hashed_password)
 
 
 def create_access_token():
     return token_hex(32)
+
+
+def token_issued_after() -> Optional[datetime.datetime]:
+    """Oldest ``created_at`` a token may have and still be valid."""
+    if not TOKEN_TTL:
+        return None
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=TOKEN_TTL)
+
+
+def token_expired(created_at: datetime.datetime) -> bool:
+    issued_after = token_issued_after()
+    return issued_after is not None and created_at < issued_after
@@ -0,0 +1,172 @@
+"""Transaction signing off the request and worker threads.
+
+Deriving an account from a stored key and ECDSA signing are pure Python CPU
+work, so large batches are signed in worker processes; smaller ones, whose
+signing costs less than shipping them to a process, are signed inline. Every
+process keeps the accounts it derived in a ``SignerRegistry`` keyed by payment method id.
+Deleting a payment method evicts its account everywhere: locally, in the
+signing processes through the eviction log sent along with each job, and in
+other API processes through ``cache_invalidations``.
+"""
+import math
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from api.cache import SIGNER_CHANNEL, invalidation_listener
+
+SIGNER_CACHE_SIZE = int(os.environ.get("SIGNER_CACHE_SIZE", "1024"))
+SIGNING_WORKERS = int(os.environ.get("SIGNING_WORKERS", "0"))
+# Batches smaller than this are signed inline even when the pool is enabled.
+SIGNING_POOL_MIN_BATCH = int(os.environ.get("SIGNING_POOL_MIN_BATCH", "64"))
+# Evictions remembered for signing processes that have not picked up a job since.
+EVICTION_LOG_SIZE = 256
+
+# ``(payment_method_id, private_key, transaction params)``; the id may be None
+# for keys that do not belong to a stored payment method.
+SigningJob = Tuple[Optional[int], str, dict]
+
+
+class SignerRegistry:
+    """LRU of ready-to-sign accounts keyed by payment method id.
+
+    Entries remember the key they were derived from, so an id that now stands
+    for another key is derived again rather than signing with the old account.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._accounts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def account(self, payment_method_id: Optional[int], private_key: str):
+        from eth_account import Account
+
+        if payment_method_id is None:
+            return Account.from_key(private_key)
+        with self._lock:
+            cached = self._accounts.get(payment_method_id)
+            if cached is not None and cached[0] == private_key:
+                self._accounts.move_to_end(payment_method_id)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        account = Account.from_key(private_key)
+        with self._lock:
+            self._accounts[payment_method_id] = (private_key, account)
+            self._accounts.move_to_end(payment_method_id)
+            while len(self._accounts) > self.maxsize:
+                self._accounts.popitem(last=False)
+        return account
+
+    def evict(self, payment_method_id: int) -> None:
+        with self._lock:
+            self._accounts.pop(payment_method_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._accounts.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._accounts),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# One per process: the API's own, and one in each signing process.
+signer_registry = SignerRegistry(SIGNER_CACHE_SIZE)
+_applied_eviction = 0
+
+
+def _apply_evictions(evictions: Tuple[Tuple[int, int], ...]) -> None:
+    global _applied_eviction
+    if not evictions:
+        return
+    if evictions[0][0] > _applied_eviction + 1:
+        # Evictions were dropped from the log before this process saw them.
+        signer_registry.clear()
+    else:
+        for sequence, payment_method_id in evictions:
+            if sequence > _applied_eviction:
+                signer_registry.evict(payment_method_id)
+    _applied_eviction = max(_applied_eviction, evictions[-1][0])
+
+
+def _sign(jobs: List[SigningJob]) -> list:
+    return [
+        signer_registry.account(payment_method_id, private_key).sign_transaction(params)
+        for payment_method_id, private_key, params in jobs
+    ]
+
+
+def _sign_in_worker(evictions: Tuple[Tuple[int, int], ...], jobs: List[SigningJob]):
+    _apply_evictions(evictions)
+    return _sign(jobs)
+
+
+class SigningPool:
+    """Signs transactions in ``max_workers`` processes, or inline when zero.
+
+    A batch of at least ``min_batch`` jobs is split into one chunk per process
+    so large trigger runs sign in parallel; anything smaller is signed inline.
+    """
+
+    def __init__(self, max_workers: int, min_batch: int = SIGNING_POOL_MIN_BATCH):
+        self.max_workers = max_workers
+        self.min_batch = min_batch
+        self._executor = None
+        self._evictions = deque(maxlen=EVICTION_LOG_SIZE)
+        self._eviction_sequence = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def sign_many(self, jobs: List[SigningJob]) -> list:
+        """``SignedTransaction`` per job, in order."""
+        if not jobs:
+            return []
+        if self.max_workers <= 0 or len(jobs) < self.min_batch:
+            return _sign(jobs)
+        executor = self._get_executor()
+        with self._lock:
+            evictions = tuple(self._evictions)
+        size = math.ceil(len(jobs) / self.max_workers)
+        futures = [
+            executor.submit(_sign_in_worker, evictions, jobs[start : start + size])
+            for start in range(0, len(jobs), size)
+        ]
+        return [signed for future in futures for signed in future.result()]
+
+    def sign(self, payment_method_id: Optional[int], private_key: str, params: dict):
+        return self.sign_many([(payment_method_id, private_key, params)])[0]
+
+    def evict(self, payment_method_id: int) -> None:
+        signer_registry.evict(payment_method_id)
+        with self._lock:
+            self._eviction_sequence += 1
+            self._evictions.append((self._eviction_sequence, payment_method_id))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+signing_pool = SigningPool(max_workers=SIGNING_WORKERS)
+
+invalidation_listener.subscribe(
+    SIGNER_CHANNEL, lambda key: signing_pool.evict(int(key))
+)
@@ -0,0 +1,21 @@
+import logging
+
+from api import crud
+from api.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild() -> None:
+    """Backfills or repairs the donation totals from the payment history."""
+    db = SessionLocal()
+    try:
+        crud.rebuild_donation_stats(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    rebuild()
+    logger.info("Donation stats rebuilt")
@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+from typing import Callable, List
+
+from sqlalchemy.orm import Session
+
+from api import crud, model, payment
+from api.database import SessionLocal
+
+PAYMENT_WORKERS = int(os.environ.get("PAYMENT_WORKERS", "2"))
+PAYMENT_POLL_INTERVAL = float(os.environ.get("PAYMENT_POLL_INTERVAL", "1"))
+PAYMENT_CLAIM_BATCH = int(os.environ.get("PAYMENT_CLAIM_BATCH", "10"))
+PAYMENT_CLAIM_TIMEOUT = float(os.environ.get("PAYMENT_CLAIM_TIMEOUT", "300"))
+PAYMENT_MAX_ATTEMPTS = int(os.environ.get("PAYMENT_MAX_ATTEMPTS", "5"))
+PAYMENT_RETRY_BACKOFF = float(os.environ.get("PAYMENT_RETRY_BACKOFF", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def process_payment(db: Session, client, payment_rcd: model.Payment) -> None:
+    nonce = None
+    if payment_rcd.transaction_hash:
+        # A previous attempt signed this payment but died before recording the
+        # outcome; only send again if the node never saw the transaction.
+        if payment.is_transaction_known(client, payment_rcd.transaction_hash):
+            crud.mark_payment_sent(db, payment_rcd, payment_rcd.transaction_hash)
+            return
+        # Re-sign with the nonce it already holds while the node still expects
+        # it; other sends may have taken the nonces after it in the meantime.
+        address = payment_rcd.payment_rule.payment_method.address
+        pending = payment.get_pending_nonce(client, address)
+        if payment_rcd.nonce is not None and payment_rcd.nonce >= pending:
+            nonce = payment_rcd.nonce
+
+    payment_rule_rcd = payment_rcd.payment_rule
+    try:
+        transaction_hash = payment.send_eth_with_managed_nonce(
+            db,
+            client=client,
+            from_private_key=payment_rule_rcd.payment_method.private_key,
+            from_address=payment_rule_rcd.payment_method.address,
+            to_pubkey=payment_rule_rcd.foundation.payment_address,
+            amount=payment_rule_rcd.amount,
+            gas_price=payment.gas_price_oracle.price(),
+            on_signed=lambda tx_hash, nonce: crud.record_payment_transaction(
+                db, payment_rcd, tx_hash, nonce
+            ),
+            payment_method_id=payment_rule_rcd.payment_method_id,
+            nonce=nonce,
+        )
+    except Exception as exc:
+        logger.warning("Payment %s failed: %s", payment_rcd.id, exc)
+        db.rollback()
+        crud.retry_payment(
+            db,
+            payment_rcd,
+            str(exc),
+            max_attempts=PAYMENT_MAX_ATTEMPTS,
+            backoff=PAYMENT_RETRY_BACKOFF,
+            # ValueError means the node rejected it, so nothing was broadcast.
+            clear_transaction=isinstance(exc, ValueError),
+        )
+        return
+    crud.mark_payment_sent(db, payment_rcd, transaction_hash)
+
+
+def run_once(db: Session, client, limit: int = PAYMENT_CLAIM_BATCH) -> int:
+    """Claims and processes one batch of due payments, returning how many."""
+    payment_rcds = crud.claim_payments(db, limit, PAYMENT_CLAIM_TIMEOUT)
+    for payment_rcd in payment_rcds:
+        process_payment(db, client, payment_rcd)
+    return len(payment_rcds)
+
+
+class PollingPool:
+    """Threads that repeatedly call ``task`` with a fresh session, sleeping
+    ``poll_interval`` seconds whenever it reports no work done.
+
+    Pools coordinate only through the database, so any number of them may
+    run across processes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        task: Callable[[Session], int],
+        size: int,
+        poll_interval: float,
+    ):
+        self.name = name
+        self.task = task
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        for index in range(self.size):
+            thread = threading.Thread(
+                target=self._run, name=f"{self.name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                processed = self.task(db)
+            except Exception:
+                logger.exception("%s iteration failed", self.name)
+                processed = 0
+            finally:
+                db.close()
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+
+worker_pool = PollingPool(
+    "payment-worker",
+    lambda db: run_once(db, payment.eth_client),
+    size=PAYMENT_WORKERS,
+    poll_interval=PAYMENT_POLL_INTERVAL,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    worker_pool.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        worker_pool.stop()
@@ -0,0 +1,96 @@
+"""Throughput of the sync and async data paths at high connection counts.
+
+Starts one server per mode (``ASYNC_DB=0`` and ``ASYNC_DB=1``) on the same
+migrated database and hammers ``GET /payments/methods`` from many connections::
+
+    alembic upgrade head
+    python benchmarks/async_vs_sync.py --connections 32 128 512
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from login_storm import create_user, report
+
+
+def start_server(port, async_db):
+    env = dict(os.environ, ASYNC_DB="1" if async_db else "0", PAYMENT_WORKERS="0")
+    env.setdefault("SCHEDULER_ENABLED", "0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.endpoint:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = "http://127.0.0.1:%d" % port
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url + "/foundations", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server on port %d did not start" % port)
+
+
+def hammer(url, token, deadline, samples, errors):
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            response = session.get(
+                url + "/payments/methods", headers={"Authorization": token}
+            )
+            response.raise_for_status()
+        except requests.RequestException:
+            errors.append(1)
+            continue
+        samples.append((time.monotonic() - started) * 1000)
+
+
+def run(url, token, connections, duration):
+    samples, errors = [], []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(target=hammer, args=(url, token, deadline, samples, errors))
+        for _ in range(connections)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[32, 128, 512])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    for async_db in (False, True):
+        server, url = start_server(args.port, async_db)
+        try:
+            _, token = create_user(url)
+            for connections in args.connections:
+                samples, errors = run(url, token, connections, args.duration)
+                label = "%s c=%d" % ("async" if async_db else "sync", connections)
+                report(label, samples)
+                print(
+                    "%-12s %.0f req/s, %d errors"
+                    % ("", len(samples) / args.duration, len(errors))
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""End-to-end throughput and latency of every API endpoint.
+
+Seeds a scratch SQLite database (or uses ``--database-url``), starts the API in a
+subprocess whose web3 calls go to an in-process ``EthereumTesterProvider``, and
+drives each endpoint from ``--concurrency`` connections. Results are written as
+JSON and compared against a stored baseline; the run fails on a regression::
+
+    python benchmarks/e2e.py --concurrency 8 --duration 3 --output e2e.json
+    python benchmarks/e2e.py --update-baseline
+
+Against Postgres, seed first with ``benchmarks/seed.py`` and pass the same URL.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "e2e_baseline.json")
+
+# Server settings for the run; anything already in the environment wins.
+SERVER_ENV = {
+    "BCRYPT_ROUNDS": "4",
+    "PAYMENT_WORKERS": "1",
+    "SCHEDULER_ENABLED": "0",
+    "CONFIRMER_ENABLED": "0",
+    "COMPACTOR_ENABLED": "0",
+    # Measure the routes, not the per-user trigger rate limits.
+    "TRIGGER_RATE": "1000000",
+    "BATCH_TRIGGER_RATE": "1000000",
+}
+
+SCENARIOS = {}
+
+
+def scenario(method, route, expect=200):
+    """Registers a request generator: it yields ``(path, request kwargs)`` once,
+    receives the response and may then clean up, untimed."""
+
+    def register(build):
+        SCENARIOS["%s %s" % (method, route)] = (method, build, expect)
+        return build
+
+    return register
+
+
+class Context:
+    """Per-connection state: one seeded user, their methods and rules."""
+
+    def __init__(self, url, user_id):
+        import requests
+
+        from seed import PASSWORD, TESTER_KEYS, TOKEN, USER_NAME
+
+        self.url = url
+        self.session = requests.Session()
+        self.user_name = USER_NAME % user_id
+        self.password = PASSWORD
+        self.private_key = TESTER_KEYS[user_id % len(TESTER_KEYS)]
+        self.headers = {"Authorization": TOKEN % user_id}
+        self.admin_headers = {"Authorization": TOKEN % 1}
+        self.method_ids = [row["id"] for row in self.get("/payments/methods")]
+        rules = self.get("/payments/rules", params={"limit": 100})
+        self.rule_ids = [row["id"] for row in rules]
+        self.foundation_ids = [
+            row["id"] for row in self.get("/foundations", params={"limit": 100})
+        ]
+        if not (self.method_ids and self.rule_ids and self.foundation_ids):
+            raise RuntimeError("user %d has no seeded data" % user_id)
+        self.counter = 0
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("headers", self.headers)
+        response = self.session.request(method, self.url + path, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs).json()
+
+    def pick(self, values):
+        self.counter += 1
+        return values[self.counter % len(values)]
+
+
+@scenario("POST", "/user/create")
+def create_user(ctx):
+    yield "/user/create", {"json": {"name": uuid.uuid4().hex, "password": "pw"}}
+
+
+@scenario("POST", "/user/token")
+def create_user_token(ctx):
+    credentials = {"name": ctx.user_name, "password": ctx.password}
+    response = yield "/user/token", {"json": credentials}
+    token = response.json()["token"]
+    ctx.request("POST", "/user/logout", headers={"Authorization": token})
+
+
+@scenario("POST", "/user/logout")
+def logout_user(ctx):
+    credentials = {"name": ctx.user_name, "password": ctx.password}
+    token = ctx.request("POST", "/user/token", json=credentials).json()["token"]
+    yield "/user/logout", {"headers": {"Authorization": token}}
+
+
+@scenario("GET", "/user/stats")
+def get_user_stats(ctx):
+    yield "/user/stats", {}
+
+
+@scenario("GET", "/payments/methods")
+def get_payment_methods(ctx):
+    yield "/payments/methods", {}
+
+
+@scenario("POST", "/payments/methods")
+def create_payment_method(ctx):
+    body = {"type": "ETH", "private_key": ctx.private_key}
+    response = yield "/payments/methods", {"json": body}
+    ctx.request("DELETE", "/payments/methods/%d" % response.json()["id"])
+
+
+@scenario("GET", "/payments/methods/{payment_method_id}")
+def get_payment_method(ctx):
+    yield "/payments/methods/%d" % ctx.pick(ctx.method_ids), {}
+
+
+@scenario("DELETE", "/payments/methods/{payment_method_id}")
+def delete_payment_method(ctx):
+    body = {"type": "ETH", "private_key": ctx.private_key}
+    payment_method = ctx.request("POST", "/payments/methods", json=body).json()
+    yield "/payments/methods/%d" % payment_method["id"], {}
+
+
+@scenario("GET", "/payments/rules")
+def get_payment_rules(ctx):
+    yield "/payments/rules", {"params": {"limit": 50}}
+
+
+def payment_rule_body(ctx):
+    return {
+        "payment_method_id": ctx.pick(ctx.method_ids),
+        "foundation_id": ctx.pick(ctx.foundation_ids),
+        "amount": "0.001",
+    }
+
+
+@scenario("POST", "/payments/rules")
+def create_payment_rule(ctx):
+    response = yield "/payments/rules", {"json": payment_rule_body(ctx)}
+    ctx.request("DELETE", "/payments/rules/%d" % response.json()["id"])
+
+
+@scenario("GET", "/payments/rules/{payment_rule_id}")
+def get_payment_rule(ctx):
+    yield "/payments/rules/%d" % ctx.pick(ctx.rule_ids), {}
+
+
+@scenario("DELETE", "/payments/rules/{payment_rule_id}")
+def delete_payment_rule(ctx):
+    rule = ctx.request("POST", "/payments/rules", json=payment_rule_body(ctx)).json()
+    yield "/payments/rules/%d" % rule["id"], {}
+
+
+@scenario("POST", "/payments/rules/{payment_rule_id}/trigger", expect=202)
+def trigger_payment_rule(ctx):
+    yield "/payments/rules/%d/trigger" % ctx.pick(ctx.rule_ids), {}
+
+
+@scenario("POST", "/payments/rules/trigger")
+def trigger_payment_rules(ctx):
+    yield "/payments/rules/trigger", {"json": {"payment_rule_ids": ctx.rule_ids[:5]}}
+
+
+@scenario("GET", "/payments/history")
+def get_payment_history(ctx):
+    yield "/payments/history", {"params": {"limit": 50}}
+
+
+def export_params(export_format):
+    created_from = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    return {"format": export_format, "created_from": created_from.isoformat()}
+
+
+@scenario("GET", "/payments/history/export")
+def export_payment_history(ctx):
+    yield "/payments/history/export", {"params": export_params("ndjson")}
+
+
+@scenario("GET", "/admin/payments/history/export")
+def export_all_payment_history(ctx):
+    yield "/admin/payments/history/export", {
+        "params": export_params("csv"),
+        "headers": ctx.admin_headers,
+    }
+
+
+@scenario("GET", "/foundations")
+def get_foundations(ctx):
+    yield "/foundations", {"params": {"limit": 50}}
+
+
+@scenario("GET", "/foundations/{foundation_id}/stats")
+def get_foundation_stats(ctx):
+    yield "/foundations/%d/stats" % ctx.pick(ctx.foundation_ids), {}
+
+
+@scenario("POST", "/foundations")
+def create_foundation(ctx):
+    from eth_utils import to_checksum_address
+
+    body = {
+        "name": "bench",
+        "description": "bench",
+        "payment_address": to_checksum_address("0x%040x" % uuid.uuid4().int),
+    }
+    yield "/foundations", {"json": body}
+
+
+@scenario("GET", "/metrics/admission")
+def get_admission_metrics(ctx):
+    yield "/metrics/admission", {"headers": ctx.admin_headers}
+
+
+def uncovered_routes():
+    from api.endpoint import router
+
+    routes = {
+        "%s %s" % (method, route.path)
+        for route in router.routes
+        for method in route.methods
+    }
+    return sorted(routes - set(SCENARIOS))
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run_scenario(name, contexts, duration):
+    method, build, expect = SCENARIOS[name]
+    samples, errors, rejected = [], [], []
+    deadline = time.monotonic() + duration
+
+    def drive(ctx):
+        while time.monotonic() < deadline:
+            try:
+                steps = build(ctx)
+                path, kwargs = next(steps)
+                kwargs.setdefault("headers", ctx.headers)
+                started = time.perf_counter()
+                response = ctx.session.request(method, ctx.url + path, **kwargs)
+                elapsed = time.perf_counter() - started
+                if response.status_code in (429, 503):
+                    rejected.append(response.status_code)
+                    continue
+                if response.status_code != expect:
+                    errors.append("HTTP %d: %s" % (response.status_code, response.text))
+                    continue
+                samples.append(elapsed * 1000)
+                try:
+                    steps.send(response)
+                except StopIteration:
+                    pass
+            except Exception as exc:
+                status = getattr(getattr(exc, "response", None), "status_code", None)
+                if status in (429, 503):
+                    rejected.append(status)
+                else:
+                    errors.append(repr(exc))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=drive, args=(ctx,)) for ctx in contexts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    samples.sort()
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        # Load shed by the server (429/503), reported apart from failures.
+        "rejected": len(rejected),
+        "first_error": errors[0][:200] if errors else None,
+        "rps": round(len(samples) / elapsed, 1),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+    }
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """Descriptions of every scenario that got slower, lost throughput or
+    started failing relative to ``baseline``, or that the baseline does not
+    cover."""
+    regressions = []
+    server_env = results["meta"]["server_env"]
+    if baseline["meta"].get("server_env") != server_env:
+        regressions.append(
+            "server env %s differs from the baseline's %s"
+            % (server_env, baseline["meta"].get("server_env"))
+        )
+    for name in sorted(set(results["scenarios"]) - set(baseline["scenarios"])):
+        regressions.append("%s: no baseline entry, run --update-baseline" % name)
+    for name, base in sorted(baseline["scenarios"].items()):
+        current = results["scenarios"].get(name)
+        if current is None:
+            regressions.append("%s: missing from this run" % name)
+            continue
+        if current["errors"] and not base["errors"]:
+            regressions.append("%s: %d errors" % (name, current["errors"]))
+        if current["p95_ms"] is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance) + slack_ms:
+            regressions.append(
+                "%s: p95 %.1fms vs %.1fms" % (name, current["p95_ms"], base["p95_ms"])
+            )
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(
+                "%s: %.1f req/s vs %.1f" % (name, current["rps"], base["rps"])
+            )
+    return regressions
+
+
+def serve(port):
+    """Runs the API with web3 pointed at an in-process chain."""
+    import uvicorn
+    from web3 import EthereumTesterProvider, Web3
+
+    from api import payment
+    from api.endpoint import app
+
+    class LockedTesterProvider(EthereumTesterProvider):
+        # eth-tester is not thread-safe; requests and workers share one chain.
+        _lock = threading.Lock()
+
+        def make_request(self, method, params):
+            with self._lock:
+                return super().make_request(method, params)
+
+    payment.init_clients(Web3(LockedTesterProvider()))
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_server(port, database_url):
+    import requests
+
+    env = dict(SERVER_ENV)
+    env.update(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--port", str(port)],
+        cwd=ROOT,
+        env=env,
+    )
+    url = "http://127.0.0.1:%d" % port
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited with %d" % server.returncode)
+        try:
+            requests.get(url + "/foundations", timeout=1)
+            return server, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("server on port %d did not start" % port)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            universal_newlines=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command")
+    serve_parser = subcommands.add_parser("serve", help=serve.__doc__)
+    serve_parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--database-url")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--only", nargs="*", help="scenario names to run")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--slack-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        return serve(args.port)
+
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "e2e.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("BCRYPT_ROUNDS", SERVER_ENV["BCRYPT_ROUNDS"])
+    if args.database_url is None:
+        import seed
+
+        seed.main(["--users", str(args.users), "--history", str(args.history)])
+
+    missing = uncovered_routes()
+    if missing:
+        print("no scenario for: " + ", ".join(missing))
+        return 1
+
+    server, url = start_server(args.port, database_url)
+    try:
+        contexts = [
+            Context(url, index % args.users + 1) for index in range(args.concurrency)
+        ]
+        results = {
+            "meta": {
+                "revision": git_revision(),
+                "started_at": datetime.datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "database": database_url.split(":", 1)[0],
+                "users": args.users,
+                "history": args.history,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "server_env": {
+                    key: os.environ.get(key, SERVER_ENV[key]) for key in SERVER_ENV
+                },
+            },
+            "scenarios": {},
+        }
+        for name in args.only or sorted(SCENARIOS):
+            stats = run_scenario(name, contexts, args.duration)
+            results["scenarios"][name] = stats
+            print(
+                "%-48s %6d req %7.1f/s  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms"
+                "  %d errors  %d rejected"
+                % (
+                    name,
+                    stats["requests"],
+                    stats["rps"],
+                    stats["p50_ms"] or 0,
+                    stats["p95_ms"] or 0,
+                    stats["p99_ms"] or 0,
+                    stats["errors"],
+                    stats["rejected"],
+                )
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.update_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+            output.write("\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if args.only:
+        baseline["scenarios"] = {
+            name: stats
+            for name, stats in baseline["scenarios"].items()
+            if name in args.only
+        }
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+    for regression in regressions:
+        print("REGRESSION:", regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
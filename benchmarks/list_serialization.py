@@ -0,0 +1,113 @@
+"""Default vs ``FAST_SERIALIZATION`` cost of the list endpoints at 10k rows.
+
+Runs in-process against a scratch SQLite database::
+
+    python benchmarks/list_serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+os.environ.setdefault("MAX_PAGE_SIZE", "100000")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from api import model, serialization  # noqa: E402
+from api.cache import foundations_cache  # noqa: E402
+from api.database import SessionLocal, engine  # noqa: E402
+from api.endpoint import app  # noqa: E402
+
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def populate(client, rows):
+    token = client.post("/user/create", json={"name": "bench", "password": "pw"})
+    headers = {"Authorization": token.json()["token"]}
+    payment_method = client.post(
+        "/payments/methods",
+        json={"type": "ETH", "private_key": "0x" + "00" * 31 + "01"},
+        headers=headers,
+    ).json()
+    now = datetime.datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(
+            model.Foundation.__table__.insert(),
+            [
+                {"name": "f%d" % i, "description": "d", "payment_address": RECIPIENT}
+                for i in range(rows)
+            ],
+        )
+        connection.execute(
+            model.PaymentRule.__table__.insert(),
+            [
+                {
+                    "payment_method_id": payment_method["id"],
+                    "foundation_id": i + 1,
+                    "amount": "0.%d" % (i + 1),
+                }
+                for i in range(rows)
+            ],
+        )
+        connection.execute(
+            model.Payment.__table__.insert(),
+            [
+                {
+                    "payment_rule_id": i + 1,
+                    "transaction_hash": "0x%064x" % i,
+                    "created_at": now - datetime.timedelta(seconds=i),
+                    "status": "sent",
+                    "attempts": 0,
+                }
+                for i in range(rows)
+            ],
+        )
+    return headers
+
+
+def measure(client, url, params, headers, repeat):
+    samples = []
+    for _ in range(repeat):
+        foundations_cache.clear()
+        started = time.perf_counter()
+        response = client.get(url, params=params, headers=headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    return statistics.median(samples), len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    model.Base.metadata.drop_all(bind=engine)
+    model.Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+    headers = populate(client, args.rows)
+    params = {"limit": args.rows}
+
+    for url in ("/foundations", "/payments/rules", "/payments/history"):
+        results = []
+        for fast in (False, True):
+            serialization.FAST_SERIALIZATION = fast
+            results.append(measure(client, url, params, headers, args.repeat))
+        (default_ms, size), (fast_ms, _) = results
+        print(
+            "%-20s rows=%-6d %6d bytes  default=%8.1fms  fast=%8.1fms  %.1fx"
+            % (url, args.rows, size, default_ms, fast_ms, default_ms / fast_ms)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Latency of ``GET /payments/methods`` while ``POST /user/token`` is flooded.
+
+Run against a live server, e.g.::
+
+    uvicorn api.endpoint:app --port 8000 &
+    python benchmarks/login_storm.py --url http://127.0.0.1:8000
+"""
+import argparse
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def create_user(url):
+    credentials = {"name": "bench-%s" % uuid.uuid4().hex, "password": "bench"}
+    response = requests.post(url + "/user/create", json=credentials)
+    response.raise_for_status()
+    return credentials, response.json()["token"]
+
+
+def measure_reads(url, token, duration, samples):
+    session = requests.Session()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        session.get(url + "/payments/methods", headers={"Authorization": token})
+        samples.append((time.monotonic() - started) * 1000)
+
+
+def storm(url, credentials, stop, statuses):
+    session = requests.Session()
+    while not stop.is_set():
+        response = session.post(url + "/user/token", json=credentials)
+        statuses[response.status_code] += 1
+
+
+def report(label, samples):
+    print(
+        "%-12s n=%-6d p50=%7.1fms p95=%7.1fms p99=%7.1fms"
+        % (
+            label,
+            len(samples),
+            percentile(samples, 50),
+            percentile(samples, 95),
+            percentile(samples, 99),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=64, help="concurrent logins")
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    credentials, token = create_user(args.url)
+
+    idle = []
+    measure_reads(args.url, token, args.duration, idle)
+    report("idle", idle)
+
+    stop = threading.Event()
+    statuses = Counter()
+    threads = [
+        threading.Thread(target=storm, args=(args.url, credentials, stop, statuses))
+        for _ in range(args.logins)
+    ]
+    for thread in threads:
+        thread.start()
+    loaded = []
+    try:
+        measure_reads(args.url, token, args.duration, loaded)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    report("login storm", loaded)
+    print("login responses: %s" % dict(statuses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Fills an empty database with synthetic users, payment methods, rules and history.
+
+Migrates ``DATABASE_URL`` to the latest revision first. Every user ``n`` gets the
+active token ``bench-token-n`` and the password ``bench``, and user 1 is an admin;
+payment methods use the keys ``EthereumTesterProvider`` funds::
+
+    DATABASE_URL=sqlite:///bench.db python benchmarks/seed.py --history 1000000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from eth_account import Account  # noqa: E402
+from eth_utils import to_checksum_address  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from api import crud, migrations, model, security  # noqa: E402
+from api.database import SessionLocal, engine  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+PASSWORD = "bench"
+TOKEN = "bench-token-%d"
+USER_NAME = "bench-user-%d"
+TESTER_KEYS = ["0x%064x" % index for index in range(1, 11)]
+CHUNK = 20000
+
+
+def migrate():
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", migrations.ALEMBIC_DIRECTORY)
+    command.upgrade(config, "head")
+
+
+def insert(connection, table, rows):
+    """Inserts ``rows`` in chunks and returns the new ids in insertion order."""
+    before = connection.execute(select([func.max(table.c.id)])).scalar() or 0
+    for start in range(0, len(rows), CHUNK):
+        connection.execute(table.insert(), rows[start : start + CHUNK])
+    return [
+        row.id
+        for row in connection.execute(
+            select([table.c.id]).where(table.c.id > before).order_by(table.c.id)
+        )
+    ]
+
+
+def seed(users, foundations, methods_per_user, rules_per_method, history, rng):
+    now = datetime.datetime.utcnow()
+    hashed_password = security.hash_password(PASSWORD)
+    accounts = [(key, Account.from_key(key).address) for key in TESTER_KEYS]
+    with engine.begin() as connection:
+        if connection.execute(select([func.count(model.User.id)])).scalar():
+            raise SystemExit("refusing to seed a database that already has users")
+        user_ids = insert(
+            connection,
+            model.User.__table__,
+            [
+                {
+                    "name": USER_NAME % index,
+                    "hashed_password": hashed_password,
+                    "is_admin": index == 1,
+                }
+                for index in range(1, users + 1)
+            ],
+        )
+        insert(
+            connection,
+            model.UserToken.__table__,
+            [
+                {
+                    "user_id": user_id,
+                    "token": TOKEN % user_id,
+                    "is_active": True,
+                    "created_at": now,
+                }
+                for user_id in user_ids
+            ],
+        )
+        foundation_ids = insert(
+            connection,
+            model.Foundation.__table__,
+            [
+                {
+                    "name": "foundation %d" % index,
+                    "description": "synthetic foundation %d" % index,
+                    "payment_address": to_checksum_address("0x%040x" % index),
+                }
+                for index in range(1000, 1000 + foundations)
+            ],
+        )
+        method_rows = []
+        for user_index, user_id in enumerate(user_ids):
+            for method_index in range(methods_per_user):
+                key, address = accounts[(user_index + method_index) % len(accounts)]
+                method_rows.append(
+                    {
+                        "user_id": user_id,
+                        "type": "ETH",
+                        "private_key": key,
+                        "address": address,
+                    }
+                )
+        method_ids = insert(connection, model.PaymentMethod.__table__, method_rows)
+        rule_ids = insert(
+            connection,
+            model.PaymentRule.__table__,
+            [
+                {
+                    "payment_method_id": method_id,
+                    "foundation_id": rng.choice(foundation_ids),
+                    "amount": "0.001",
+                }
+                for method_id in method_ids
+                for _ in range(rules_per_method)
+            ],
+        )
+        payment_table = model.Payment.__table__
+        for start in range(0, history, CHUNK):
+            rows = []
+            for index in range(start, min(start + CHUNK, history)):
+                created_at = now - datetime.timedelta(
+                    seconds=rng.randrange(365 * 24 * 3600)
+                )
+                rows.append(
+                    {
+                        "payment_rule_id": rule_ids[index % len(rule_ids)],
+                        "transaction_hash": "0x%064x" % index,
+                        "created_at": created_at,
+                        "status": "sent",
+                        "attempts": 1,
+                        "block_number": index + 1,
+                        "gas_used": 21000,
+                        "receipt_status": 1,
+                        "confirmed_at": created_at,
+                    }
+                )
+            connection.execute(payment_table.insert(), rows)
+    db = SessionLocal()
+    try:
+        crud.rebuild_donation_stats(db)
+    finally:
+        db.close()
+    return {
+        "users": len(user_ids),
+        "foundations": len(foundation_ids),
+        "payment_methods": len(method_ids),
+        "payment_rules": len(rule_ids),
+        "payments": history,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--foundations", type=int, default=200)
+    parser.add_argument("--methods-per-user", type=int, default=2)
+    parser.add_argument("--rules-per-method", type=int, default=5)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--random-seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    migrate()
+    counts = seed(
+        args.users,
+        args.foundations,
+        args.methods_per_user,
+        args.rules_per_method,
+        args.history,
+        random.Random(args.random_seed),
+    )
+    print(
+        "seeded %s in %.1fs"
+        % (
+            ", ".join("%d %s" % (count, name) for name, count in counts.items()),
+            time.perf_counter() - started,
+        )
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    main()
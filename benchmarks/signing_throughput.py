@@ -0,0 +1,83 @@
+"""Transaction signatures per second: raw keys vs cached signers vs the pool.
+
+Signs ``--count`` transfers spread over ``--methods`` payment methods, first
+deriving the account from the key for every transaction as triggers used to,
+then through a warm ``SignerRegistry``, then through ``SigningPool``::
+
+    python benchmarks/signing_throughput.py --count 400 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from eth_account import Account  # noqa: E402
+
+from api import signing  # noqa: E402
+
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def make_jobs(count, methods):
+    keys = ["0x%064x" % index for index in range(1, methods + 1)]
+    return [
+        (
+            index % methods,
+            keys[index % methods],
+            {
+                "to": RECIPIENT,
+                "value": 10**15,
+                "gas": 21000,
+                "gasPrice": 10**9,
+                "nonce": index,
+                "chainId": 1,
+            },
+        )
+        for index in range(count)
+    ]
+
+
+def uncached(jobs):
+    return [
+        Account.from_key(private_key).sign_transaction(params)
+        for _, private_key, params in jobs
+    ]
+
+
+def rate(name, sign, jobs):
+    started = time.perf_counter()
+    signed = sign(jobs)
+    elapsed = time.perf_counter() - started
+    assert len(signed) == len(jobs)
+    print("%-32s %8.1f signatures/s" % (name, len(jobs) / elapsed))
+    return signed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=400)
+    parser.add_argument("--methods", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.count, args.methods)
+    expected = rate("from_key per transaction", uncached, jobs)
+
+    inline = signing.SigningPool(max_workers=0)
+    inline.sign_many(jobs[: args.methods])
+    rate("cached signers, inline", inline.sign_many, jobs)
+
+    pool = signing.SigningPool(max_workers=args.workers, min_batch=0)
+    # Start the processes and fill their registries before timing.
+    pool.sign_many(jobs[: args.methods * args.workers])
+    signed = rate("cached signers, %d processes" % args.workers, pool.sign_many, jobs)
+    pool.shutdown()
+    assert [tx.rawTransaction for tx in signed] == [
+        tx.rawTransaction for tx in expected
+    ]
+
+
+if __name__ == "__main__":
+    main()
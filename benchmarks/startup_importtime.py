@@ -0,0 +1,82 @@
+"""Import cost of ``api.endpoint``, checked against a tracked budget.
+
+Runs ``python -X importtime -c "import api.endpoint"`` in fresh interpreters and
+fails when the median cumulative import time exceeds ``BUDGET_MS`` or when a
+module that should only load on first use shows up::
+
+    python benchmarks/startup_importtime.py --repeat 5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Median cumulative import time of api.endpoint; raise deliberately, not casually.
+BUDGET_MS = 600
+
+# Loaded by the startup hook or on first use, never by the import itself.
+LAZY_MODULES = ("web3", "eth_account", "aiohttp", "alembic", "databases")
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile(module):
+    """``{imported module: (cumulative us, depth)}`` for one cold import."""
+    env = dict(os.environ, DATABASE_URL="sqlite:////nonexistent/directory/api.db")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        cwd=ROOT,
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            timings[name] = (int(cumulative), (len(indent) - 1) // 2)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="api.endpoint")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.repeat)]
+    total_ms = statistics.median(run[args.module][0] for run in runs) / 1000
+    last = runs[-1]
+    heaviest = sorted(
+        (
+            (cumulative, name)
+            for name, (cumulative, depth) in last.items()
+            if depth == 1
+        ),
+        reverse=True,
+    )[: args.top]
+    for cumulative, name in heaviest:
+        print("%-40s %8.1fms" % (name, cumulative / 1000))
+    print("%-40s %8.1fms (budget %.0fms)" % (args.module, total_ms, args.budget_ms))
+
+    failures = []
+    loaded = [name for name in LAZY_MODULES if name in last]
+    if loaded:
+        failures.append("imported eagerly: " + ", ".join(loaded))
+    if total_ms > args.budget_ms:
+        failures.append("%.1fms over budget" % (total_ms - args.budget_ms))
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import os
+import tempfile
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+)
+os.environ.setdefault("BCRYPT_ROUNDS", "5")
+os.environ.setdefault("HASH_POOL_SIZE", "1")
+os.environ.setdefault("SIGNING_WORKERS", "1")
+os.environ.setdefault("CACHE_INVALIDATION_POLL_INTERVAL", "3600")
+os.environ.setdefault("TRIGGER_RATE", "1000")
+os.environ.setdefault("BATCH_TRIGGER_RATE", "1000")
+
+import pytest  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+
+from api import instrumentation, model  # noqa: E402
+from api.cache import foundations_cache, token_cache  # noqa: E402
+from api.database import SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    model.Base.metadata.drop_all(bind=engine)
+    model.Base.metadata.create_all(bind=engine)
+    token_cache.clear()
+    foundations_cache.clear()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client(db, eth_client, monkeypatch):
+    from api import payment
+    from api.endpoint import app
+
+    oracle = payment.GasPriceOracle(
+        lambda: payment.node_gas_price(eth_client), interval=3600
+    )
+    monkeypatch.setattr(payment, "eth_client", eth_client)
+    monkeypatch.setattr(payment, "gas_price_oracle", oracle)
+    payment.contract_code_cache.clear()
+    payment.gas_estimate_cache.clear()
+    yield TestClient(app)
+    oracle.stop()
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post("/user/create", json={"name": "alice", "password": "pw"})
+    return {"Authorization": response.json()["token"]}
+
+
+@pytest.fixture
+def query_budget():
+    """Fails when a response took more SQL statements than its budget."""
+
+    def check(response, max_queries):
+        count = int(response.headers[instrumentation.QUERY_COUNT_HEADER])
+        assert count <= max_queries, "%s %s ran %d queries, budget is %d" % (
+            response.request.method,
+            response.request.url,
+            count,
+            max_queries,
+        )
+        return response
+
+    return check
+
+
+@pytest.fixture
+def eth_client():
+    from web3 import EthereumTesterProvider, Web3
+
+    return Web3(EthereumTesterProvider())
+
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+@pytest.fixture
+def make_payment_rule(client, auth_headers):
+    """Creates a foundation, a funded payment method and a rule paying into it."""
+
+    def make(amount="1"):
+        foundation = client.post(
+            "/foundations",
+            json={"name": "f", "description": "d", "payment_address": RECIPIENT},
+        ).json()
+        payment_method = client.post(
+            "/payments/methods",
+            json={"type": "ETH", "private_key": FUNDED_KEY},
+            headers=auth_headers,
+        ).json()
+        return client.post(
+            "/payments/rules",
+            json={
+                "payment_method_id": payment_method["id"],
+                "foundation_id": foundation["id"],
+                "amount": amount,
+            },
+            headers=auth_headers,
+        ).json()
+
+    return make
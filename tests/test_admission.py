@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api import admission, cache, model
+
+
+def test_bulkhead_queues_then_sheds():
+    bulkhead = admission.Bulkhead("node", limit=1, queue_size=1, timeout=5)
+    bulkhead.acquire()
+    admitted = threading.Event()
+
+    def wait_for_slot():
+        with bulkhead.slot():
+            admitted.set()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    while not bulkhead.snapshot()["queued"]:
+        time.sleep(0.001)
+    with pytest.raises(admission.Overloaded) as excinfo:
+        bulkhead.acquire()
+    assert excinfo.value.retry_after >= 1
+
+    bulkhead.release(0.01)
+    waiter.join(1)
+    assert admitted.is_set()
+    snapshot = bulkhead.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert snapshot["admitted"] == 2
+    assert snapshot["rejected"] == 1
+
+
+def test_async_waiter_times_out():
+    bulkhead = admission.Bulkhead("read", limit=1, queue_size=4, timeout=0.05)
+    bulkhead.acquire()
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(admission.Overloaded):
+            loop.run_until_complete(bulkhead.acquire_async())
+    finally:
+        loop.close()
+    assert bulkhead.snapshot()["timed_out"] == 1
+    bulkhead.release(0.01)
+    assert bulkhead.snapshot()["in_flight"] == 0
+
+
+def test_token_bucket_refills():
+    now = [0.0]
+    limiter = admission.RateLimiter(rate=2, burst=3, timer=lambda: now[0])
+    limiter.take("alice", 3)
+    with pytest.raises(admission.RateLimited) as excinfo:
+        limiter.take("alice")
+    assert excinfo.value.retry_after == 1
+    limiter.take("bob")
+    now[0] = 0.5
+    limiter.take("alice")
+    # A cost above the burst could never be paid.
+    now[0] = 10
+    with pytest.raises(ValueError):
+        limiter.take("alice", 4)
+
+
+def test_saturated_node_bulkhead_leaves_reads_alone(
+    client, auth_headers, db, monkeypatch
+):
+    node = admission.Bulkhead("node", limit=1, queue_size=0)
+    monkeypatch.setitem(admission.bulkheads, "node", node)
+    node.acquire()
+
+    response = client.post(
+        "/payments/rules/trigger", json={"payment_rule_ids": [1]}, headers=auth_headers
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert client.get("/payments/rules", headers=auth_headers).status_code == 200
+
+    # Only admins may see the metrics.
+    assert client.get("/metrics/admission").status_code == 403
+    assert client.get("/metrics/admission", headers=auth_headers).status_code == 403
+    db.query(model.User).update({model.User.is_admin: True})
+    db.commit()
+    cache.token_cache.clear()
+    metrics = client.get("/metrics/admission", headers=auth_headers).json()
+    assert metrics["bulkheads"]["node"]["rejected"] == 1
+    assert metrics["bulkheads"]["node"]["saturation"] == 1
+
+
+def test_trigger_rate_limit(client, auth_headers, make_payment_rule, monkeypatch):
+    monkeypatch.setattr(
+        admission, "trigger_limiter", admission.RateLimiter(rate=0.001, burst=2)
+    )
+    rule = make_payment_rule()
+    path = "/payments/rules/%d/trigger" % rule["id"]
+    assert client.post(path, headers=auth_headers).status_code == 202
+    assert client.post(path, headers=auth_headers).status_code == 202
+
+    response = client.post(path, headers=auth_headers)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 1
+
+
+def test_batch_trigger_costs_a_token_per_request(
+    client, auth_headers, make_payment_rule, monkeypatch
+):
+    monkeypatch.setattr(
+        admission, "batch_trigger_limiter", admission.RateLimiter(rate=0.001, burst=1)
+    )
+    # A batch is not bound by the per-payment bucket of single triggers.
+    rule_ids = [
+        make_payment_rule("0.01")["id"] for _ in range(admission.TRIGGER_BURST + 5)
+    ]
+    path = "/payments/rules/trigger"
+
+    response = client.post(
+        path, json={"payment_rule_ids": rule_ids}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert all(result["success"] for result in response.json())
+
+    response = client.post(
+        path, json={"payment_rule_ids": rule_ids[:1]}, headers=auth_headers
+    )
+    assert response.status_code == 429
+    assert admission.batch_trigger_limiter.snapshot()["limited"] == 1
@@ -0,0 +1,101 @@
+import asyncio
+
+import databases
+import pytest
+
+from api import async_crud, database, security
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+@pytest.fixture
+def async_client(client, monkeypatch):
+    """``client`` with every endpoint but the batch trigger on ``api.async_crud``."""
+    from api import endpoint
+
+    loop = asyncio.get_event_loop()
+    async_database = databases.Database(database.DATABASE_URL)
+    loop.run_until_complete(async_database.connect())
+
+    async def get_async_db():
+        return async_database
+
+    monkeypatch.setattr(endpoint, "store", async_crud)
+    endpoint.app.dependency_overrides[endpoint.get_store] = get_async_db
+    endpoint.app.dependency_overrides[endpoint.get_read_store] = get_async_db
+    yield client
+    endpoint.app.dependency_overrides.clear()
+    loop.run_until_complete(async_database.disconnect())
+
+
+def test_async_data_path(async_client):
+    client = async_client
+    created = client.post("/user/create", json={"name": "bob", "password": "pw"})
+    assert created.status_code == 200
+    token = client.post("/user/token", json={"name": "bob", "password": "pw"})
+    headers = {"Authorization": token.json()["token"]}
+
+    foundation = client.post(
+        "/foundations",
+        json={"name": "f", "description": "d", "payment_address": RECIPIENT},
+    ).json()
+    payment_method = client.post(
+        "/payments/methods",
+        json={"type": "ETH", "private_key": FUNDED_KEY},
+        headers=headers,
+    ).json()
+    rule = client.post(
+        "/payments/rules",
+        json={
+            "payment_method_id": payment_method["id"],
+            "foundation_id": foundation["id"],
+            "amount": "1.5",
+            "interval_seconds": 3600,
+        },
+        headers=headers,
+    ).json()
+    assert rule["next_run_at"] is not None
+    missing = client.post(
+        "/payments/rules",
+        json={"payment_method_id": 999, "foundation_id": foundation["id"], "amount": 1},
+        headers=headers,
+    )
+    assert missing.status_code == 404
+
+    queued = client.post(f"/payments/rules/{rule['id']}/trigger", headers=headers)
+    assert queued.status_code == 202
+    assert queued.json()["status"] == "pending"
+
+    assert client.get("/foundations").json() == [foundation]
+    assert client.get("/payments/methods", headers=headers).json() == [payment_method]
+    assert client.get("/payments/rules", headers=headers).json() == [rule]
+    history = client.get("/payments/history", headers=headers).json()
+    assert [payment["id"] for payment in history] == [queued.json()["id"]]
+
+    assert client.delete(f"/payments/rules/{rule['id']}", headers=headers).json()
+    assert client.get("/payments/rules", headers=headers).json() == []
+
+    assert client.post("/user/logout", headers=headers).json() == {"success": True}
+    assert client.get("/payments/methods", headers=headers).status_code == 401
+
+
+def test_async_token_cap(async_client, monkeypatch):
+    client = async_client
+    monkeypatch.setattr(async_crud, "MAX_ACTIVE_TOKENS", 1)
+    first = client.post("/user/create", json={"name": "bob", "password": "pw"})
+    second = client.post("/user/token", json={"name": "bob", "password": "pw"})
+
+    stale = {"Authorization": first.json()["token"]}
+    fresh = {"Authorization": second.json()["token"]}
+    assert client.get("/user/stats", headers=stale).status_code == 401
+    assert client.get("/user/stats", headers=fresh).status_code == 200
+
+
+def test_async_cached_token_expires(async_client, monkeypatch):
+    client = async_client
+    created = client.post("/user/create", json={"name": "bob", "password": "pw"})
+    headers = {"Authorization": created.json()["token"]}
+    assert client.get("/user/stats", headers=headers).status_code == 200
+    monkeypatch.setattr(security, "TOKEN_TTL", 0.001)
+    assert client.get("/user/stats", headers=headers).status_code == 401
@@ -0,0 +1,140 @@
+from api import crud, model
+from api.cache import (
+    InvalidationListener,
+    TTLCache,
+    VersionedCache,
+    foundations_cache,
+    token_cache,
+)
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=2, ttl=10, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    timer.now = 11
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_listener_replays_invalidations_from_other_workers(db):
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=60)
+    listener = InvalidationListener(interval=1, timer=timer)
+    listener.subscribe("user_tokens", cache.invalidate)
+    listener.poll(db)
+    cache.set("token", "user")
+
+    db.add(model.CacheInvalidation(channel="user_tokens", key="token"))
+    db.commit()
+    listener.poll(db)
+    assert cache.get("token") == "user"
+
+    timer.now = 2
+    listener.poll(db)
+    assert cache.get("token") is None
+
+
+def test_listener_catches_ids_committed_out_of_order(db):
+    timer = FakeTimer()
+    replayed = []
+    listener = InvalidationListener(interval=0, timer=timer, gap_timeout=10)
+    listener.subscribe("user_tokens", replayed.append)
+    listener.poll(db)
+
+    # Id 1 was taken by a transaction that commits after id 2.
+    db.add(model.CacheInvalidation(id=2, channel="user_tokens", key="b"))
+    db.commit()
+    listener.poll(db)
+    db.add(model.CacheInvalidation(id=1, channel="user_tokens", key="a"))
+    db.commit()
+    listener.poll(db)
+    listener.poll(db)
+    assert replayed == ["b", "a"]
+
+    # Ids that never show up are given up on after ``gap_timeout``.
+    db.add(model.CacheInvalidation(id=5, channel="user_tokens", key="e"))
+    db.commit()
+    listener.poll(db)
+    timer.now = 11
+    listener.poll(db)
+    db.add(model.CacheInvalidation(id=4, channel="user_tokens", key="d"))
+    db.commit()
+    listener.poll(db)
+    assert replayed == ["b", "a", "e"]
+
+
+def test_logout_drops_cached_token(client, auth_headers, db):
+    assert client.get("/payments/methods", headers=auth_headers).status_code == 200
+    hits = token_cache.hits
+    assert client.get("/payments/methods", headers=auth_headers).status_code == 200
+    assert token_cache.hits == hits + 1
+
+    client.post("/user/logout", headers=auth_headers)
+    assert client.get("/payments/methods", headers=auth_headers).status_code == 401
+    assert db.query(model.CacheInvalidation).count() == 1
+    assert crud.get_user_by_token(db, auth_headers["Authorization"]) is None
+
+
+def test_versioned_cache_skips_values_computed_before_a_bump():
+    cache = VersionedCache(maxsize=10, ttl=60)
+    version = cache.version
+    cache.bump()
+    assert not cache.set_if_version("page", "stale", version)
+    assert cache.set_if_version("page", "fresh", cache.version)
+    cache.bump()
+    assert cache.get("page") is None
+
+
+def test_foundations_served_from_cache_with_etag(client, query_budget):
+    foundation = {
+        "name": "f",
+        "description": "d",
+        "payment_address": "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A",
+    }
+    client.post("/foundations", json=foundation)
+    first = client.get("/foundations")
+    assert len(first.json()) == 1
+    etag = first.headers["ETag"]
+    cached = query_budget(client.get("/foundations"), 0)
+    assert cached.content == first.content
+    assert cached.headers["ETag"] == etag
+
+    not_modified = client.get("/foundations", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    client.post("/foundations", json=foundation)
+    changed = client.get("/foundations", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()) == 2
+    assert changed.headers["ETag"] != etag
+
+
+def test_foundations_cache_follows_other_workers(client, db, monkeypatch):
+    from api.cache import invalidation_listener
+
+    # The tables were recreated for this test, so replay from the first row.
+    monkeypatch.setattr(invalidation_listener, "_last_id", 0)
+    client.get("/foundations")
+    db.add(model.Foundation(name="f", description="d", payment_address="0x0"))
+    crud.publish_invalidation(db, "foundations", "")
+    db.commit()
+    assert client.get("/foundations").json() == []
+
+    monkeypatch.setattr(invalidation_listener, "_next_poll_at", 0.0)
+    assert len(client.get("/foundations").json()) == 1
+    assert foundations_cache.stats()["size"] == 1
@@ -0,0 +1,66 @@
+import datetime
+
+from api import confirmer, crud, model, payment
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def make_due(db):
+    db.query(model.Payment).filter(
+        model.Payment.next_receipt_check_at.isnot(None)
+    ).update({model.Payment.next_receipt_check_at: datetime.datetime(2000, 1, 1)})
+    db.commit()
+
+
+def test_records_receipts_once_mined(client, make_payment_rule, eth_client, db):
+    rule = make_payment_rule()
+    tester = eth_client.provider.ethereum_tester
+    tester.disable_auto_mine_transactions()
+    tx_hash = payment.send_eth_from_to_amount(eth_client, FUNDED_KEY, RECIPIENT, "0.01")
+    crud.create_payments(db, [(rule["id"], tx_hash), (rule["id"], tx_hash)])
+
+    assert confirmer.run_once(db, eth_client) == 2
+    pending = db.query(model.Payment).all()
+    assert all(row.block_number is None for row in pending)
+    assert all(
+        row.next_receipt_check_at > datetime.datetime.utcnow() for row in pending
+    )
+    assert confirmer.run_once(db, eth_client) == 0
+
+    tester.mine_blocks(1)
+    make_due(db)
+    assert confirmer.run_once(db, eth_client) == 2
+    db.expire_all()
+    for row in db.query(model.Payment):
+        assert (row.block_number, row.gas_used, row.receipt_status) == (1, 21000, 1)
+        assert row.confirmed_at is not None
+        assert row.next_receipt_check_at is None
+    assert confirmer.run_once(db, eth_client) == 0
+
+
+def test_one_batch_per_cycle(client, make_payment_rule, eth_client, db, monkeypatch):
+    rule = make_payment_rule()
+    crud.create_payments(db, [(rule["id"], "0x%064x" % i) for i in range(50)])
+    calls = []
+    monkeypatch.setattr(
+        payment,
+        "batch_request",
+        lambda client, method, params_list: calls.append(params_list)
+        or [{"result": None}] * len(params_list),
+    )
+    assert confirmer.run_once(db, eth_client, limit=20) == 20
+    assert [len(params_list) for params_list in calls] == [20]
+
+
+def test_parse_receipt_accepts_wire_format():
+    receipt = {"blockNumber": "0x10", "gasUsed": "0x5208", "status": "0x0"}
+    assert payment.parse_receipt(receipt) == (16, 21000, 0)
+
+
+def test_checks_back_off_with_age(monkeypatch):
+    monkeypatch.setattr(confirmer, "CONFIRMER_MIN_INTERVAL", 5)
+    monkeypatch.setattr(confirmer, "CONFIRMER_MAX_INTERVAL", 600)
+    monkeypatch.setattr(confirmer, "CONFIRMER_BACKOFF", 0.25)
+    delays = [confirmer.next_check_delay(age) for age in (0, 60, 600, 86400)]
+    assert delays == [5, 15, 150, 600]
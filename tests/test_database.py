@@ -0,0 +1,57 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from api import database, model
+
+
+@pytest.fixture
+def replica(client):
+    from api.endpoint import app
+
+    replica_engine = database.create_db_engine(
+        "sqlite:///" + os.path.join(tempfile.mkdtemp(), "replica.db")
+    )
+    model.Base.metadata.create_all(bind=replica_engine)
+    ReplicaSession = sessionmaker(bind=replica_engine)
+
+    def get_replica_db():
+        session = ReplicaSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[database.get_read_db] = get_replica_db
+    yield ReplicaSession
+    del app.dependency_overrides[database.get_read_db]
+    replica_engine.dispose()
+
+
+def test_sqlite_connections_use_wal(db):
+    assert db.execute("PRAGMA journal_mode").scalar() == "wal"
+    # NORMAL
+    assert db.execute("PRAGMA synchronous").scalar() == 1
+
+
+def test_listing_endpoints_read_from_replica(client, auth_headers, replica):
+    client.post(
+        "/foundations",
+        json={
+            "name": "primary",
+            "description": "d",
+            "payment_address": "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A",
+        },
+    )
+    session = replica()
+    session.add(
+        model.Foundation(name="replica", description="d", payment_address="0x0")
+    )
+    session.commit()
+    session.close()
+
+    assert [f["name"] for f in client.get("/foundations").json()] == ["replica"]
+    # Writes and authentication stay on the primary.
+    assert client.get("/payments/methods", headers=auth_headers).json() == []
@@ -0,0 +1,98 @@
+import csv
+import io
+import json
+from decimal import Decimal
+
+from api import crud, model, schema, serialization
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def make_history(db, make_payment_rule, count):
+    rule = make_payment_rule("0.125")
+    crud.create_payments(db, [(rule["id"], "0x%x" % index) for index in range(count)])
+    return rule
+
+
+def make_other_history(db, foundation_id):
+    other = crud.create_user(db, schema.RequestUser(name="mallory", password="pw"))
+    other_method = crud.create_payment_method(
+        db,
+        other.id,
+        schema.RequestPaymentMethod(type="ETH", private_key=FUNDED_KEY),
+        RECIPIENT,
+    )
+    other_rule = crud.create_payment_rule(
+        db,
+        schema.RequestPaymentRule(
+            payment_method_id=other_method.id, foundation_id=foundation_id, amount=1
+        ),
+        other.id,
+    )
+    crud.create_payments(db, [(other_rule.id, "0xother")])
+
+
+def test_ndjson_export_streams_own_payments(
+    client, auth_headers, db, make_payment_rule
+):
+    rule = make_history(db, make_payment_rule, 5)
+    make_other_history(db, rule["foundation_id"])
+
+    response = client.get("/payments/history/export", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["transaction_hash"] for row in rows] == [
+        "0x%x" % index for index in range(5)
+    ]
+    assert {row["payment_rule_id"] for row in rows} == {rule["id"]}
+    assert rows[0]["foundation_id"] == rule["foundation_id"]
+    # Amounts are exact decimal strings, not floats.
+    assert Decimal(rows[0]["amount"]) == Decimal("0.125")
+    assert isinstance(rows[0]["amount"], str)
+
+    user_id = rows[0]["user_id"]
+    batches = crud.iter_payment_batches(db, user_id, serialization.EXPORT_COLUMNS, 2)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_csv_export_honours_date_range(client, auth_headers, db, make_payment_rule):
+    make_history(db, make_payment_rule, 3)
+    created = [row.created_at for row in db.query(model.Payment).order_by("id")]
+
+    response = client.get(
+        "/payments/history/export",
+        params={"format": "csv", "created_from": created[1].isoformat()},
+        headers=auth_headers,
+    )
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert response.headers["content-type"].startswith("text/csv")
+    assert [row["transaction_hash"] for row in rows] == ["0x1", "0x2"]
+    assert rows[0]["created_at"] == created[1].isoformat()
+    assert Decimal(rows[0]["amount"]) == Decimal("0.125")
+
+    empty = client.get(
+        "/payments/history/export",
+        params={"format": "csv", "created_to": "2000-01-01T00:00:00"},
+        headers=auth_headers,
+    )
+    assert empty.text.strip() == ",".join(
+        column.key for column in serialization.EXPORT_COLUMNS
+    )
+
+
+def test_admin_export_covers_every_user(client, auth_headers, db, make_payment_rule):
+    rule = make_history(db, make_payment_rule, 2)
+    make_other_history(db, rule["foundation_id"])
+    path = "/admin/payments/history/export"
+    assert client.get(path, headers=auth_headers).status_code == 403
+
+    db.query(model.User).update({model.User.is_admin: True})
+    db.commit()
+    crud.token_cache.clear()
+    response = client.get(path, headers=auth_headers)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 3
+    assert len({row["user_id"] for row in rows}) == 2
@@ -0,0 +1,78 @@
+import datetime
+
+from api import crud, model
+
+
+def walk(client, url, headers=None):
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(url, params=params, headers=headers)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_payment_history_pages_newest_first(
+    client, auth_headers, make_payment_rule, db
+):
+    rule = make_payment_rule()
+    other_rule = make_payment_rule()
+    crud.create_payments(
+        db,
+        [(rule["id"], "0x%d" % index) for index in range(4)]
+        + [(other_rule["id"], "0x9")],
+    )
+    same_time = datetime.datetime(2020, 1, 1)
+    db.query(model.Payment).update({model.Payment.created_at: same_time})
+    db.commit()
+
+    pages = walk(client, "/payments/history", auth_headers)
+    ids = [payment["id"] for page in pages for payment in page]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert ids == [5, 4, 3, 2, 1]
+
+    filtered = client.get(
+        "/payments/history",
+        params={"payment_rule_id": other_rule["id"]},
+        headers=auth_headers,
+    ).json()
+    assert [payment["id"] for payment in filtered] == [5]
+    in_range = client.get(
+        "/payments/history",
+        params={"created_from": "2020-01-02T00:00:00"},
+        headers=auth_headers,
+    ).json()
+    assert in_range == []
+
+
+def test_foundations_pages_by_id(client):
+    for index in range(5):
+        client.post(
+            "/foundations",
+            json={
+                "name": "f%d" % index,
+                "description": "d",
+                "payment_address": "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A",
+            },
+        )
+    pages = walk(client, "/foundations")
+    assert [[f["name"] for f in page] for page in pages] == [
+        ["f0", "f1"],
+        ["f2", "f3"],
+        ["f4"],
+    ]
+
+
+def test_invalid_cursor_and_limit_are_rejected(client, auth_headers):
+    assert client.get("/foundations", params={"cursor": "nope"}).status_code == 400
+    assert client.get("/foundations", params={"limit": 100000}).status_code == 422
+    response = client.get(
+        "/payments/history", params={"cursor": "WyJ4IiwgMV0="}, headers=auth_headers
+    )
+    assert response.status_code == 400
@@ -0,0 +1,265 @@
+import json
+
+import pytest
+import requests
+from eth_utils import ValidationError
+from web3 import HTTPProvider, Web3
+
+from api import crud, model, payment, rpc, signing, worker
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+FUNDED_ADDRESS = "0x7E5F4552091A69125d5DfCb7b8C2659029395Bdf"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def test_nonces_are_allocated_locally_after_first_sync(db):
+    calls = []
+
+    def node_nonce():
+        calls.append(1)
+        return 7
+
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, node_nonce) == 7
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, node_nonce) == 8
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, node_nonce) == 9
+    assert len(calls) == 1
+
+
+def test_released_nonce_is_reused_or_resynced(db):
+    crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0)
+    crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0)
+    crud.release_nonce(db, FUNDED_ADDRESS, 1, lambda: 1)
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 1
+
+    crud.release_nonce(db, FUNDED_ADDRESS, 1, lambda: 5)
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 5
+
+    # A lagging node never moves the counter back over nonces handed out.
+    crud.release_nonce(db, FUNDED_ADDRESS, 2, lambda: 3)
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 6
+
+
+def test_sender_nonce_catches_up_with_chain(db, eth_client, monkeypatch):
+    send = payment.send_eth_from_to_amount
+
+    def send_like_node(*args, **kwargs):
+        # A JSON-RPC node reports the rejection as an error response.
+        try:
+            return send(*args, **kwargs)
+        except ValidationError as exc:
+            raise ValueError({"code": -32000, "message": str(exc)})
+
+    monkeypatch.setattr(payment, "send_eth_from_to_amount", send_like_node)
+    payment.send_eth_with_managed_nonce(
+        db, eth_client, FUNDED_KEY, FUNDED_ADDRESS, RECIPIENT, "0.01"
+    )
+    # The wallet also sends from elsewhere, so the stored counter falls behind.
+    for _ in range(2):
+        payment.send_eth_from_to_amount(eth_client, FUNDED_KEY, RECIPIENT, "0.01")
+
+    with pytest.raises(ValueError):
+        payment.send_eth_with_managed_nonce(
+            db, eth_client, FUNDED_KEY, FUNDED_ADDRESS, RECIPIENT, "0.01"
+        )
+    tx_hash = payment.send_eth_with_managed_nonce(
+        db, eth_client, FUNDED_KEY, FUNDED_ADDRESS, RECIPIENT, "0.01"
+    )
+    assert eth_client.eth.getTransaction(tx_hash)["nonce"] == 3
+
+
+def test_managed_sends_use_consecutive_nonces(db, eth_client):
+    hashes = [
+        payment.send_eth_with_managed_nonce(
+            db, eth_client, FUNDED_KEY, FUNDED_ADDRESS, RECIPIENT, "0.01"
+        )
+        for _ in range(3)
+    ]
+    nonces = [eth_client.eth.getTransaction(tx_hash)["nonce"] for tx_hash in hashes]
+    assert nonces == [0, 1, 2]
+
+
+def test_rejected_send_returns_nonce(db, eth_client, monkeypatch):
+    def reject(*args, **kwargs):
+        raise ValueError({"code": -32000, "message": "insufficient funds"})
+
+    monkeypatch.setattr(payment, "send_eth_from_to_amount", reject)
+    with pytest.raises(ValueError):
+        payment.send_eth_with_managed_nonce(
+            db, eth_client, FUNDED_KEY, FUNDED_ADDRESS, RECIPIENT, "0.01"
+        )
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 99) == 0
+
+
+def test_gas_price_oracle_serves_cached_capped_quote():
+    quotes = iter([100, 300])
+    oracle = payment.GasPriceOracle(lambda: next(quotes), interval=3600, cap=250)
+    assert oracle.age() is None
+    assert oracle.price() == 100
+    assert oracle.price() == 100
+    assert oracle.age() >= 0
+    assert oracle.refresh() == 250
+    assert oracle.price() == 250
+    oracle.stop()
+
+
+def test_percentile_gas_price_reads_recent_blocks():
+    blocks = [[], [10, 20], [30], [40]]
+
+    class Eth:
+        blockNumber = len(blocks) - 1
+
+        def getBlock(self, number, full_transactions):
+            return {"transactions": [{"gasPrice": price} for price in blocks[number]]}
+
+    class Client:
+        eth = Eth()
+
+    assert payment.percentile_gas_price(Client(), blocks=3, percentile=50) == 30
+    assert payment.percentile_gas_price(Client(), blocks=1, percentile=50) == 40
+
+
+def test_transfers_to_accounts_skip_estimate_gas(
+    client, auth_headers, eth_client, make_payment_rule, db
+):
+    rule = make_payment_rule()
+    assert payment.contract_code_cache.get(RECIPIENT) is False
+
+    def fail(params):
+        raise AssertionError("estimateGas must not be called for plain transfers")
+
+    eth_client.eth.estimateGas = fail
+    client.post("/payments/rules/%d/trigger" % rule["id"], headers=auth_headers)
+    assert worker.run_once(db, eth_client) == 1
+    history = client.get("/payments/history", headers=auth_headers).json()
+    transaction = eth_client.eth.getTransaction(history[0]["transaction_hash"])
+    assert transaction["gas"] == payment.TRANSFER_GAS
+
+
+def test_contract_estimates_are_memoized_per_value_bucket():
+    estimates = []
+
+    class Eth:
+        def getCode(self, address):
+            return b"\x60\x00"
+
+        def estimateGas(self, params):
+            estimates.append(params["value"])
+            return 30000
+
+    class Client:
+        eth = Eth()
+
+    payment.gas_estimate_cache.clear()
+    contract = "0x" + "ab" * 20
+    for value in (1000, 1001, 5000):
+        params = {"to": contract, "value": value}
+        assert payment.estimate_gas(Client(), params) == 30000
+    assert estimates == [1000, 5000]
+
+
+def test_batch_trigger_reports_per_rule(
+    client, auth_headers, eth_client, make_payment_rule
+):
+    rule_ids = [make_payment_rule()["id"] for _ in range(3)]
+
+    response = client.post(
+        "/payments/rules/trigger",
+        json={"payment_rule_ids": rule_ids + [999]},
+        headers=auth_headers,
+    )
+    results = response.json()
+    assert [result["payment_rule_id"] for result in results] == rule_ids + [999]
+    assert [result["success"] for result in results] == [True, True, True, False]
+    assert results[-1]["error"] == "Payment rule not found"
+    nonces = [
+        eth_client.eth.getTransaction(result["payment"]["transaction_hash"])["nonce"]
+        for result in results[:3]
+    ]
+    assert nonces == [0, 1, 2]
+    history = client.get("/payments/history", headers=auth_headers).json()
+    assert len(history) == 3
+
+
+def test_batch_trigger_survives_broadcast_failure(
+    client, auth_headers, db, eth_client, make_payment_rule, monkeypatch
+):
+    rule_ids = [make_payment_rule()["id"] for _ in range(3)]
+
+    def drop_connection(client, method, params_list):
+        # The first transaction reaches the node before the connection drops.
+        client.provider.make_request(method, params_list[0])
+        raise requests.ConnectionError("connection reset")
+
+    monkeypatch.setattr(payment, "batch_request", drop_connection)
+    results = client.post(
+        "/payments/rules/trigger",
+        json={"payment_rule_ids": rule_ids},
+        headers=auth_headers,
+    ).json()
+    assert [result["success"] for result in results] == [False, False, False]
+    assert [result["payment"]["status"] for result in results] == ["pending"] * 3
+    # The nonces stay taken: any of the transactions may have reached the node.
+    assert db.query(model.SenderNonce.next_nonce).scalar() == 3
+
+    # Workers settle the recorded payments from their signed hashes.
+    assert worker.run_once(db, eth_client) == 3
+    history = client.get("/payments/history", headers=auth_headers).json()
+    assert [entry["status"] for entry in history] == ["sent"] * 3
+    assert results[0]["payment"]["transaction_hash"] in {
+        entry["transaction_hash"] for entry in history
+    }
+    nonces = sorted(
+        eth_client.eth.getTransaction(entry["transaction_hash"])["nonce"]
+        for entry in history
+    )
+    assert nonces == [0, 1, 2]
+
+
+def test_unsent_batch_gives_back_only_its_own_nonces(
+    db, eth_client, make_payment_rule, monkeypatch
+):
+    rule_ids = [make_payment_rule()["id"] for _ in range(2)]
+    rules = db.query(model.PaymentRule).filter(model.PaymentRule.id.in_(rule_ids))
+
+    def fail(jobs):
+        raise RuntimeError("signing failed")
+
+    monkeypatch.setattr(signing.signing_pool, "sign_many", fail)
+    # A worker holds nonce 0 and has not broadcast it yet.
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 0
+    with pytest.raises(RuntimeError):
+        payment.send_payment_rules_batch(db, eth_client, rules.all(), 10**9)
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 1
+
+    # Nonces allocated after the batch keep it from rewinding.
+    def fail_after_another_send(jobs):
+        crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0)
+        fail(jobs)
+
+    monkeypatch.setattr(signing.signing_pool, "sign_many", fail_after_another_send)
+    with pytest.raises(RuntimeError):
+        payment.send_payment_rules_batch(db, eth_client, rules.all(), 10**9)
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 5
+
+
+def test_batch_request_uses_one_http_post(monkeypatch):
+    posts = []
+
+    def fake_post(endpoint_uri, data, **kwargs):
+        posts.append(json.loads(data))
+        return json.dumps(
+            [
+                {"jsonrpc": "2.0", "id": 1, "error": {"message": "nonce too low"}},
+                {"jsonrpc": "2.0", "id": 0, "result": "0xabc"},
+            ]
+        ).encode()
+
+    monkeypatch.setattr(rpc, "make_post_request", fake_post)
+    client = Web3(HTTPProvider("http://node.invalid"))
+    responses = payment.batch_request(
+        client, "eth_sendRawTransaction", [["0x1"], ["0x2"]]
+    )
+    assert len(posts) == 1
+    assert [request["params"] for request in posts[0]] == [["0x1"], ["0x2"]]
+    assert responses[0]["result"] == "0xabc"
+    assert responses[1]["error"]["message"] == "nonce too low"
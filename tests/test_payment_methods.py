@@ -0,0 +1,25 @@
+from api import payment
+
+PRIVATE_KEY = "0x" + "11" * 32
+ADDRESS = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def test_listing_reads_stored_address(client, auth_headers, monkeypatch):
+    response = client.post(
+        "/payments/methods",
+        json={"type": "ETH", "private_key": PRIVATE_KEY},
+        headers=auth_headers,
+    )
+    assert response.json()["address"] == ADDRESS
+
+    def fail(*args, **kwargs):
+        raise AssertionError("address must not be re-derived")
+
+    monkeypatch.setattr(payment, "account_from_private_key", fail)
+    payment_method_id = response.json()["id"]
+    listed = client.get("/payments/methods", headers=auth_headers).json()
+    assert listed == [{"id": payment_method_id, "type": "ETH", "address": ADDRESS}]
+    single = client.get(
+        "/payments/methods/%d" % payment_method_id, headers=auth_headers
+    ).json()
+    assert single["address"] == ADDRESS
@@ -0,0 +1,35 @@
+import pytest
+
+from api import crud
+
+BUDGETS = [
+    ("get", "/foundations", None, 1),
+    ("get", "/payments/methods", None, 1),
+    ("get", "/payments/methods/1", None, 1),
+    ("get", "/payments/rules", None, 1),
+    ("get", "/payments/rules/1", None, 1),
+    ("get", "/payments/history", None, 1),
+    ("post", "/payments/rules/1/trigger", None, 3),
+    # 7 to sign and record, 5 to bump the user and foundation donation totals,
+    # 2 to settle the recorded payments after the broadcast.
+    ("post", "/payments/rules/trigger", {"payment_rule_ids": [1, 2, 3]}, 14),
+    ("get", "/user/stats", None, 1),
+    ("get", "/foundations/1/stats", None, 1),
+    # Issuing also checks for active tokens beyond the per-user cap.
+    ("post", "/user/token", {"name": "alice", "password": "pw"}, 4),
+    ("post", "/user/logout", None, 3),
+]
+
+
+@pytest.mark.parametrize("method,url,body,budget", BUDGETS)
+def test_endpoint_query_budget(
+    client, auth_headers, make_payment_rule, db, query_budget, method, url, body, budget
+):
+    rules = [make_payment_rule() for _ in range(3)]
+    crud.create_payments(db, [(rule["id"], "0x1") for rule in rules for _ in range(3)])
+    # Resolve the token once so the budget covers the cached steady state.
+    client.get("/payments/methods", headers=auth_headers)
+
+    response = getattr(client, method)(url, json=body, headers=auth_headers)
+    assert response.status_code < 300
+    query_budget(response, budget)
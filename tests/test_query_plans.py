@@ -0,0 +1,171 @@
+"""Fails when a crud query makes SQLite scan a whole table.
+
+Every SELECT/UPDATE/DELETE a crud call issues is replayed under
+``EXPLAIN QUERY PLAN`` against a seeded database.
+"""
+import datetime
+import re
+
+import pytest
+from sqlalchemy import event
+
+from api import crud, model, schema
+from api.cache import InvalidationListener, token_cache
+from api.database import engine
+
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+
+ADDRESS = "0x7E5F4552091A69125d5DfCb7b8C2659029395Bdf"
+
+
+@pytest.fixture
+def seeded(db):
+    user = crud.create_user(db, schema.RequestUser(name="alice", password="pw"))
+    token = crud.create_user_token(db, user.id).token
+    foundation = crud.create_foundation(
+        db,
+        schema.RequestFoundation(name="f", description="d", payment_address=ADDRESS),
+    )
+    payment_method = crud.create_payment_method(
+        db,
+        user.id,
+        schema.RequestPaymentMethod(type="ETH", private_key="0x" + "00" * 31 + "01"),
+        ADDRESS,
+    )
+    payment_rule = crud.create_payment_rule(
+        db,
+        schema.RequestPaymentRule(
+            payment_method_id=payment_method.id,
+            foundation_id=foundation.id,
+            amount=1,
+            interval_seconds=60,
+        ),
+        user.id,
+    )
+    crud.create_payments(db, [(payment_rule.id, "0x1"), (payment_rule.id, "0x2")])
+    crud.enqueue_payment(db, payment_rule.id)
+    crud.allocate_nonce(db, ADDRESS, lambda: 0)
+    token_cache.clear()
+    return {
+        "user_id": user.id,
+        "token": token,
+        "foundation_id": foundation.id,
+        "payment_method_id": payment_method.id,
+        "payment_rule_id": payment_rule.id,
+    }
+
+
+def poll_twice(db):
+    listener = InvalidationListener(interval=0)
+    listener.poll(db)
+    listener.poll(db)
+    # Ids skipped by an earlier poll are looked up again.
+    listener._gaps[0] = float("inf")
+    listener.poll(db)
+
+
+CASES = {
+    "get_user_by_name": lambda db, s: crud.get_user_by_name(db, "alice"),
+    "get_user_by_token": lambda db, s: crud.get_user_by_token(db, s["token"]),
+    "create_user_token": lambda db, s: crud.create_user_token(db, s["user_id"]),
+    "deactivate_user_token": lambda db, s: crud.deactivate_user_token(db, s["token"]),
+    "poll_invalidations": lambda db, s: poll_twice(db),
+    "get_payment_methods": lambda db, s: crud.get_payment_methods(db, s["user_id"]),
+    "get_payment_method": lambda db, s: crud.get_payment_method(
+        db, s["payment_method_id"], s["user_id"]
+    ),
+    "get_payment_rules": lambda db, s: crud.get_payment_rules(db, s["user_id"]),
+    "get_payment_rule": lambda db, s: crud.get_payment_rule(
+        db, s["payment_rule_id"], s["user_id"]
+    ),
+    "get_payment_rules_by_ids": lambda db, s: crud.get_payment_rules_by_ids(
+        db, [s["payment_rule_id"]], s["user_id"]
+    ),
+    "get_payments": lambda db, s: crud.get_payments(db, s["user_id"], limit=10),
+    "get_payments_filtered": lambda db, s: crud.get_payments(
+        db,
+        s["user_id"],
+        limit=10,
+        before=(datetime.datetime.utcnow(), 100),
+        foundation_id=s["foundation_id"],
+        payment_rule_id=s["payment_rule_id"],
+        created_from=datetime.datetime(2020, 1, 1),
+    ),
+    "iter_payment_batches": lambda db, s: list(
+        crud.iter_payment_batches(
+            db,
+            s["user_id"],
+            [model.Payment.id],
+            10,
+            created_from=datetime.datetime(2020, 1, 1),
+        )
+    ),
+    "get_foundations_first_page": lambda db, s: crud.get_foundations(db, limit=10),
+    "get_foundations_after": lambda db, s: crud.get_foundations(
+        db, limit=10, after_id=s["foundation_id"]
+    ),
+    "create_payments": lambda db, s: crud.create_payments(
+        db, [(s["payment_rule_id"], "0x3")]
+    ),
+    "get_unconfirmed_payments": lambda db, s: crud.get_unconfirmed_payments(db, 10),
+    "get_user_stats": lambda db, s: crud.get_user_stats(db, s["user_id"]),
+    "get_foundation_stats": lambda db, s: crud.get_foundation_stats(
+        db, s["foundation_id"]
+    ),
+    "allocate_nonce": lambda db, s: crud.allocate_nonce(db, ADDRESS, lambda: 0),
+    "claim_payments": lambda db, s: crud.claim_payments(db, 10, 300),
+    "enqueue_due_payment_rules": lambda db, s: crud.enqueue_due_payment_rules(db, 10),
+    "delete_stale_tokens": lambda db, s: crud.delete_stale_tokens(
+        db, datetime.datetime(2020, 1, 1), 10
+    ),
+    "delete_old_invalidations": lambda db, s: crud.delete_old_invalidations(
+        db, datetime.datetime(2020, 1, 1), 10
+    ),
+}
+
+# Queries that walk a table in primary key order and stop at a LIMIT.
+ALLOWED_SCANS = {
+    "get_foundations_first_page": {"foundations"},
+    "delete_old_invalidations": {"cache_invalidations"},
+}
+
+
+def query_plans(db, call):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert statements, "no queries were captured"
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for statement, parameters in statements:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            yield statement, [row[-1] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_query_avoids_full_scans(db, seeded, name):
+    allowed = ALLOWED_SCANS.get(name, set())
+    for statement, plan in query_plans(db, lambda: CASES[name](db, seeded)):
+        scanned = {
+            match.group(1)
+            for match in map(SCAN.match, plan)
+            if match and match.group(1) not in allowed
+        }
+        assert not scanned, "%s scans %s:\n%s\n%s" % (
+            name,
+            ", ".join(sorted(scanned)),
+            statement,
+            "\n".join(plan),
+        )
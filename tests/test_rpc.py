@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from api import rpc
+
+
+class Node:
+    """Minimal JSON-RPC stand-in answering every call with its own name."""
+
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.methods = []
+        # Answer batches with this single error object instead of a list.
+        self.batch_error = None
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                )
+                time.sleep(node.delay)
+                requests_ = request if isinstance(request, list) else [request]
+                node.methods.extend(item["method"] for item in requests_)
+                responses = [
+                    {"jsonrpc": "2.0", "id": item["id"], "result": node.name}
+                    for item in requests_
+                ]
+                if not isinstance(request, list):
+                    responses = responses[0]
+                elif node.batch_error is not None:
+                    responses = {
+                        "jsonrpc": "2.0",
+                        "id": None,
+                        "error": node.batch_error,
+                    }
+                body = json.dumps(responses).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def nodes():
+    started = []
+
+    def start(name, delay=0.0):
+        node = Node(name, delay)
+        started.append(node)
+        return node
+
+    yield start
+    for node in started:
+        node.server.shutdown()
+        node.server.server_close()
+
+
+def test_prefers_the_fastest_node(nodes):
+    slow, fast = nodes("slow", delay=0.05), nodes("fast")
+    provider = rpc.MultiEndpointProvider(rpc.make_endpoints([slow.url, fast.url]))
+    results = [provider.make_request("eth_chainId", [])["result"] for _ in range(5)]
+    assert results[0] == "slow"
+    assert results[-1] == "fast"
+    stats = provider.latency_stats()
+    assert stats[slow.url]["requests"] == 1
+    assert stats[fast.url]["requests"] == 4
+    assert stats[slow.url]["p50_ms"] > stats[fast.url]["p50_ms"]
+
+
+def test_fails_over_when_a_node_is_down(nodes):
+    live = nodes("live")
+    dead = nodes("dead")
+    dead.server.shutdown()
+    dead.server.server_close()
+    provider = rpc.MultiEndpointProvider(
+        rpc.make_endpoints([dead.url, live.url], timeout=1)
+    )
+    assert provider.make_request("eth_chainId", [])["result"] == "live"
+    assert provider.make_request("eth_chainId", [])["result"] == "live"
+    assert provider.latency_stats()[dead.url]["errors"] == 1
+
+    alone = rpc.MultiEndpointProvider(rpc.make_endpoints([dead.url], timeout=1))
+    with pytest.raises(requests.ConnectionError):
+        alone.make_request("eth_chainId", [])
+
+
+def test_writes_fail_over_only_when_never_delivered(nodes):
+    stalled, live = nodes("stalled", delay=0.5), nodes("live")
+    dead = nodes("dead")
+    dead.server.shutdown()
+    dead.server.server_close()
+
+    refused = rpc.MultiEndpointProvider(rpc.make_endpoints([dead.url, live.url]))
+    assert refused.make_request("eth_sendRawTransaction", ["0x0"])["result"] == "live"
+
+    timed_out = rpc.MultiEndpointProvider(
+        rpc.make_endpoints([stalled.url, live.url], timeout=0.1)
+    )
+    with pytest.raises(requests.ReadTimeout):
+        timed_out.make_request("eth_sendRawTransaction", ["0x0"])
+    assert live.methods == ["eth_sendRawTransaction"]
+    assert timed_out.make_request("eth_chainId", [])["result"] == "live"
+
+
+def test_hedges_slow_reads_but_not_writes(nodes):
+    stalled, backup = nodes("stalled", delay=0.5), nodes("backup")
+    provider = rpc.MultiEndpointProvider(
+        rpc.make_endpoints([stalled.url, backup.url]), hedge_reads=True
+    )
+    started = time.perf_counter()
+    assert provider.make_request("eth_getCode", ["0x0"])["result"] == "backup"
+    assert time.perf_counter() - started < 0.4
+
+    write = rpc.MultiEndpointProvider(
+        rpc.make_endpoints([stalled.url, backup.url]), hedge_reads=True
+    )
+    write.make_request("eth_sendRawTransaction", ["0x0"])
+    assert backup.methods == ["eth_getCode"]
+
+
+def test_batch_goes_to_one_node(nodes):
+    node = nodes("node")
+    provider = rpc.MultiEndpointProvider(rpc.make_endpoints([node.url]))
+    responses = provider.make_batch_request(
+        "eth_getTransactionReceipt", [["0x1"], ["0x2"]]
+    )
+    assert [response["result"] for response in responses] == ["node", "node"]
+    assert provider.latency_stats()[node.url]["requests"] == 1
+
+
+def test_batch_uses_the_endpoint_session(nodes, monkeypatch):
+    node = nodes("node")
+    endpoint = rpc.make_endpoints([node.url])[0]
+    posts = []
+    post = endpoint.session.post
+    monkeypatch.setattr(
+        endpoint.session,
+        "post",
+        lambda *args, **kwargs: posts.append(1) or post(*args, **kwargs),
+    )
+    provider = rpc.MultiEndpointProvider([endpoint])
+    provider.make_batch_request("eth_getTransactionReceipt", [["0x1"]])
+    assert posts == [1]
+
+    node.batch_error = {"code": -32600, "message": "batch too large"}
+    responses = provider.make_batch_request(
+        "eth_getTransactionReceipt", [["0x1"], ["0x2"]]
+    )
+    assert [response["error"]["message"] for response in responses] == [
+        "batch too large"
+    ] * 2
+
+
+def test_async_client_hedges_reads(nodes):
+    stalled, backup = nodes("stalled", delay=0.5), nodes("backup")
+    endpoints = rpc.make_endpoints([stalled.url, backup.url])
+
+    async def call():
+        client = rpc.async_client(endpoints, hedge_reads=True)
+        try:
+            return await client.provider.make_request("eth_getCode", ["0x0"])
+        finally:
+            await client.provider.close()
+
+    loop = asyncio.new_event_loop()
+    started = time.perf_counter()
+    try:
+        assert loop.run_until_complete(call())["result"] == "backup"
+    finally:
+        loop.close()
+    assert time.perf_counter() - started < 0.4
+    assert endpoints[1].stats.snapshot()["requests"] == 1
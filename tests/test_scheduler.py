@@ -0,0 +1,56 @@
+import datetime
+
+from api import crud, model, scheduler
+
+
+def test_due_rules_fire_once_and_advance(client, auth_headers, make_payment_rule, db):
+    rule = make_payment_rule()
+    client.post(
+        "/payments/rules",
+        json={
+            "payment_method_id": rule["payment_method_id"],
+            "foundation_id": rule["foundation_id"],
+            "amount": "1",
+            "interval_seconds": 3600,
+        },
+        headers=auth_headers,
+    )
+    scheduled = db.query(model.PaymentRule).filter(model.PaymentRule.id != rule["id"])
+    scheduled_rule = scheduled.one()
+    assert scheduler.run_once(db) == 0
+
+    overdue = datetime.datetime.utcnow() - datetime.timedelta(hours=2, minutes=30)
+    scheduled_rule.next_run_at = overdue
+    db.commit()
+    assert scheduler.run_once(db) == 1
+    assert scheduler.run_once(db) == 0
+
+    db.refresh(scheduled_rule)
+    assert scheduled_rule.next_run_at == overdue + datetime.timedelta(hours=3)
+    payment_rcd = db.query(model.Payment).one()
+    assert payment_rcd.payment_rule_id == scheduled_rule.id
+    assert payment_rcd.status == "pending"
+
+
+def test_rule_advanced_elsewhere_is_not_fired_again(
+    client, make_payment_rule, db, monkeypatch
+):
+    rule = make_payment_rule()
+    rule_rcd = db.query(model.PaymentRule).get(rule["id"])
+    rule_rcd.interval_seconds = 60
+    rule_rcd.next_run_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.commit()
+
+    # Another scheduler advances the rule between our read and our claim.
+    original_advance = crud._following_run_at
+
+    def advance_elsewhere(next_run_at, interval_seconds, now):
+        db.connection().execute(
+            model.PaymentRule.__table__.update().values(
+                next_run_at=now + datetime.timedelta(seconds=30)
+            )
+        )
+        return original_advance(next_run_at, interval_seconds, now)
+
+    monkeypatch.setattr(crud, "_following_run_at", advance_elsewhere)
+    assert crud.enqueue_due_payment_rules(db, limit=10) == []
@@ -0,0 +1,28 @@
+import pytest
+from passlib.context import CryptContext
+
+from api import crud, security
+
+
+def test_login_rehashes_outdated_password(client, db):
+    client.post("/user/create", json={"name": "bob", "password": "pw"})
+    user = crud.get_user_by_name(db, "bob")
+    user.hashed_password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("pw")
+    db.commit()
+
+    assert client.post("/user/token", json={"name": "bob", "password": "pw"}).ok
+    db.refresh(user)
+    assert security.pwd_context.verify("pw", user.hashed_password)
+    assert "$%02d$" % security.BCRYPT_ROUNDS in user.hashed_password
+
+
+def test_full_hash_queue_sheds_load(client, monkeypatch):
+    pool = security.HashPool(max_workers=1, queue_size=1)
+    monkeypatch.setattr(security, "hash_pool", pool)
+    pool._slots.acquire()
+    with pytest.raises(security.HashingOverloaded):
+        security.hash_password("pw")
+
+    response = client.post("/user/create", json={"name": "bob", "password": "pw"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,39 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from api import crud, model, serialization
+from api.cache import foundations_cache
+
+
+def test_orjson_response_encodes_decimal_and_datetime():
+    response = serialization.ORJSONResponse(
+        {"amount": Decimal("1.5"), "at": datetime.datetime(2020, 1, 2, 3, 4, 5, 6)}
+    )
+    assert response.body == b'{"amount":1.5,"at":"2020-01-02T03:04:05.000006"}'
+
+
+@pytest.mark.parametrize(
+    "url", ["/foundations", "/payments/rules", "/payments/history"]
+)
+def test_fast_path_matches_default_output(
+    client, auth_headers, make_payment_rule, db, monkeypatch, url
+):
+    rule = make_payment_rule(amount="1.25")
+    make_payment_rule()
+    crud.create_payments(db, [(rule["id"], "0x%d" % index) for index in range(3)])
+    db.query(model.Payment).update(
+        {model.Payment.created_at: datetime.datetime(2020, 1, 1, 0, 0, 0, 1234)}
+    )
+    db.commit()
+    params = {"limit": 2}
+
+    default = client.get(url, params=params, headers=auth_headers)
+    monkeypatch.setattr(serialization, "FAST_SERIALIZATION", True)
+    foundations_cache.clear()
+    fast = client.get(url, params=params, headers=auth_headers)
+
+    assert fast.status_code == default.status_code == 200
+    assert fast.json() == default.json()
+    assert fast.headers.get("X-Next-Cursor") == default.headers.get("X-Next-Cursor")
@@ -0,0 +1,85 @@
+import pytest
+
+from api import model, signing
+
+FUNDED_KEY = "0x" + "00" * 31 + "01"
+OTHER_KEY = "0x" + "00" * 31 + "02"
+RECIPIENT = "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A"
+
+
+def transfer(nonce):
+    return {
+        "to": RECIPIENT,
+        "value": 1,
+        "gas": 21000,
+        "gasPrice": 1,
+        "nonce": nonce,
+        "chainId": 1,
+    }
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = signing.SignerRegistry(maxsize=2)
+    monkeypatch.setattr(signing, "signer_registry", registry)
+    monkeypatch.setattr(signing, "_applied_eviction", 0)
+    return registry
+
+
+def test_registry_reuses_accounts_per_payment_method(registry):
+    account = registry.account(1, FUNDED_KEY)
+    assert registry.account(1, FUNDED_KEY) is account
+    # An id reused for another key never signs with the old account.
+    assert registry.account(1, OTHER_KEY).key != account.key
+    registry.account(2, FUNDED_KEY)
+    registry.account(3, FUNDED_KEY)
+    assert registry.stats() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 4}
+
+    registry.evict(3)
+    assert registry.stats()["size"] == 1
+
+
+def test_workers_apply_the_eviction_log(registry):
+    registry.account(1, FUNDED_KEY)
+    registry.account(2, FUNDED_KEY)
+    signing._apply_evictions(((1, 1),))
+    assert registry.stats()["size"] == 1
+
+    # A gap means older evictions were dropped, so nothing cached is trusted.
+    signing._apply_evictions(((5, 7),))
+    assert registry.stats()["size"] == 0
+
+
+def test_pool_signs_like_the_account():
+    jobs = [(1, FUNDED_KEY, transfer(nonce)) for nonce in range(3)]
+    jobs.append((None, OTHER_KEY, transfer(0)))
+    pool = signing.SigningPool(max_workers=1, min_batch=len(jobs))
+    try:
+        pool.sign_many(jobs[:-1])
+        assert pool._executor is None
+        signed = pool.sign_many(jobs)
+        assert pool._executor is not None
+    finally:
+        pool.shutdown()
+    expected = signing.SigningPool(max_workers=0).sign_many(jobs)
+    assert [tx.rawTransaction for tx in signed] == [
+        tx.rawTransaction for tx in expected
+    ]
+
+
+def test_deleting_a_payment_method_evicts_its_signer(client, auth_headers, db):
+    payment_method = client.post(
+        "/payments/methods",
+        json={"type": "ETH", "private_key": FUNDED_KEY},
+        headers=auth_headers,
+    ).json()
+    signing.signer_registry.account(payment_method["id"], FUNDED_KEY)
+
+    client.delete("/payments/methods/%d" % payment_method["id"], headers=auth_headers)
+    assert payment_method["id"] not in signing.signer_registry._accounts
+    assert signing.signing_pool._evictions[-1][1] == payment_method["id"]
+    invalidation = db.query(model.CacheInvalidation).one()
+    assert (invalidation.channel, invalidation.key) == (
+        "signers",
+        str(payment_method["id"]),
+    )
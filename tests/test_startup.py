@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from api import migrations
+from api.database import create_db_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_connect_or_load_web3():
+    code = (
+        "import sys, api.endpoint, api.database;"
+        "loaded = {'web3', 'aiohttp', 'alembic'} & set(sys.modules);"
+        "assert not loaded, loaded;"
+        "assert 'engine' not in vars(api.database)"
+    )
+    env = dict(os.environ, DATABASE_URL="sqlite:////nonexistent/directory/api.db")
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+def test_schema_check_requires_head(tmp_path):
+    engine = create_db_engine("sqlite:///%s" % tmp_path.joinpath("schema.db"))
+    with pytest.raises(migrations.SchemaOutOfDate):
+        migrations.check_schema(engine)
+
+    config = Config()
+    config.set_main_option("script_location", migrations.ALEMBIC_DIRECTORY)
+    with engine.begin() as connection:
+        MigrationContext.configure(connection).stamp(
+            ScriptDirectory.from_config(config), "head"
+        )
+    migrations.check_schema(engine)
+    assert migrations.current_revision(engine) == migrations.head_revision()
@@ -0,0 +1,76 @@
+import threading
+from decimal import Decimal
+
+from api import crud, model
+from api.database import SessionLocal
+
+
+def stats_of(db):
+    db.expire_all()
+    return [
+        (row.payment_count, row.total_amount)
+        for stats_model in (model.UserDonationStats, model.FoundationDonationStats)
+        for row in db.query(stats_model).order_by(*stats_model.__table__.primary_key)
+    ]
+
+
+def test_sent_payments_update_totals(client, auth_headers, make_payment_rule, db):
+    rule = make_payment_rule(amount="2")
+    other_rule = make_payment_rule(amount="0.5")
+    crud.create_payments(db, [(rule["id"], "0x1"), (other_rule["id"], "0x2")])
+    crud.create_payment(db, rule["id"], "0x3")
+    pending = crud.enqueue_payment(db, other_rule["id"])
+    assert client.get("/user/stats", headers=auth_headers).json()["payment_count"] == 3
+
+    crud.mark_payment_sent(db, pending, "0x4")
+    crud.mark_payment_sent(db, pending, "0x4")
+    user_stats = client.get("/user/stats", headers=auth_headers).json()
+    assert user_stats["payment_count"] == 4
+    assert Decimal(str(user_stats["total_amount"])) == Decimal("5")
+
+    foundation_stats = client.get(f"/foundations/{rule['foundation_id']}/stats")
+    assert foundation_stats.json()["payment_count"] == 2
+    assert foundation_stats.json()["last_payment_at"] is not None
+
+
+def test_stats_for_foundation_without_payments(client):
+    foundation = client.post(
+        "/foundations",
+        json={
+            "name": "f",
+            "description": "d",
+            "payment_address": "0x19E7E376E7C213B7E7e7e46cc70A5dD086DAff2A",
+        },
+    ).json()
+    response = client.get(f"/foundations/{foundation['id']}/stats")
+    assert response.json() == {
+        "total_amount": 0,
+        "payment_count": 0,
+        "last_payment_at": None,
+    }
+    assert client.get("/foundations/999/stats").status_code == 404
+
+
+def test_concurrent_increments_and_rebuild(client, make_payment_rule, db):
+    rule = make_payment_rule(amount="1")
+
+    def send():
+        session = SessionLocal()
+        try:
+            for index in range(5):
+                crud.create_payments(session, [(rule["id"], "0x%d" % index)])
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=send) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    incremental = stats_of(db)
+    assert incremental == [(20, Decimal(20)), (20, Decimal(20))]
+
+    db.query(model.UserDonationStats).delete()
+    db.commit()
+    crud.rebuild_donation_stats(db)
+    assert stats_of(db) == incremental
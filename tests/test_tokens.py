@@ -0,0 +1,66 @@
+import datetime
+
+from api import cache, compactor, crud, model, security
+
+
+def age_tokens(db, days):
+    db.query(model.UserToken).update(
+        {
+            model.UserToken.created_at: datetime.datetime.utcnow()
+            - datetime.timedelta(days=days)
+        }
+    )
+    db.commit()
+    cache.token_cache.clear()
+
+
+def test_expired_token_is_rejected(client, auth_headers, db):
+    assert client.get("/user/stats", headers=auth_headers).status_code == 200
+    age_tokens(db, 365)
+    assert client.get("/user/stats", headers=auth_headers).status_code == 401
+
+
+def test_cached_token_expires(client, auth_headers, monkeypatch):
+    assert client.get("/user/stats", headers=auth_headers).status_code == 200
+    token = auth_headers["Authorization"]
+    assert cache.token_cache.get(token) is not None
+    monkeypatch.setattr(security, "TOKEN_TTL", 0.001)
+    assert client.get("/user/stats", headers=auth_headers).status_code == 401
+    assert cache.token_cache.get(token) is None
+
+
+def test_oldest_tokens_retire_beyond_the_cap(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(crud, "MAX_ACTIVE_TOKENS", 2)
+    credentials = {"name": "alice", "password": "pw"}
+    tokens = [
+        client.post("/user/token", json=credentials).json()["token"] for _ in range(2)
+    ]
+
+    assert client.get("/user/stats", headers=auth_headers).status_code == 401
+    for token in tokens:
+        response = client.get("/user/stats", headers={"Authorization": token})
+        assert response.status_code == 200
+
+
+def test_compactor_deletes_stale_rows_in_batches(client, auth_headers, db):
+    credentials = {"name": "alice", "password": "pw"}
+    for _ in range(3):
+        token = client.post("/user/token", json=credentials).json()["token"]
+        client.post("/user/logout", headers={"Authorization": token})
+    db.add(
+        model.CacheInvalidation(
+            channel="user_tokens", key="old", created_at=datetime.datetime(2000, 1, 1)
+        )
+    )
+    db.commit()
+
+    assert compactor.run_once(db, limit=2) == 3
+    assert compactor.run_once(db, limit=2) == 1
+    assert compactor.run_once(db, limit=2) == 0
+    assert db.query(model.UserToken).count() == 1
+    assert client.get("/user/stats", headers=auth_headers).status_code == 200
+    assert db.query(model.CacheInvalidation).count() == 3
+
+    age_tokens(db, 365)
+    assert compactor.run_once(db) == 1
+    assert db.query(model.UserToken).count() == 0
@@ -0,0 +1,129 @@
+import datetime
+
+from api import crud, model, payment, worker
+from api.database import SessionLocal
+
+FUNDED_ADDRESS = "0x7E5F4552091A69125d5DfCb7b8C2659029395Bdf"
+
+
+def test_trigger_returns_pending_payment_settled_by_worker(
+    client, auth_headers, eth_client, make_payment_rule, db
+):
+    rule = make_payment_rule()
+    response = client.post(
+        "/payments/rules/%d/trigger" % rule["id"], headers=auth_headers
+    )
+    assert response.status_code == 202
+    assert response.json()["status"] == "pending"
+    assert response.json()["transaction_hash"] is None
+
+    assert worker.run_once(db, eth_client) == 1
+    assert worker.run_once(db, eth_client) == 0
+    history = client.get("/payments/history", headers=auth_headers).json()
+    assert history[0]["status"] == "sent"
+    assert eth_client.eth.getTransaction(history[0]["transaction_hash"])
+
+
+def test_rejected_sends_back_off_then_fail(
+    client, auth_headers, eth_client, make_payment_rule, db, monkeypatch
+):
+    def reject(*args, **kwargs):
+        raise ValueError("insufficient funds")
+
+    monkeypatch.setattr(payment, "send_eth_from_to_amount", reject)
+    monkeypatch.setattr(worker, "PAYMENT_MAX_ATTEMPTS", 2)
+    rule = make_payment_rule()
+    client.post("/payments/rules/%d/trigger" % rule["id"], headers=auth_headers)
+
+    assert worker.run_once(db, eth_client) == 1
+    payment_rcd = db.query(model.Payment).one()
+    assert payment_rcd.status == "pending"
+    assert payment_rcd.attempts == 1
+    assert payment_rcd.next_attempt_at > datetime.datetime.utcnow()
+    assert worker.run_once(db, eth_client) == 0
+
+    payment_rcd.next_attempt_at = datetime.datetime.utcnow()
+    db.commit()
+    assert worker.run_once(db, eth_client) == 1
+    history = client.get("/payments/history", headers=auth_headers).json()
+    assert history[0]["status"] == "failed"
+    assert history[0]["error"] == "insufficient funds"
+
+
+def test_claims_are_exclusive_until_they_expire(
+    client, auth_headers, make_payment_rule, db
+):
+    rule = make_payment_rule()
+    client.post("/payments/rules/%d/trigger" % rule["id"], headers=auth_headers)
+    assert len(crud.claim_payments(db, limit=10, claim_timeout=60)) == 1
+    assert crud.claim_payments(db, limit=10, claim_timeout=60) == []
+    assert len(crud.claim_payments(db, limit=10, claim_timeout=-1)) == 1
+
+
+def test_broadcast_payment_is_not_sent_twice(
+    client, auth_headers, eth_client, make_payment_rule, db
+):
+    rule = make_payment_rule()
+    client.post("/payments/rules/%d/trigger" % rule["id"], headers=auth_headers)
+    payment_rcd = crud.claim_payments(db, limit=1, claim_timeout=60)[0]
+    # Simulate a worker that broadcast the transaction and then died.
+    tx_hash = payment.send_eth_from_to_amount(
+        eth_client,
+        payment_rcd.payment_rule.payment_method.private_key,
+        payment_rcd.payment_rule.foundation.payment_address,
+        payment_rcd.payment_rule.amount,
+        on_signed=lambda tx_hash: crud.record_payment_transaction(
+            db, payment_rcd, tx_hash
+        ),
+    )
+    block_number = eth_client.eth.blockNumber
+
+    worker.process_payment(db, eth_client, payment_rcd)
+    assert payment_rcd.status == "sent"
+    assert payment_rcd.transaction_hash == tx_hash
+    assert eth_client.eth.blockNumber == block_number
+
+
+def test_lost_payment_keeps_its_nonce_beside_another_worker(
+    client, auth_headers, eth_client, make_payment_rule, db, monkeypatch
+):
+    # Both rules pay from the same funded key, so both workers share a sender.
+    for _ in range(2):
+        rule = make_payment_rule()
+        client.post("/payments/rules/%d/trigger" % rule["id"], headers=auth_headers)
+    lost, other = crud.claim_payments(db, limit=2, claim_timeout=60)
+
+    def drop(raw_transaction):
+        raise ConnectionError("connection reset")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(eth_client.eth, "sendRawTransaction", drop)
+        worker.process_payment(db, eth_client, lost)
+    assert (lost.status, lost.nonce) == ("pending", 0)
+
+    # The second worker signs with nonce 1; before it broadcasts, the first
+    # worker resends the lost payment.
+    other_db = SessionLocal()
+    record = crud.record_payment_transaction
+
+    def record_then_resend(session, payment_rcd, tx_hash, nonce=None):
+        record(session, payment_rcd, tx_hash, nonce)
+        if session is other_db:
+            worker.process_payment(db, eth_client, lost)
+
+    monkeypatch.setattr(crud, "record_payment_transaction", record_then_resend)
+    try:
+        worker.process_payment(
+            other_db, eth_client, other_db.query(model.Payment).get(other.id)
+        )
+    finally:
+        other_db.close()
+
+    history = client.get("/payments/history", headers=auth_headers).json()
+    assert [entry["status"] for entry in history] == ["sent"] * 2
+    nonces = sorted(
+        eth_client.eth.getTransaction(entry["transaction_hash"])["nonce"]
+        for entry in history
+    )
+    assert nonces == [0, 1]
+    assert crud.allocate_nonce(db, FUNDED_ADDRESS, lambda: 0) == 2